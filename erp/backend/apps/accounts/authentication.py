@@ -0,0 +1,38 @@
+from __future__ import annotations
+
+import copy
+
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+
+from .services import token_cache, token_is_expired
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """Token authentication that serves repeat lookups from `token_cache`."""
+
+    def authenticate_credentials(self, key):
+        entry = token_cache.get(key)
+        if entry is None:
+            model = self.get_model()
+            try:
+                token = model.objects.select_related("user").get(key=key)
+            except model.DoesNotExist:
+                raise exceptions.AuthenticationFailed("Invalid token.")
+            if not token.user.is_active:
+                raise exceptions.AuthenticationFailed("User inactive or deleted.")
+            if token_is_expired(token.created):
+                token.delete()
+                raise exceptions.AuthenticationFailed("Token has expired.")
+            role_codes = token.user.erp_roles.values_list("code", flat=True)
+            entry = token_cache.set(key, token.user, role_codes, token.created)
+        elif token_is_expired(entry.token_created):
+            token_cache.invalidate(key)
+            self.get_model().objects.filter(key=key).delete()
+            raise exceptions.AuthenticationFailed("Token has expired.")
+
+        # Requests get their own copy so per-request mutations never leak into the cache.
+        user = copy.copy(entry.user)
+        user._erp_role_codes = entry.role_codes
+        token = self.get_model()(key=key, user=user, created=entry.token_created)
+        return (user, token)
@@ -0,0 +1,18 @@
+from __future__ import annotations
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+
+class Command(BaseCommand):
+    help = "Delete API tokens older than AUTH_TOKEN_TTL."
+
+    def handle(self, *args, **options):
+        if not settings.AUTH_TOKEN_TTL:
+            self.stdout.write("Token expiry is disabled; nothing to purge.")
+            return
+        cutoff = timezone.now() - settings.AUTH_TOKEN_TTL
+        deleted, _ = Token.objects.filter(created__lte=cutoff).delete()
+        self.stdout.write(self.style.SUCCESS(f"Purged {deleted} expired tokens."))
@@ -12,6 +12,7 @@ from apps.accounts.models import Role
 from apps.approvals.models import Approval, CloseChecklistItem
 from apps.budgets.models import Budget
 from apps.ledger.models import Account, JournalEntry, JournalLine
+from apps.ledger.signals import entries_posted
 
 User = get_user_model()
 
@@ -29,6 +30,8 @@ class Command(BaseCommand):
             self._seed_approvals(users["admin"], accounts)
             self._seed_checklist(users["accountant"])
             self._seed_invoices(users["accountant"])
+            self._seed_posting_rules(accounts)
+            self._seed_dunning_levels()
         self.stdout.write(self.style.SUCCESS("Demo data seeded."))
 
     def _ensure_roles(self) -> dict[str, Role]:
@@ -70,6 +73,7 @@ class Command(BaseCommand):
             {"code": "2000", "name": "Accounts Payable", "type": Account.Type.LIABILITY},
             {"code": "3000", "name": "Retained Earnings", "type": Account.Type.EQUITY},
             {"code": "4000", "name": "Product Revenue", "type": Account.Type.REVENUE},
+            {"code": "4900", "name": "Foreign Exchange Gain/Loss", "type": Account.Type.REVENUE},
             {"code": "5000", "name": "Cost of Goods Sold", "type": Account.Type.EXPENSE},
             {"code": "6000", "name": "Operating Expenses", "type": Account.Type.EXPENSE},
             {"code": "6100", "name": "Sales & Marketing", "type": Account.Type.EXPENSE, "parent": "6000"},
@@ -172,6 +176,32 @@ class Command(BaseCommand):
                     reference=payment.get("reference", ""),
                 )
 
+    def _seed_posting_rules(self, accounts: dict[str, Account]) -> None:
+        from apps.invoicing.models import PostingRule
+
+        rules = [
+            (PostingRule.DocumentType.INVOICE, accounts["1100"], accounts["4000"]),
+            (PostingRule.DocumentType.PAYMENT, accounts["1000"], accounts["1100"]),
+        ]
+        for document_type, debit, credit in rules:
+            PostingRule.objects.get_or_create(
+                document_type=document_type,
+                payment_method="",
+                defaults={"debit_account": debit, "credit_account": credit},
+            )
+
+    def _seed_dunning_levels(self) -> None:
+        from apps.invoicing.models import DunningLevel
+
+        levels = [
+            ("Friendly reminder", 1, DunningLevel.Action.REMINDER),
+            ("Follow-up call", 15, DunningLevel.Action.CALL),
+            ("Final notice", 30, DunningLevel.Action.FINAL_NOTICE),
+            ("Collections", 60, DunningLevel.Action.COLLECTIONS),
+        ]
+        for name, days, action in levels:
+            DunningLevel.objects.get_or_create(days_overdue=days, defaults={"name": name, "action": action})
+
     def _seed_journal_entries(self, accountant: User, approver: User, accounts: dict[str, Account]) -> None:
         current_year = timezone.now().date().year
         months = [date(current_year, month, 1) for month in range(1, 13)]
@@ -181,6 +211,7 @@ class Command(BaseCommand):
         marketing = Decimal("8000")
         rent = Decimal("5000")
 
+        created_ids = []
         for idx, first_day in enumerate(months, start=1):
             memo = f"Monthly close {first_day.strftime('%B %Y')}"
             entry, created = JournalEntry.objects.get_or_create(
@@ -222,6 +253,9 @@ class Command(BaseCommand):
                     for account, debit, credit in lines
                 ]
             )
+            created_ids.append(entry.pk)
+        if created_ids:
+            entries_posted.send(sender=JournalEntry, entry_ids=created_ids)
 
     def _seed_budgets(self, accountant: User, accounts: dict[str, Account]) -> None:
         year = timezone.now().date().year
@@ -37,10 +37,18 @@ class Role(models.Model):
         ]
 
 
+def user_role_codes(user) -> frozenset[str]:
+    # Populated by CachedTokenAuthentication; fall back to a query otherwise.
+    codes = getattr(user, "_erp_role_codes", None)
+    if codes is None:
+        codes = frozenset(user.erp_roles.values_list("code", flat=True))
+    return codes
+
+
 def user_has_role(user, *codes: str) -> bool:
     if not user or not user.is_authenticated:
         return False
     if user.is_superuser:
         return True
-    user_codes = set(user.erp_roles.values_list("code", flat=True))
+    user_codes = user_role_codes(user)
     return any(code in user_codes for code in codes)
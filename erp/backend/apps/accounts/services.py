@@ -0,0 +1,154 @@
+from __future__ import annotations
+
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils import timezone
+
+
+@dataclass(frozen=True)
+class CachedToken:
+    user: Any
+    role_codes: frozenset[str]
+    token_created: datetime
+    cached_until: float
+
+
+def token_expires_at(created: datetime) -> datetime | None:
+    ttl = getattr(settings, "AUTH_TOKEN_TTL", None)
+    if not ttl:
+        return None
+    return created + ttl
+
+
+def token_is_expired(created: datetime) -> bool:
+    expires_at = token_expires_at(created)
+    return expires_at is not None and expires_at <= timezone.now()
+
+
+class TokenCache:
+    """Bounded LRU/TTL map of token key to user and role codes.
+
+    The in-process map is always consulted first. When a shared cache alias is
+    configured, misses fall through to it so worker processes on the same host
+    can reuse each other's lookups.
+    """
+
+    key_prefix = "auth-token:"
+
+    def __init__(self, max_entries: int, timeout: int, shared_alias: str | None = None) -> None:
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self.shared_alias = shared_alias or None
+        self._entries: OrderedDict[str, CachedToken] = OrderedDict()
+        self._keys_by_user: dict[Any, set[str]] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def shared(self):
+        if not self.shared_alias:
+            return None
+        return caches[self.shared_alias]
+
+    def get(self, key: str) -> CachedToken | None:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry.cached_until > now:
+                    self._entries.move_to_end(key)
+                    return entry
+                self._discard(key)
+        shared = self.shared
+        if shared is None:
+            return None
+        payload = shared.get(self.key_prefix + key)
+        if payload is None:
+            return None
+        user, role_codes, token_created = payload
+        return self._store_local(key, user, role_codes, token_created)
+
+    def set(self, key: str, user, role_codes, token_created: datetime) -> CachedToken:
+        role_codes = frozenset(role_codes)
+        shared = self.shared
+        if shared is not None:
+            timeout = self.timeout
+            expires_at = token_expires_at(token_created)
+            if expires_at is not None:
+                remaining = int((expires_at - timezone.now()).total_seconds())
+                timeout = max(1, min(timeout, remaining))
+            shared.set(self.key_prefix + key, (user, role_codes, token_created), timeout)
+        return self._store_local(key, user, role_codes, token_created)
+
+    def invalidate(self, key: str) -> None:
+        with self._lock:
+            self._discard(key)
+        shared = self.shared
+        if shared is not None:
+            shared.delete(self.key_prefix + key)
+
+    def invalidate_user(self, user_id, keys=()) -> None:
+        with self._lock:
+            stale = set(self._keys_by_user.get(user_id, ()))
+            for key in stale:
+                self._discard(key)
+        shared = self.shared
+        if shared is not None:
+            stale.update(keys)
+            if stale:
+                shared.delete_many([self.key_prefix + key for key in stale])
+
+    def clear(self) -> None:
+        with self._lock:
+            keys = list(self._entries)
+            self._entries.clear()
+            self._keys_by_user.clear()
+        shared = self.shared
+        if shared is not None and keys:
+            shared.delete_many([self.key_prefix + key for key in keys])
+
+    def _store_local(self, key: str, user, role_codes, token_created: datetime) -> CachedToken:
+        entry = CachedToken(
+            user=user,
+            role_codes=frozenset(role_codes),
+            token_created=token_created,
+            cached_until=time.monotonic() + self.timeout,
+        )
+        with self._lock:
+            self._discard(key)
+            self._entries[key] = entry
+            self._keys_by_user.setdefault(user.pk, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                oldest = next(iter(self._entries))
+                self._discard(oldest)
+        return entry
+
+    def _discard(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        keys = self._keys_by_user.get(entry.user.pk)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_user[entry.user.pk]
+
+
+token_cache = TokenCache(
+    max_entries=getattr(settings, "AUTH_TOKEN_CACHE_SIZE", 10_000),
+    timeout=getattr(settings, "AUTH_TOKEN_CACHE_TIMEOUT", 60),
+    shared_alias=getattr(settings, "AUTH_TOKEN_SHARED_CACHE", None),
+)
+
+
+def invalidate_user_tokens(user_id) -> None:
+    from rest_framework.authtoken.models import Token
+
+    keys = list(Token.objects.filter(user_id=user_id).values_list("key", flat=True)) if token_cache.shared else []
+    token_cache.invalidate_user(user_id, keys)
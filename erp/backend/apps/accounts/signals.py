@@ -0,0 +1,42 @@
+from __future__ import annotations
+
+from django.contrib.auth import get_user_model
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from .models import Role
+from .services import invalidate_user_tokens, token_cache
+
+User = get_user_model()
+
+
+@receiver(post_delete, sender=Token)
+def drop_deleted_token(sender, instance, **kwargs):
+    token_cache.invalidate(instance.key)
+
+
+@receiver(post_save, sender=User)
+def drop_tokens_for_changed_user(sender, instance, created, **kwargs):
+    if not created:
+        invalidate_user_tokens(instance.pk)
+
+
+@receiver(m2m_changed, sender=Role.users.through)
+def drop_tokens_for_role_change(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    if isinstance(instance, Role):
+        if pk_set is None:
+            token_cache.clear()
+            return
+        for user_id in pk_set:
+            invalidate_user_tokens(user_id)
+    else:
+        invalidate_user_tokens(instance.pk)
+
+
+@receiver(post_save, sender=Role)
+@receiver(post_delete, sender=Role)
+def drop_tokens_for_role_edit(sender, instance, **kwargs):
+    token_cache.clear()
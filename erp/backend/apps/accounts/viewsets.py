@@ -10,9 +10,10 @@ from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
 
 from .filters import UserFilterSet
-from .models import Role, user_has_role
+from .models import Role, user_role_codes
 from .permissions import IsAdminOrReadOnly
 from .serializers import RoleSerializer, UserSerializer, UserUpdateSerializer
+from .services import token_cache, token_is_expired
 
 User = get_user_model()
 
@@ -44,7 +45,10 @@ class AuthViewSet(viewsets.ViewSet):
     permission_classes = [AllowAny]
 
     def create_token_response(self, user: User) -> Response:
-        token, _ = Token.objects.get_or_create(user=user)
+        token, created = Token.objects.get_or_create(user=user)
+        if not created and token_is_expired(token.created):
+            token.delete()
+            token = Token.objects.create(user=user)
         serializer = UserSerializer(user, context={"request": self.request})
         return Response({"token": token.key, "user": serializer.data})
 
@@ -66,11 +70,12 @@ class AuthViewSet(viewsets.ViewSet):
     @action(detail=False, methods=["post"], permission_classes=[IsAuthenticated])
     def logout(self, request):
         Token.objects.filter(user=request.user).delete()
+        token_cache.invalidate_user(request.user.pk)
         django_logout(request)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
     @action(detail=False, methods=["get"], permission_classes=[IsAuthenticated])
     def current_user(self, request):
         serializer = UserSerializer(request.user, context={"request": request})
-        role_codes = list(request.user.erp_roles.values_list("code", flat=True))
+        role_codes = sorted(user_role_codes(request.user))
         return Response({"user": serializer.data, "roles": role_codes, "timestamp": timezone.now()})
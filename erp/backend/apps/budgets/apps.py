@@ -5,3 +5,5 @@ class BudgetsConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "apps.budgets"
 
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,25 @@
+from __future__ import annotations
+
+from datetime import date
+
+from django.core.management.base import BaseCommand
+
+from apps.budgets.services import rebuild_consumption
+
+
+class Command(BaseCommand):
+    help = "Recompute the per-account monthly budget consumption counters from posted journal lines."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--start", type=date.fromisoformat, help="First month to rebuild (YYYY-MM-DD).")
+        parser.add_argument("--end", type=date.fromisoformat, help="Last day to rebuild (YYYY-MM-DD).")
+        parser.add_argument("--dry-run", action="store_true", help="Report drifted counters without fixing them.")
+
+    def handle(self, *args, **options):
+        result = rebuild_consumption(options["start"], options["end"], dry_run=options["dry_run"])
+        for account_id, month, counter, actual in result.corrected:
+            self.stdout.write(f"Account {account_id} {month:%Y-%m}: counter {counter}, ledger {actual}")
+        verb = "Found" if options["dry_run"] else "Corrected"
+        self.stdout.write(
+            self.style.SUCCESS(f"{verb} {len(result.corrected)} drifted counters of {result.counters} account-months.")
+        )
@@ -0,0 +1,52 @@
+# Generated by Django 5.2.18 on 2026-10-19 18:49
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import Sum
+from django.db.models.functions import TruncMonth
+
+
+def backfill_consumption(apps, schema_editor):
+    JournalLine = apps.get_model("ledger", "JournalLine")
+    BudgetConsumption = apps.get_model("budgets", "BudgetConsumption")
+    rows = (
+        JournalLine.objects.filter(entry__status="posted", entry__is_closing=False, account__type="expense")
+        .annotate(month=TruncMonth("entry__date"))
+        .values("account_id", "month")
+        .annotate(debit=Sum("debit"), credit=Sum("credit"))
+        .order_by()
+    )
+    BudgetConsumption.objects.bulk_create(
+        [
+            BudgetConsumption(account_id=row["account_id"], period_start=row["month"], amount=row["debit"] - row["credit"])
+            for row in rows
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('budgets', '0001_initial'),
+        ('ledger', '0008_multi_currency'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BudgetConsumption',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period_start', models.DateField()),
+                ('amount', models.DecimalField(decimal_places=2, default=Decimal('0'), max_digits=16)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('account', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='budget_consumption', to='ledger.account')),
+            ],
+            options={
+                'ordering': ['-period_start', 'account__code'],
+                'constraints': [models.UniqueConstraint(fields=('account', 'period_start'), name='budget_consumption_account_month')],
+            },
+        ),
+        migrations.RunPython(backfill_consumption, migrations.RunPython.noop),
+    ]
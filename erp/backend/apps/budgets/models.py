@@ -33,3 +33,21 @@ class Budget(models.Model):
 
     def __str__(self) -> str:
         return f"Budget {self.account.code} {self.period_start} - {self.period_end}"
+
+
+class BudgetConsumption(models.Model):
+    """Net posted debits of an expense account in one month, kept current as entries post."""
+
+    account = models.ForeignKey(Account, related_name="budget_consumption", on_delete=models.CASCADE)
+    period_start = models.DateField()
+    amount = models.DecimalField(max_digits=16, decimal_places=2, default=Decimal("0"))
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ["-period_start", "account__code"]
+        constraints = [
+            models.UniqueConstraint(fields=["account", "period_start"], name="budget_consumption_account_month"),
+        ]
+
+    def __str__(self) -> str:
+        return f"Consumption {self.account.code} {self.period_start:%Y-%m}"
@@ -1,13 +1,20 @@
 from __future__ import annotations
 
+from decimal import Decimal
+
 from rest_framework import serializers
 
+from apps.ledger.serializers import AccountField
+from apps.ledger.services import get_account
+
 from .models import Budget
+from .services import SpreadMethod
 
 
 class BudgetSerializer(serializers.ModelSerializer):
-    account_code = serializers.CharField(source="account.code", read_only=True)
-    account_name = serializers.CharField(source="account.name", read_only=True)
+    account = AccountField()
+    account_code = serializers.SerializerMethodField()
+    account_name = serializers.SerializerMethodField()
 
     class Meta:
         model = Budget
@@ -26,3 +33,56 @@ class BudgetSerializer(serializers.ModelSerializer):
             "updated_at",
         ]
         read_only_fields = ["id", "created_by", "created_at", "updated_at", "account_code", "account_name"]
+
+    def get_account_code(self, obj) -> str | None:
+        account = get_account(obj.account_id)
+        return account.code if account else None
+
+    def get_account_name(self, obj) -> str | None:
+        account = get_account(obj.account_id)
+        return account.name if account else None
+
+
+class BudgetPlanLineSerializer(serializers.Serializer):
+    account = AccountField()
+    annual = serializers.DecimalField(max_digits=14, decimal_places=2, required=False)
+    quarters = serializers.ListField(
+        child=serializers.DecimalField(max_digits=14, decimal_places=2), min_length=4, max_length=4, required=False
+    )
+
+    def validate(self, attrs):
+        if ("annual" in attrs) == ("quarters" in attrs):
+            raise serializers.ValidationError("Give either an annual amount or four quarterly amounts.")
+        return attrs
+
+
+class BulkBudgetSerializer(serializers.Serializer):
+    start = serializers.DateField(help_text="First month of the plan.")
+    method = serializers.ChoiceField(choices=SpreadMethod.choices, default=SpreadMethod.EVEN)
+    profile = serializers.ListField(
+        child=serializers.DecimalField(max_digits=10, decimal_places=4, min_value=Decimal("0")),
+        min_length=12,
+        max_length=12,
+        required=False,
+    )
+    description = serializers.CharField(required=False, allow_blank=True, default="")
+    dry_run = serializers.BooleanField(default=False)
+    lines = BudgetPlanLineSerializer(many=True, allow_empty=False)
+
+    def validate_start(self, value):
+        if value.day != 1:
+            raise serializers.ValidationError("The plan must start on the first day of a month.")
+        return value
+
+    def validate(self, attrs):
+        if attrs["method"] == SpreadMethod.SEASONAL and not attrs.get("profile"):
+            raise serializers.ValidationError({"profile": "A seasonal spread needs 12 monthly weights."})
+        accounts = [line["account"].pk for line in attrs["lines"]]
+        if len(accounts) != len(set(accounts)):
+            raise serializers.ValidationError({"lines": "Each account may appear only once."})
+        return attrs
+
+
+class BudgetAvailabilityQuerySerializer(serializers.Serializer):
+    account = AccountField()
+    date = serializers.DateField()
@@ -0,0 +1,467 @@
+from __future__ import annotations
+
+from collections import defaultdict
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from decimal import ROUND_DOWN, Decimal
+from typing import Hashable, Iterable
+
+from django.conf import settings
+from django.db import models, transaction
+from django.db.models import F, Sum
+from django.db.models.functions import TruncMonth
+
+from apps.core.models import ChangeEvent
+from apps.core.services import lock_rows, record_changes
+from apps.ledger.models import Account, JournalEntry, JournalLine
+from apps.ledger.services import add_months, chart_of_accounts, month_start
+
+from .models import Budget, BudgetConsumption
+
+CENT = Decimal("0.01")
+MONTHS = 12
+DEBIT_NORMAL = (Account.Type.ASSET, Account.Type.EXPENSE)
+
+
+class BudgetSpreadError(Exception):
+    pass
+
+
+class BudgetControl(models.TextChoices):
+    OFF = "off", "Off"
+    WARN = "warn", "Warn"
+    BLOCK = "block", "Block"
+
+
+class SpreadMethod(models.TextChoices):
+    EVEN = "even", "Even"
+    SEASONAL = "seasonal", "Seasonality profile"
+    PRIOR_YEAR = "prior_year", "Prior-year actuals"
+
+
+@dataclass
+class PlanLine:
+    """An account's plan for the year: one annual amount or four quarterly amounts."""
+
+    account_id: int
+    annual: Decimal | None = None
+    quarters: list[Decimal] | None = None
+
+    def blocks(self) -> list[tuple[int, Decimal]]:
+        """(first month index, amount) per block of months the amount spreads over."""
+        if self.quarters is not None:
+            return [(quarter * 3, amount) for quarter, amount in enumerate(self.quarters)]
+        return [(0, self.annual)]
+
+
+def spread_amount(total: Decimal, weights: list[Decimal]) -> list[Decimal]:
+    """Split `total` in proportion to `weights`, to the cent, with the rounding remainder on the last month.
+
+    Zero total weight spreads evenly.
+    """
+    weight_total = sum(weights)
+    if weight_total <= 0:
+        weights = [Decimal("1")] * len(weights)
+        weight_total = Decimal(len(weights))
+    shares = [(total * weight / weight_total).quantize(CENT, rounding=ROUND_DOWN) for weight in weights[:-1]]
+    return [*shares, total - sum(shares)]
+
+
+def prior_year_weights(account_ids: Iterable[int], start: date) -> dict[int, list[Decimal]]:
+    """Monthly posted activity of each account in the twelve months before `start`, in its normal direction.
+
+    Months that went against the account's normal direction weigh zero.
+    """
+    chart = chart_of_accounts()
+    prior_start = add_months(start, -MONTHS)
+    months = {add_months(prior_start, index): index for index in range(MONTHS)}
+    weights: defaultdict[int, list[Decimal]] = defaultdict(lambda: [Decimal("0")] * MONTHS)
+    rows = (
+        JournalLine.objects.filter(
+            account_id__in=list(account_ids),
+            entry__status=JournalEntry.Status.POSTED,
+            entry__date__gte=prior_start,
+            entry__date__lt=start,
+        )
+        .annotate(month=TruncMonth("entry__date"))
+        .values("account_id", "month")
+        .annotate(debit=Sum("debit"), credit=Sum("credit"))
+        .order_by()
+    )
+    for row in rows:
+        index = months.get(row["month"])
+        if index is None:
+            continue
+        record = chart.get(row["account_id"])
+        net = row["debit"] - row["credit"]
+        if record is not None and record.type not in DEBIT_NORMAL:
+            net = -net
+        weights[row["account_id"]][index] = max(net, Decimal("0"))
+    return weights
+
+
+def spread_plan(
+    start: date,
+    lines: list[PlanLine],
+    method: str = SpreadMethod.EVEN,
+    profile: list[Decimal] | None = None,
+    description: str = "",
+    user=None,
+) -> list[Budget]:
+    """Unsaved monthly budgets for the twelve months from `start`, one per account and month."""
+    if start.day != 1:
+        raise BudgetSpreadError("The plan must start on the first day of a month.")
+    if method == SpreadMethod.SEASONAL:
+        if profile is None or len(profile) != MONTHS or any(weight < 0 for weight in profile) or sum(profile) <= 0:
+            raise BudgetSpreadError("A seasonal spread needs 12 non-negative monthly weights.")
+        weights_for = lambda account_id: profile
+    elif method == SpreadMethod.PRIOR_YEAR:
+        actuals = prior_year_weights([line.account_id for line in lines], start)
+        weights_for = lambda account_id: actuals.get(account_id, [Decimal("0")] * MONTHS)
+    elif method == SpreadMethod.EVEN:
+        weights_for = lambda account_id: [Decimal("1")] * MONTHS
+    else:
+        raise BudgetSpreadError(f"Unknown spread method {method}.")
+
+    periods = [(add_months(start, index), add_months(start, index + 1) - timedelta(days=1)) for index in range(MONTHS + 1)]
+    budgets = []
+    for line in lines:
+        weights = weights_for(line.account_id)
+        for first, amount in line.blocks():
+            last = MONTHS if line.quarters is None else first + 3
+            for index, share in zip(range(first, last), spread_amount(amount, weights[first:last])):
+                period_start, period_end = periods[index]
+                budgets.append(
+                    Budget(
+                        account_id=line.account_id,
+                        period_start=period_start,
+                        period_end=period_end,
+                        cadence=Budget.Cadence.MONTHLY,
+                        amount=share,
+                        description=description,
+                        created_by=user,
+                    )
+                )
+    return budgets
+
+
+def upsert_budgets(budgets: list[Budget]) -> tuple[int, int]:
+    """Insert or update `budgets` keyed on (account, period_start, period_end, cadence) in one transaction.
+
+    Returns `(created, updated)`. Existing rows keep their creator.
+    """
+    key_fields = ["account", "period_start", "period_end", "cadence"]
+    if not budgets:
+        return 0, 0
+    with transaction.atomic():
+        existing = {
+            (account_id, period_start, period_end, cadence): (created_by_id, created_at)
+            for account_id, period_start, period_end, cadence, created_by_id, created_at in Budget.objects.filter(
+                account_id__in={budget.account_id for budget in budgets},
+                cadence__in={budget.cadence for budget in budgets},
+                period_start__gte=min(budget.period_start for budget in budgets),
+                period_start__lte=max(budget.period_start for budget in budgets),
+            ).values_list("account_id", "period_start", "period_end", "cadence", "created_by_id", "created_at")
+        }
+        saved = Budget.objects.bulk_create(
+            budgets,
+            batch_size=1000,
+            update_conflicts=True,
+            unique_fields=key_fields,
+            update_fields=["amount", "description", "updated_at"],
+        )
+        created, updated = [], []
+        for budget in saved:
+            key = (budget.account_id, budget.period_start, budget.period_end, budget.cadence)
+            if key in existing:
+                budget.created_by_id, budget.created_at = existing[key]
+                updated.append(budget)
+            else:
+                created.append(budget)
+        record_changes(ChangeEvent.Action.CREATED, created)
+        record_changes(ChangeEvent.Action.UPDATED, updated)
+    return len(created), len(updated)
+
+
+def _expense_account_ids() -> list[int]:
+    return [record.id for record in chart_of_accounts().of_type(Account.Type.EXPENSE)]
+
+
+def expense_amounts(lines: Iterable[JournalLine]) -> dict[int, Decimal]:
+    """Net debit per expense account across in-memory `lines`."""
+    chart = chart_of_accounts()
+    amounts: defaultdict[int, Decimal] = defaultdict(Decimal)
+    for line in lines:
+        record = chart.get(line.account_id)
+        if record is not None and record.type == Account.Type.EXPENSE:
+            amounts[line.account_id] += line.debit - line.credit
+    return dict(amounts)
+
+
+def consumption_deltas(entry_ids: Iterable[int]) -> dict[tuple[int, date], Decimal]:
+    """Net expense debits of the posted, non-closing `entry_ids` per (account, month)."""
+    deltas: defaultdict[tuple[int, date], Decimal] = defaultdict(Decimal)
+    rows = (
+        JournalLine.objects.filter(
+            entry_id__in=list(entry_ids),
+            entry__status=JournalEntry.Status.POSTED,
+            entry__is_closing=False,
+            account_id__in=_expense_account_ids(),
+        )
+        .values("account_id", "entry__date")
+        .annotate(debit=Sum("debit"), credit=Sum("credit"))
+        .order_by()
+    )
+    for row in rows:
+        deltas[row["account_id"], month_start(row["entry__date"])] += row["debit"] - row["credit"]
+    return {key: amount for key, amount in deltas.items() if amount}
+
+
+def apply_consumption(deltas: dict[tuple[int, date], Decimal]) -> None:
+    """Add `deltas` to the (account, month) counters, creating missing ones.
+
+    The increments take row locks in key order, so concurrent postings to one account
+    and month serialise instead of losing updates. Call inside the posting transaction.
+    """
+    if not deltas:
+        return
+    with transaction.atomic():
+        BudgetConsumption.objects.bulk_create(
+            [BudgetConsumption(account_id=account_id, period_start=month) for account_id, month in deltas],
+            ignore_conflicts=True,
+        )
+        for (account_id, month), amount in sorted(deltas.items()):
+            BudgetConsumption.objects.filter(account_id=account_id, period_start=month).update(
+                amount=F("amount") + amount
+            )
+
+
+def record_consumption(entry_ids: Iterable[int]) -> None:
+    apply_consumption(consumption_deltas(entry_ids))
+
+
+def release_consumption(entry_ids: Iterable[int]) -> None:
+    apply_consumption({key: -amount for key, amount in consumption_deltas(entry_ids).items()})
+
+
+@dataclass
+class BudgetAvailability:
+    account_id: int
+    period_start: date
+    period_end: date
+    budget: Decimal
+    consumed: Decimal
+
+    @property
+    def available(self) -> Decimal:
+        return self.budget - self.consumed
+
+    def as_dict(self) -> dict:
+        record = chart_of_accounts().get(self.account_id)
+        return {
+            "account": self.account_id,
+            "account_code": record.code if record else None,
+            "period_start": self.period_start,
+            "period_end": self.period_end,
+            "budget": str(self.budget),
+            "consumed": str(self.consumed),
+            "available": str(self.available),
+        }
+
+
+def budget_availability(account_id: int, on: date) -> list[BudgetAvailability]:
+    """The budgets of `account_id` covering `on`, each with what posted entries have consumed of it.
+
+    Reads the budget rows and at most a few monthly counters; the ledger is not aggregated.
+    """
+    budgets = list(
+        Budget.objects.filter(account_id=account_id, period_start__lte=on, period_end__gte=on)
+        .order_by("period_start", "period_end")
+        .values_list("period_start", "period_end", "amount")
+    )
+    if not budgets:
+        return []
+    counters = list(
+        BudgetConsumption.objects.filter(
+            account_id=account_id,
+            period_start__gte=month_start(min(start for start, _, _ in budgets)),
+            period_start__lte=max(end for _, end, _ in budgets),
+        ).values_list("period_start", "amount")
+    )
+    return [
+        BudgetAvailability(
+            account_id=account_id,
+            period_start=start,
+            period_end=end,
+            budget=amount,
+            consumed=sum((value for month, value in counters if month_start(start) <= month <= end), Decimal("0")),
+        )
+        for start, end, amount in budgets
+    ]
+
+
+@dataclass
+class Posting:
+    """Net expense debits per account that posting `key` on `date` would add to the counters.
+
+    `previous` holds what an edited entry already had on those accounts; spending that does not
+    rise above it is not checked.
+    """
+
+    key: Hashable
+    date: date
+    amounts: dict[int, Decimal]
+    previous: dict[int, Decimal] = field(default_factory=dict)
+
+    def raised(self) -> set[int]:
+        return {
+            account_id for account_id, amount in self.amounts.items() if amount > self.previous.get(account_id, Decimal("0"))
+        }
+
+
+def check_postings(postings: Iterable[Posting]) -> dict[Hashable, list[BudgetAvailability]]:
+    """The budgets each of `postings` would take past their amount, keyed by posting.
+
+    Postings are checked in order, each against the counters plus the postings before it, so call
+    this inside the posting transaction before the counters take the entries in. The covering budget
+    rows stay locked until commit, which makes concurrent postings against one budget wait for each
+    other. Under `BUDGET_CONTROL=block` the caller rejects flagged postings, so they do not count
+    towards later ones. Returns nothing when budget control is off.
+    """
+    control = settings.BUDGET_CONTROL
+    postings = [posting for posting in postings if posting.raised()]
+    if control == BudgetControl.OFF or not postings:
+        return {}
+    budgets = lock_rows(
+        Budget.objects.filter(
+            account_id__in=set().union(*(posting.raised() for posting in postings)),
+            period_start__lte=max(posting.date for posting in postings),
+            period_end__gte=min(posting.date for posting in postings),
+        ).order_by("pk"),
+        "budgets.budget",
+    )
+    if not budgets:
+        return {}
+    counters = BudgetConsumption.objects.filter(
+        account_id__in={budget.account_id for budget in budgets},
+        period_start__gte=month_start(min(budget.period_start for budget in budgets)),
+        period_start__lte=max(budget.period_end for budget in budgets),
+    ).values_list("account_id", "period_start", "amount")
+    consumed = {budget.pk: Decimal("0") for budget in budgets}
+    for account_id, month, amount in counters:
+        for budget in budgets:
+            if budget.account_id == account_id and month_start(budget.period_start) <= month <= budget.period_end:
+                consumed[budget.pk] += amount
+
+    overruns: dict[Hashable, list[BudgetAvailability]] = {}
+    for posting in postings:
+        covering = [
+            budget
+            for budget in budgets
+            if budget.account_id in posting.amounts and budget.period_start <= posting.date <= budget.period_end
+        ]
+        raised = posting.raised()
+        flagged = [
+            BudgetAvailability(
+                account_id=budget.account_id,
+                period_start=budget.period_start,
+                period_end=budget.period_end,
+                budget=budget.amount,
+                consumed=consumed[budget.pk] + posting.amounts[budget.account_id],
+            )
+            for budget in covering
+            if budget.account_id in raised and consumed[budget.pk] + posting.amounts[budget.account_id] > budget.amount
+        ]
+        if flagged:
+            overruns[posting.key] = flagged
+            if control == BudgetControl.BLOCK:
+                continue
+        for budget in covering:
+            consumed[budget.pk] += posting.amounts[budget.account_id]
+    return overruns
+
+
+def entry_expense_amounts(entry_ids: Iterable[int]) -> dict[int, dict[int, Decimal]]:
+    """Net debit per expense account of each of the non-closing `entry_ids`, whatever their status."""
+    amounts: defaultdict[int, dict[int, Decimal]] = defaultdict(dict)
+    rows = (
+        JournalLine.objects.filter(
+            entry_id__in=list(entry_ids), entry__is_closing=False, account_id__in=_expense_account_ids()
+        )
+        .values("entry_id", "account_id")
+        .annotate(debit=Sum("debit"), credit=Sum("credit"))
+        .order_by()
+    )
+    for row in rows:
+        amounts[row["entry_id"]][row["account_id"]] = row["debit"] - row["credit"]
+    return dict(amounts)
+
+
+def overrun_messages(overruns: Iterable[BudgetAvailability]) -> list[str]:
+    chart = chart_of_accounts()
+    messages = []
+    for overrun in overruns:
+        record = chart.get(overrun.account_id)
+        messages.append(
+            f"Account {record.code if record else overrun.account_id} would be over its "
+            f"{overrun.period_start:%Y-%m-%d} to {overrun.period_end:%Y-%m-%d} budget by {-overrun.available:.2f}."
+        )
+    return messages
+
+
+@dataclass
+class ConsumptionRebuild:
+    counters: int = 0
+    corrected: list[tuple[int, date, Decimal, Decimal]] = field(default_factory=list)
+
+
+def rebuild_consumption(start: date | None = None, end: date | None = None, dry_run: bool = False) -> ConsumptionRebuild:
+    """Recompute the monthly counters from posted journal lines and fix the ones that drifted.
+
+    `start` and `end` limit the rebuild to whole months. `corrected` lists
+    `(account, month, counter, ledger)` for every counter that disagreed with the ledger.
+    """
+    ledger_filter = models.Q(
+        entry__status=JournalEntry.Status.POSTED, entry__is_closing=False, account_id__in=_expense_account_ids()
+    )
+    counter_filter = models.Q()
+    if start is not None:
+        ledger_filter &= models.Q(entry__date__gte=month_start(start))
+        counter_filter &= models.Q(period_start__gte=month_start(start))
+    if end is not None:
+        ledger_filter &= models.Q(entry__date__lte=end)
+        counter_filter &= models.Q(period_start__lte=end)
+
+    result = ConsumptionRebuild()
+    with transaction.atomic():
+        # Lock the counters first so postings in flight finish before the ledger is read.
+        stored = {
+            (account_id, month): (pk, amount)
+            for pk, account_id, month, amount in BudgetConsumption.objects.filter(counter_filter)
+            .select_for_update()
+            .values_list("id", "account_id", "period_start", "amount")
+        }
+        ledger = {
+            (row["account_id"], row["month"]): (row["debit"] - row["credit"]).quantize(CENT)
+            for row in JournalLine.objects.filter(ledger_filter)
+            .annotate(month=TruncMonth("entry__date"))
+            .values("account_id", "month")
+            .annotate(debit=Sum("debit"), credit=Sum("credit"))
+            .order_by()
+        }
+        result.counters = len(ledger)
+        missing = []
+        for key in sorted(ledger.keys() | stored.keys()):
+            pk, counter = stored.get(key, (None, Decimal("0")))
+            actual = ledger.get(key, Decimal("0"))
+            if counter == actual:
+                continue
+            result.corrected.append((*key, counter, actual))
+            if dry_run:
+                continue
+            if pk is None:
+                missing.append(BudgetConsumption(account_id=key[0], period_start=key[1], amount=actual))
+            else:
+                BudgetConsumption.objects.filter(pk=pk).update(amount=actual)
+        BudgetConsumption.objects.bulk_create(missing, batch_size=1000)
+    return result
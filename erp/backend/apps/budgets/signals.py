@@ -0,0 +1,17 @@
+from __future__ import annotations
+
+from django.dispatch import receiver
+
+from apps.ledger.signals import entries_posted, entries_unposting
+
+from .services import record_consumption, release_consumption
+
+
+@receiver(entries_posted)
+def consume_budgets(sender, entry_ids, **kwargs):
+    record_consumption(entry_ids)
+
+
+@receiver(entries_unposting)
+def release_budgets(sender, entry_ids, **kwargs):
+    release_consumption(entry_ids)
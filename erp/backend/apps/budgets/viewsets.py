@@ -1,21 +1,70 @@
 from __future__ import annotations
 
-from rest_framework import viewsets
+from django.db import transaction
+from rest_framework import status, viewsets
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
 
 from apps.accounts.permissions import IsAdminOrAccountant
+from apps.core.models import ChangeEvent
+from apps.core.services import record_change
 
 from .filters import BudgetFilterSet
 from .models import Budget
-from .serializers import BudgetSerializer
+from .serializers import BudgetAvailabilityQuerySerializer, BudgetSerializer, BulkBudgetSerializer
+from .services import BudgetSpreadError, PlanLine, budget_availability, spread_plan, upsert_budgets
 
 
 class BudgetViewSet(viewsets.ModelViewSet):
     serializer_class = BudgetSerializer
-    queryset = Budget.objects.select_related("account", "created_by").all()
+    queryset = Budget.objects.select_related("created_by").all()
     permission_classes = [IsAuthenticated, IsAdminOrAccountant]
     filterset_class = BudgetFilterSet
     ordering_fields = ["period_start", "account__code", "amount"]
 
     def perform_create(self, serializer):
-        serializer.save(created_by=self.request.user)
+        with transaction.atomic():
+            budget = serializer.save(created_by=self.request.user)
+            record_change(ChangeEvent.Action.CREATED, budget)
+
+    def perform_update(self, serializer):
+        with transaction.atomic():
+            budget = serializer.save()
+            record_change(ChangeEvent.Action.UPDATED, budget)
+
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            record_change(ChangeEvent.Action.DELETED, instance)
+            instance.delete()
+
+    @action(detail=False, methods=["post"])
+    def bulk(self, request):
+        """Spread annual or quarterly amounts per account into monthly budgets and upsert them together."""
+        serializer = BulkBudgetSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        lines = [
+            PlanLine(line["account"].pk, annual=line.get("annual"), quarters=line.get("quarters"))
+            for line in data["lines"]
+        ]
+        try:
+            budgets = spread_plan(data["start"], lines, data["method"], data.get("profile"), data["description"], request.user)
+        except BudgetSpreadError as exc:
+            raise ValidationError(str(exc))
+        if data["dry_run"]:
+            return Response(BudgetSerializer(budgets, many=True).data)
+        created, updated = upsert_budgets(budgets)
+        return Response(
+            {"created": created, "updated": updated},
+            status=status.HTTP_201_CREATED if created else status.HTTP_200_OK,
+        )
+
+    @action(detail=False, methods=["get"])
+    def availability(self, request):
+        """Budget, posted consumption and what remains for an account's budgets covering a date."""
+        serializer = BudgetAvailabilityQuerySerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        return Response([item.as_dict() for item in budget_availability(data["account"].pk, data["date"])])
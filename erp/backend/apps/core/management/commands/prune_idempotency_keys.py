@@ -0,0 +1,13 @@
+from __future__ import annotations
+
+from django.core.management.base import BaseCommand
+
+from apps.core.services import prune_idempotency_keys
+
+
+class Command(BaseCommand):
+    help = "Delete idempotency keys whose replay window has expired."
+
+    def handle(self, *args, **options):
+        deleted = prune_idempotency_keys()
+        self.stdout.write(self.style.SUCCESS(f"Pruned {deleted} idempotency keys."))
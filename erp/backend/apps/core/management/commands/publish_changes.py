@@ -0,0 +1,13 @@
+from __future__ import annotations
+
+from django.core.management.base import BaseCommand
+
+from apps.core.services import publish_pending_changes
+
+
+class Command(BaseCommand):
+    help = "Give change events that were not published after their commit their feed sequences."
+
+    def handle(self, *args, **options):
+        published = publish_pending_changes()
+        self.stdout.write(self.style.SUCCESS(f"Published {published} change events."))
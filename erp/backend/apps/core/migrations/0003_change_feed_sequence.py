@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-19 19:02
+
+from django.db import migrations, models
+from django.db.models import F, Max
+
+
+def publish_existing(apps, schema_editor):
+    # Existing consumers hold event ids as cursors, so published history keeps them as sequences.
+    ChangeEvent = apps.get_model("core", "ChangeEvent")
+    ChangeFeedHead = apps.get_model("core", "ChangeFeedHead")
+    ChangeEvent.objects.update(sequence=F("id"))
+    ChangeFeedHead.objects.create(pk=1, sequence=ChangeEvent.objects.aggregate(last=Max("id"))["last"] or 0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_changeevent'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeFeedHead',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sequence', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RemoveIndex(
+            model_name='changeevent',
+            name='core_change_entity_f6fe0e_idx',
+        ),
+        migrations.AddField(
+            model_name='changeevent',
+            name='sequence',
+            field=models.BigIntegerField(blank=True, null=True, unique=True),
+        ),
+        migrations.RunPython(publish_existing, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='changeevent',
+            index=models.Index(fields=['entity', 'sequence'], name='core_change_entity_470ebe_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='changeevent',
+            index=models.Index(condition=models.Q(('sequence__isnull', True)), fields=['id'], name='change_event_unpublished'),
+        ),
+    ]
@@ -0,0 +1,59 @@
+from __future__ import annotations
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models
+
+
+class IdempotencyKey(models.Model):
+    key = models.CharField(max_length=255)
+    scope = models.CharField(max_length=64)
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        related_name="idempotency_keys",
+        on_delete=models.CASCADE,
+    )
+    request_hash = models.CharField(max_length=64)
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    response_body = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["user", "scope", "key"], name="unique_idempotency_key"),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.scope}:{self.key}"
+
+
+class ChangeEvent(models.Model):
+    class Action(models.TextChoices):
+        CREATED = "created", "Created"
+        UPDATED = "updated", "Updated"
+        DELETED = "deleted", "Deleted"
+
+    entity = models.CharField(max_length=64)
+    object_id = models.BigIntegerField()
+    action = models.CharField(max_length=16, choices=Action.choices)
+    payload = models.JSONField(default=dict, encoder=DjangoJSONEncoder)
+    # Feed position, assigned in commit order by `publish_changes` once the writing transaction committed.
+    sequence = models.BigIntegerField(null=True, blank=True, unique=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["id"]
+        indexes = [
+            models.Index(fields=["entity", "sequence"]),
+            models.Index(fields=["id"], condition=models.Q(sequence__isnull=True), name="change_event_unpublished"),
+        ]
+
+    def __str__(self) -> str:
+        return f"#{self.pk} {self.entity} {self.object_id} {self.action}"
+
+
+class ChangeFeedHead(models.Model):
+    """Single row holding the last published feed sequence; publishers lock it to take turns."""
+
+    sequence = models.BigIntegerField(default=0)
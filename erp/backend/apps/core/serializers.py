@@ -0,0 +1,18 @@
+from __future__ import annotations
+
+from rest_framework import serializers
+
+from .models import ChangeEvent
+
+
+class ChangeEventSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ChangeEvent
+        fields = ["sequence", "entity", "object_id", "action", "payload", "created_at"]
+        read_only_fields = fields
+
+
+class ChangeFeedQuerySerializer(serializers.Serializer):
+    since = serializers.IntegerField(min_value=0, default=0)
+    limit = serializers.IntegerField(min_value=1, max_value=5000, default=500)
+    entity = serializers.ListField(child=serializers.CharField(), required=False)
@@ -0,0 +1,257 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import random
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, Iterable, Iterator, TypeVar
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import OperationalError, connections, models, transaction
+from django.utils import timezone
+
+from .models import ChangeEvent, ChangeFeedHead, IdempotencyKey
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+def request_fingerprint(data) -> str:
+    payload = json.dumps(data, sort_keys=True, cls=DjangoJSONEncoder, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def claim_idempotency_key(user, scope: str, key: str, fingerprint: str) -> IdempotencyKey:
+    """Return the locked record for `key`, creating or recycling it as needed.
+
+    Must run inside a transaction. A concurrent request with the same key blocks
+    on the row lock until the first one commits, then sees its stored response.
+    """
+    now = timezone.now()
+    expires_at = now + settings.IDEMPOTENCY_KEY_TTL
+    record, created = IdempotencyKey.objects.get_or_create(
+        user=user,
+        scope=scope,
+        key=key,
+        defaults={"request_hash": fingerprint, "expires_at": expires_at},
+    )
+    if created:
+        return record
+    record = IdempotencyKey.objects.select_for_update().get(pk=record.pk)
+    if record.expires_at <= now:
+        record.request_hash = fingerprint
+        record.status_code = None
+        record.response_body = None
+        record.expires_at = expires_at
+        record.save(update_fields=["request_hash", "status_code", "response_body", "expires_at"])
+    return record
+
+
+def prune_idempotency_keys() -> int:
+    deleted, _ = IdempotencyKey.objects.filter(expires_at__lte=timezone.now()).delete()
+    return deleted
+
+
+def entity_label(model) -> str:
+    return f"{model._meta.app_label}.{model._meta.model_name}"
+
+
+def snapshot(instance: models.Model) -> dict:
+    return {field.attname: field.value_from_object(instance) for field in instance._meta.concrete_fields}
+
+
+def record_changes(action: str, instances: Iterable[models.Model]) -> None:
+    """Append change events for `instances`; call inside the transaction that wrote them."""
+    events = [
+        ChangeEvent(
+            entity=entity_label(type(instance)),
+            object_id=instance.pk,
+            action=action,
+            payload=snapshot(instance),
+        )
+        for instance in instances
+    ]
+    if events:
+        ChangeEvent.objects.bulk_create(events)
+        _publish_on_commit()
+
+
+def _publish_on_commit() -> None:
+    # One publisher per transaction, however many writes it records.
+    queued = transaction.get_connection().run_on_commit
+    if not any(hook[1] is publish_pending_changes for hook in queued):
+        transaction.on_commit(publish_pending_changes, robust=True)
+
+
+def record_change(action: str, instance: models.Model) -> None:
+    record_changes(action, [instance])
+
+
+def publish_changes(batch_size: int = 5000) -> int:
+    """Give committed, unpublished change events the next feed sequences, oldest first.
+
+    Events only become visible here once their transaction committed, and publishers take
+    turns on the head row, so a sequence is never handed out below one a reader has seen.
+    """
+    with transaction.atomic():
+        heads = lock_rows(ChangeFeedHead.objects.filter(pk=1), "core.change_feed")
+        head = heads[0] if heads else ChangeFeedHead.objects.create(pk=1)
+        events = list(ChangeEvent.objects.filter(sequence__isnull=True).order_by("id").only("id")[:batch_size])
+        if not events:
+            return 0
+        for offset, event in enumerate(events, start=1):
+            event.sequence = head.sequence + offset
+        ChangeEvent.objects.bulk_update(events, ["sequence"], batch_size=1000)
+        head.sequence += len(events)
+        head.save(update_fields=["sequence"])
+    return len(events)
+
+
+def publish_pending_changes(batch_size: int = 5000) -> int:
+    """Publish every committed, unpublished change event; runs after each recording transaction commits."""
+    published = 0
+    while count := publish_changes(batch_size):
+        published += count
+        if count < batch_size:
+            break
+    return published
+
+
+def changes_since(since: int, limit: int, entities: Iterable[str] | None = None) -> list[ChangeEvent]:
+    """Published change events after sequence `since`; events still being published are not listed yet."""
+    queryset = ChangeEvent.objects.filter(sequence__gt=since)
+    if entities:
+        queryset = queryset.filter(entity__in=list(entities))
+    return list(queryset.order_by("sequence")[:limit])
+
+
+def _init_worker() -> None:
+    import django
+
+    django.setup()
+
+
+def iter_in_processes(func: Callable[[Any], T], chunks: Iterable[Any], workers: int) -> Iterator[T]:
+    """Yield `func(chunk)` for each chunk in order, using worker processes when `workers > 1`.
+
+    `func` must be a module-level function. Each worker opens its own database connections.
+    """
+    chunks = list(chunks)
+    if workers <= 1 or len(chunks) <= 1:
+        for chunk in chunks:
+            yield func(chunk)
+        return
+    # Forked workers must not share the parent's open database sockets.
+    connections.close_all()
+    with ProcessPoolExecutor(max_workers=min(workers, len(chunks)), initializer=_init_worker) as pool:
+        yield from pool.map(func, chunks)
+
+
+def map_in_processes(func: Callable[[Any], T], chunks: Iterable[Any], workers: int) -> list[T]:
+    return list(iter_in_processes(func, chunks, workers))
+
+
+@dataclass
+class LockStats:
+    acquisitions: int = 0
+    wait_total: float = 0.0
+    wait_max: float = 0.0
+    retries: int = 0
+    exhausted: int = 0
+
+
+class LockMetrics:
+    """Per-process row-lock wait times and conflict retries, keyed by a label such as `invoicing.invoice`."""
+
+    def __init__(self) -> None:
+        self._stats: defaultdict[str, LockStats] = defaultdict(LockStats)
+        self._lock = threading.Lock()
+
+    def observe_wait(self, label: str, seconds: float) -> None:
+        with self._lock:
+            stats = self._stats[label]
+            stats.acquisitions += 1
+            stats.wait_total += seconds
+            stats.wait_max = max(stats.wait_max, seconds)
+        if seconds * 1000 >= settings.LOCK_WAIT_WARNING_MS:
+            logger.warning("Waited %.0f ms for %s row lock.", seconds * 1000, label)
+
+    def observe_retry(self, label: str, exhausted: bool = False) -> None:
+        with self._lock:
+            stats = self._stats[label]
+            if exhausted:
+                stats.exhausted += 1
+            else:
+                stats.retries += 1
+
+    def snapshot(self) -> dict[str, dict]:
+        with self._lock:
+            return {
+                label: {
+                    "acquisitions": stats.acquisitions,
+                    "wait_ms_total": round(stats.wait_total * 1000, 3),
+                    "wait_ms_avg": round(stats.wait_total * 1000 / stats.acquisitions, 3) if stats.acquisitions else 0.0,
+                    "wait_ms_max": round(stats.wait_max * 1000, 3),
+                    "retries": stats.retries,
+                    "exhausted": stats.exhausted,
+                }
+                for label, stats in sorted(self._stats.items())
+            }
+
+    def reset(self) -> None:
+        with self._lock:
+            self._stats.clear()
+
+
+lock_metrics = LockMetrics()
+
+
+def lock_rows(queryset: models.QuerySet, label: str) -> list:
+    """Evaluate `queryset` with SELECT ... FOR UPDATE, recording how long the lock took under `label`.
+
+    Order the queryset by primary key so concurrent callers lock rows in the same order.
+    """
+    started = time.perf_counter()
+    rows = list(queryset.select_for_update())
+    lock_metrics.observe_wait(label, time.perf_counter() - started)
+    return rows
+
+
+def is_lock_conflict(exc: OperationalError) -> bool:
+    cause = exc.__cause__
+    # Postgres serialization failure / deadlock, MySQL lock wait timeout / deadlock, SQLite busy.
+    code = getattr(cause, "sqlstate", None) or getattr(cause, "pgcode", None)
+    if code in ("40001", "40P01"):
+        return True
+    if cause is not None and getattr(cause, "args", None) and cause.args[0] in (1205, 1213):
+        return True
+    return "database is locked" in str(exc)
+
+
+def run_with_retry(func: Callable[[], T], label: str) -> T:
+    """Run `func` in a transaction, retrying it when the database aborts it over a lock conflict.
+
+    Inside an existing transaction the conflict cannot be retried here, so `func` simply runs.
+    """
+    if transaction.get_connection().in_atomic_block:
+        return func()
+    attempts = max(1, settings.LOCK_RETRY_ATTEMPTS)
+    for attempt in range(1, attempts + 1):
+        try:
+            with transaction.atomic():
+                return func()
+        except OperationalError as exc:
+            if not is_lock_conflict(exc):
+                raise
+            if attempt == attempts:
+                lock_metrics.observe_retry(label, exhausted=True)
+                raise
+            lock_metrics.observe_retry(label)
+            time.sleep(settings.LOCK_RETRY_BACKOFF * (2 ** (attempt - 1)) * (1 + random.random()))
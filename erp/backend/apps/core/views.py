@@ -0,0 +1,44 @@
+from __future__ import annotations
+
+import os
+
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from .serializers import ChangeEventSerializer, ChangeFeedQuerySerializer
+from apps.accounts.permissions import IsAdmin
+
+from .services import changes_since, lock_metrics
+
+
+class ChangeFeedView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        params = {key: value for key, value in request.query_params.items() if key != "entity"}
+        entities = request.query_params.getlist("entity")
+        if entities:
+            params["entity"] = entities
+        serializer = ChangeFeedQuerySerializer(data=params)
+        serializer.is_valid(raise_exception=True)
+        since = serializer.validated_data["since"]
+        limit = serializer.validated_data["limit"]
+        events = changes_since(since, limit + 1, serializer.validated_data.get("entity"))
+        has_more = len(events) > limit
+        events = events[:limit]
+        return Response(
+            {
+                "results": ChangeEventSerializer(events, many=True).data,
+                "next_since": events[-1].sequence if events else since,
+                "has_more": has_more,
+            }
+        )
+
+
+class LockMetricsView(APIView):
+    permission_classes = [IsAuthenticated, IsAdmin]
+
+    def get(self, request):
+        # Counters are per worker process; scrape every worker to get the full picture.
+        return Response({"pid": os.getpid(), "locks": lock_metrics.snapshot()})
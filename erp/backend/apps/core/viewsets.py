@@ -0,0 +1,47 @@
+from __future__ import annotations
+
+from rest_framework import status
+from rest_framework.response import Response
+
+from .services import claim_idempotency_key, request_fingerprint, run_with_retry
+
+IDEMPOTENCY_HEADER = "HTTP_IDEMPOTENCY_KEY"
+
+
+class IdempotentCreateMixin:
+    """Replay the stored response when a create is retried with the same Idempotency-Key.
+
+    The whole create, key claim included, runs in one transaction that is retried on lock
+    conflicts under `retry_label`.
+    """
+
+    retry_label = "create"
+
+    def create(self, request, *args, **kwargs):
+        key = request.META.get(IDEMPOTENCY_HEADER, "").strip()
+        if not key:
+            return run_with_retry(lambda: super(IdempotentCreateMixin, self).create(request, *args, **kwargs), self.retry_label)
+        if len(key) > 255:
+            return Response(
+                {"detail": "Idempotency-Key must be at most 255 characters."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        fingerprint = request_fingerprint(request.data)
+        return run_with_retry(lambda: self._create_once(request, key, fingerprint, *args, **kwargs), self.retry_label)
+
+    def _create_once(self, request, key: str, fingerprint: str, *args, **kwargs):
+        record = claim_idempotency_key(request.user, self.basename, key, fingerprint)
+        if record.request_hash != fingerprint:
+            return Response(
+                {"detail": "Idempotency-Key was already used with a different request."},
+                status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            )
+        if record.status_code is not None:
+            response = Response(record.response_body, status=record.status_code)
+            response["Idempotent-Replayed"] = "true"
+            return response
+        response = super().create(request, *args, **kwargs)
+        record.status_code = response.status_code
+        record.response_body = response.data
+        record.save(update_fields=["status_code", "response_body"])
+        return response
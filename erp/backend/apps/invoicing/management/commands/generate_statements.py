@@ -0,0 +1,44 @@
+from __future__ import annotations
+
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.invoicing.services import STATEMENT_RENDERERS, write_customer_statements
+
+
+class Command(BaseCommand):
+    help = "Write every customer's statement for a period, one file per customer partition."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--start", required=True, help="First day of the period (YYYY-MM-DD).")
+        parser.add_argument("--end", required=True, help="Last day of the period (YYYY-MM-DD).")
+        parser.add_argument("--format", dest="output_format", choices=sorted(STATEMENT_RENDERERS), default="html")
+        parser.add_argument("--output-dir", required=True)
+        parser.add_argument("--workers", type=int, default=1, help="Worker processes, one customer partition each.")
+        parser.add_argument("--partition-size", type=int, default=1000, help="Customers per partition and output file.")
+
+    def handle(self, *args, **options):
+        try:
+            start = date.fromisoformat(options["start"])
+            end = date.fromisoformat(options["end"])
+        except ValueError as exc:
+            raise CommandError(str(exc))
+        if start > end:
+            raise CommandError("--start must be on or before --end.")
+        if options["partition_size"] < 1:
+            raise CommandError("--partition-size must be positive.")
+
+        def progress(path: str, count: int) -> None:
+            self.stdout.write(f"{path}: {count} statements")
+
+        written = write_customer_statements(
+            start,
+            end,
+            options["output_format"],
+            options["output_dir"],
+            workers=options["workers"],
+            partition_size=options["partition_size"],
+            progress=progress,
+        )
+        self.stdout.write(self.style.SUCCESS(f"Wrote {written} statements."))
@@ -0,0 +1,52 @@
+from __future__ import annotations
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from apps.invoicing.models import PostingBatch, PostingRule
+from apps.invoicing.services import PostingError, post_documents
+from apps.ledger.services import PeriodLockedError
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = "Post unposted invoices and payments to the ledger as summarized journal entries."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--up-to", help="Post documents dated on or before this date (YYYY-MM-DD); defaults to today.")
+        parser.add_argument(
+            "--type", choices=[*PostingRule.DocumentType.values, "all"], default="all", help="Documents to post."
+        )
+        parser.add_argument(
+            "--group-by",
+            choices=PostingBatch.GroupBy.values,
+            default=PostingBatch.GroupBy.DAY,
+            help="One entry per document date, or one entry for the whole run.",
+        )
+        parser.add_argument("--user", required=True, help="Username recorded as creator and approver.")
+
+    def handle(self, *args, **options):
+        up_to = parse_date(options["up_to"]) if options["up_to"] else timezone.localdate()
+        if up_to is None:
+            raise CommandError("--up-to must be a date in YYYY-MM-DD format.")
+        try:
+            user = User.objects.get(username=options["user"])
+        except User.DoesNotExist:
+            raise CommandError(f"User {options['user']} does not exist.")
+        document_types = PostingRule.DocumentType.values if options["type"] == "all" else [options["type"]]
+        for document_type in document_types:
+            try:
+                batch = post_documents(document_type, up_to, user, options["group_by"])
+            except (PostingError, PeriodLockedError) as exc:
+                raise CommandError(str(exc))
+            if batch is None:
+                self.stdout.write(f"No unposted {document_type}s up to {up_to}.")
+                continue
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"Posted {batch.document_count} {document_type}s in {batch.entries.count()} entries (batch {batch.pk})."
+                )
+            )
@@ -0,0 +1,40 @@
+from __future__ import annotations
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from apps.invoicing.services import RevaluationError, revalue_receivables
+from apps.ledger.services import PeriodLockedError
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = "Post unrealized FX gains and losses on open foreign-currency receivables."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--as-of", help="Revaluation date (YYYY-MM-DD); defaults to today.")
+        parser.add_argument("--user", required=True, help="Username recorded as creator and approver.")
+
+    def handle(self, *args, **options):
+        as_of = parse_date(options["as_of"]) if options["as_of"] else timezone.localdate()
+        if as_of is None:
+            raise CommandError("--as-of must be a date in YYYY-MM-DD format.")
+        try:
+            user = User.objects.get(username=options["user"])
+        except User.DoesNotExist:
+            raise CommandError(f"User {options['user']} does not exist.")
+        try:
+            result = revalue_receivables(as_of, user)
+        except (RevaluationError, PeriodLockedError) as exc:
+            raise CommandError(str(exc))
+        for currency, detail in sorted(result.skipped.items()):
+            self.stderr.write(f"Skipped {currency}: {detail}")
+        entry = f"entry #{result.entry.pk}" if result.entry else "no entry"
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Revalued {len(result.revaluations)} invoices as of {as_of}: net {result.net_adjustment} ({entry})."
+            )
+        )
@@ -0,0 +1,37 @@
+from __future__ import annotations
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.invoicing.models import BillingRun
+from apps.invoicing.services import BillingRunError, run_billing
+
+
+class Command(BaseCommand):
+    help = "Create the invoices of a billing run; a failed run resumes where it stopped."
+
+    def add_arguments(self, parser):
+        parser.add_argument("run_id", type=int)
+        parser.add_argument("--workers", type=int, default=1, help="Worker processes, one customer partition each.")
+        parser.add_argument("--chunk-size", type=int, default=500, help="Customers invoiced per committed chunk.")
+        parser.add_argument("--force", action="store_true", help="Take over a run left in the running state.")
+
+    def handle(self, *args, **options):
+        try:
+            run = BillingRun.objects.get(pk=options["run_id"])
+        except BillingRun.DoesNotExist:
+            raise CommandError(f"Billing run {options['run_id']} does not exist.")
+
+        def progress(handled: int, total: int) -> None:
+            self.stdout.write(f"{handled}/{total} customers")
+
+        try:
+            run = run_billing(
+                run,
+                workers=options["workers"],
+                chunk_size=options["chunk_size"],
+                progress=progress,
+                force=options["force"],
+            )
+        except BillingRunError as exc:
+            raise CommandError(str(exc))
+        self.stdout.write(self.style.SUCCESS(f"Billing run {run.pk} completed: {run.invoices_created} invoices."))
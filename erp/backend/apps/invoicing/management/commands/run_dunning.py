@@ -0,0 +1,34 @@
+from __future__ import annotations
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from apps.invoicing.services import DunningError, run_dunning
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = "Issue dunning notices for overdue invoices that reached a new dunning level."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--as-of", help="Measure days overdue at this date (YYYY-MM-DD); defaults to today.")
+        parser.add_argument("--user", required=True, help="Username recorded on the run.")
+
+    def handle(self, *args, **options):
+        as_of = parse_date(options["as_of"]) if options["as_of"] else timezone.localdate()
+        if as_of is None:
+            raise CommandError("--as-of must be a date in YYYY-MM-DD format.")
+        try:
+            user = User.objects.get(username=options["user"])
+        except User.DoesNotExist:
+            raise CommandError(f"User {options['user']} does not exist.")
+        try:
+            run = run_dunning(as_of, user)
+        except DunningError as exc:
+            raise CommandError(str(exc))
+        self.stdout.write(
+            self.style.SUCCESS(f"Dunning run {run.pk}: {run.notices_created} notices issued, {run.notices_closed} closed.")
+        )
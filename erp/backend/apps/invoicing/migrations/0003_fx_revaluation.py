@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-19 18:11
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoicing', '0002_alter_invoiceline_amount_alter_invoiceline_quantity_and_more'),
+        ('ledger', '0008_multi_currency'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='invoice',
+            name='fx_rate',
+            field=models.DecimalField(blank=True, decimal_places=8, max_digits=18, null=True),
+        ),
+        migrations.CreateModel(
+            name='FxRevaluation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('as_of', models.DateField()),
+                ('rate', models.DecimalField(decimal_places=8, max_digits=18)),
+                ('open_amount', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('adjustment', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('entry', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='fx_revaluations', to='ledger.journalentry')),
+                ('invoice', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='fx_revaluations', to='invoicing.invoice')),
+            ],
+            options={
+                'ordering': ['-as_of', 'invoice'],
+                'unique_together': {('invoice', 'as_of')},
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-19 18:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoicing', '0004_billing_runs'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='billingrun',
+            name='number_prefix',
+            field=models.CharField(blank=True, max_length=16),
+        ),
+        migrations.CreateModel(
+            name='NumberSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('prefix', models.CharField(max_length=16)),
+                ('year', models.PositiveIntegerField()),
+                ('next_value', models.PositiveBigIntegerField(default=1)),
+            ],
+            options={
+                'ordering': ['prefix', 'year'],
+                'constraints': [models.UniqueConstraint(fields=('prefix', 'year'), name='unique_number_sequence')],
+            },
+        ),
+    ]
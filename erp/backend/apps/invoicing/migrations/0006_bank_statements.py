@@ -0,0 +1,53 @@
+# Generated by Django 5.2.18 on 2026-10-19 18:21
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoicing', '0005_number_sequences'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BankStatement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255)),
+                ('format', models.CharField(choices=[('csv', 'CSV'), ('ofx', 'OFX')], max_length=8)),
+                ('currency', models.CharField(default='USD', max_length=3)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('created_by', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='bank_statements_imported', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='BankStatementLine',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('line_number', models.PositiveIntegerField()),
+                ('date', models.DateField()),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('reference', models.CharField(blank=True, max_length=255)),
+                ('counterparty', models.CharField(blank=True, max_length=255)),
+                ('description', models.TextField(blank=True)),
+                ('transaction_id', models.CharField(blank=True, max_length=255)),
+                ('status', models.CharField(choices=[('unmatched', 'Unmatched'), ('suggested', 'Suggested'), ('matched', 'Matched'), ('ignored', 'Ignored')], default='unmatched', max_length=16)),
+                ('match_rule', models.CharField(blank=True, max_length=32)),
+                ('confidence', models.DecimalField(blank=True, decimal_places=2, max_digits=3, null=True)),
+                ('invoice', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='bank_statement_lines', to='invoicing.invoice')),
+                ('payment', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='bank_statement_line', to='invoicing.payment')),
+                ('statement', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lines', to='invoicing.bankstatement')),
+            ],
+            options={
+                'ordering': ['statement', 'line_number'],
+                'indexes': [models.Index(fields=['statement', 'status'], name='invoicing_b_stateme_a72ac6_idx')],
+            },
+        ),
+    ]
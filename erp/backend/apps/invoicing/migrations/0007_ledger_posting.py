@@ -0,0 +1,60 @@
+# Generated by Django 5.2.18 on 2026-10-19 18:28
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoicing', '0006_bank_statements'),
+        ('ledger', '0008_multi_currency'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PostingBatch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('document_type', models.CharField(choices=[('invoice', 'Invoice'), ('payment', 'Payment')], max_length=16)),
+                ('group_by', models.CharField(choices=[('day', 'One entry per document date'), ('run', 'One entry for the run')], default='day', max_length=8)),
+                ('up_to', models.DateField()),
+                ('document_count', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('created_by', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='posting_batches_created', to=settings.AUTH_USER_MODEL)),
+                ('entries', models.ManyToManyField(blank=True, related_name='posting_batches', to='ledger.journalentry')),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.AddField(
+            model_name='invoice',
+            name='posting_batch',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='invoices', to='invoicing.postingbatch'),
+        ),
+        migrations.AddField(
+            model_name='payment',
+            name='posting_batch',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='payments', to='invoicing.postingbatch'),
+        ),
+        migrations.CreateModel(
+            name='PostingRule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('document_type', models.CharField(choices=[('invoice', 'Invoice'), ('payment', 'Payment')], max_length=16)),
+                ('payment_method', models.CharField(blank=True, max_length=64)),
+                ('is_active', models.BooleanField(default=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('credit_account', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='+', to='ledger.account')),
+                ('debit_account', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='+', to='ledger.account')),
+            ],
+            options={
+                'ordering': ['document_type', 'payment_method'],
+                'constraints': [models.UniqueConstraint(fields=('document_type', 'payment_method'), name='unique_posting_rule')],
+            },
+        ),
+    ]
@@ -0,0 +1,106 @@
+# Generated by Django 5.2.18 on 2026-10-19 18:36
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoicing', '0007_ledger_posting'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DunningLevel',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=64)),
+                ('days_overdue', models.PositiveIntegerField(unique=True)),
+                ('action', models.CharField(choices=[('reminder', 'Send reminder'), ('call', 'Call customer'), ('final_notice', 'Send final notice'), ('collections', 'Refer to collections')], default='reminder', max_length=16)),
+                ('is_active', models.BooleanField(default=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['days_overdue'],
+            },
+        ),
+        migrations.CreateModel(
+            name='DunningNotice',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('days_overdue', models.PositiveIntegerField()),
+                ('open_balance', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('status', models.CharField(choices=[('open', 'Open'), ('done', 'Done'), ('closed', 'Closed')], default='open', max_length=8)),
+                ('notes', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['-days_overdue', 'id'],
+            },
+        ),
+        migrations.CreateModel(
+            name='DunningRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('as_of', models.DateField()),
+                ('notices_created', models.PositiveIntegerField(default=0)),
+                ('notices_closed', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.AddField(
+            model_name='customer',
+            name='collector',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='collection_customers', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='invoice',
+            name='dunning_level',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='invoices', to='invoicing.dunninglevel'),
+        ),
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['status', 'due_date'], name='invoice_status_due_idx'),
+        ),
+        migrations.AddField(
+            model_name='dunningnotice',
+            name='collector',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='dunning_notices', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='dunningnotice',
+            name='invoice',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='dunning_notices', to='invoicing.invoice'),
+        ),
+        migrations.AddField(
+            model_name='dunningnotice',
+            name='level',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='notices', to='invoicing.dunninglevel'),
+        ),
+        migrations.AddField(
+            model_name='dunningrun',
+            name='created_by',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='dunning_runs_created', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='dunningnotice',
+            name='run',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='notices', to='invoicing.dunningrun'),
+        ),
+        migrations.AddIndex(
+            model_name='dunningnotice',
+            index=models.Index(fields=['status', 'collector'], name='dunning_notice_worklist_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='dunningnotice',
+            constraint=models.UniqueConstraint(fields=('invoice', 'level'), name='unique_dunning_notice_level'),
+        ),
+    ]
@@ -1,16 +1,28 @@
 from __future__ import annotations
 
+from collections import defaultdict
 from decimal import Decimal
 
 from django.conf import settings
 from django.core.validators import MinValueValidator
 from django.db import models
+from django.db.models import F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
 
 
 class Customer(models.Model):
     name = models.CharField(max_length=255)
     email = models.EmailField()
     billing_address = models.TextField(blank=True)
+    # Owner of the customer's dunning worklist.
+    collector = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        related_name="collection_customers",
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+    )
 
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -22,6 +34,51 @@ class Customer(models.Model):
         return self.name
 
 
+class InvoiceQuerySet(models.QuerySet):
+    def with_balances(self):
+        """Annotate `total_amount`, `paid_amount` and `open_balance` without joining lines to payments."""
+        zero = Value(Decimal("0"), output_field=models.DecimalField(max_digits=14, decimal_places=2))
+        line_totals = (
+            InvoiceLine.objects.filter(invoice=OuterRef("pk"))
+            .order_by()
+            .values("invoice")
+            .annotate(total=Sum("amount"))
+            .values("total")
+        )
+        payment_totals = (
+            Payment.objects.filter(invoice=OuterRef("pk"))
+            .order_by()
+            .values("invoice")
+            .annotate(total=Sum("amount"))
+            .values("total")
+        )
+        return self.annotate(
+            total_amount=Coalesce(Subquery(line_totals), zero),
+            paid_amount=Coalesce(Subquery(payment_totals), zero),
+        ).annotate(open_balance=F("total_amount") - F("paid_amount"))
+
+    def sync_statuses(self) -> list[int]:
+        """Apply the payment-driven status rules of `PaymentViewSet._sync_invoice` to every
+        invoice in the queryset with one UPDATE per new status; returns the changed ids."""
+        changes: defaultdict[str, list[int]] = defaultdict(list)
+        rows = self.exclude(status=Invoice.Status.VOID).with_balances().values_list("pk", "status", "total_amount", "paid_amount")
+        for pk, status, total, paid in rows:
+            if total <= 0:
+                continue
+            if paid >= total:
+                new_status = Invoice.Status.PAID
+            elif paid > 0:
+                new_status = Invoice.Status.PARTIALLY_PAID
+            else:
+                new_status = Invoice.Status.SENT
+            if new_status != status:
+                changes[new_status].append(pk)
+        now = timezone.now()
+        for new_status, ids in changes.items():
+            Invoice.objects.filter(pk__in=ids).update(status=new_status, updated_at=now)
+        return [pk for ids in changes.values() for pk in ids]
+
+
 class Invoice(models.Model):
     class Status(models.TextChoices):
         DRAFT = "draft", "Draft"
@@ -35,6 +92,8 @@ class Invoice(models.Model):
     description = models.CharField(max_length=255, blank=True)
     status = models.CharField(max_length=16, choices=Status.choices, default=Status.DRAFT)
     currency = models.CharField(max_length=3, default="USD")
+    # Rate to the base currency on the issue date; null for base-currency invoices.
+    fx_rate = models.DecimalField(max_digits=18, decimal_places=8, null=True, blank=True)
     issue_date = models.DateField()
     due_date = models.DateField()
     notes = models.TextField(blank=True)
@@ -43,12 +102,43 @@ class Invoice(models.Model):
         related_name="invoices_created",
         on_delete=models.PROTECT,
     )
+    billing_run = models.ForeignKey(
+        "BillingRun",
+        related_name="invoices",
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+    )
+    # Set once the invoice has been posted to the ledger; posted amounts can no longer change.
+    posting_batch = models.ForeignKey(
+        "PostingBatch",
+        related_name="invoices",
+        on_delete=models.PROTECT,
+        null=True,
+        blank=True,
+    )
+    # Highest dunning level reached; set by dunning runs.
+    dunning_level = models.ForeignKey(
+        "DunningLevel",
+        related_name="invoices",
+        on_delete=models.PROTECT,
+        null=True,
+        blank=True,
+    )
 
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = InvoiceQuerySet.as_manager()
+
     class Meta:
         ordering = ["-issue_date", "-id"]
+        constraints = [
+            models.UniqueConstraint(fields=["billing_run", "customer"], name="unique_billing_run_customer"),
+        ]
+        indexes = [
+            models.Index(fields=["status", "due_date"], name="invoice_status_due_idx"),
+        ]
 
     def __str__(self) -> str:
         return f"Invoice {self.number}"
@@ -92,6 +182,13 @@ class Payment(models.Model):
     method = models.CharField(max_length=64, blank=True)
     reference = models.CharField(max_length=64, blank=True)
     notes = models.TextField(blank=True)
+    posting_batch = models.ForeignKey(
+        "PostingBatch",
+        related_name="payments",
+        on_delete=models.PROTECT,
+        null=True,
+        blank=True,
+    )
 
     created_at = models.DateTimeField(auto_now_add=True)
 
@@ -100,3 +197,309 @@ class Payment(models.Model):
 
     def __str__(self) -> str:
         return f"Payment {self.amount} on {self.date}"
+
+
+class FxRevaluation(models.Model):
+    """Unrealized gain (+) or loss (-) posted for a foreign-currency invoice's open balance."""
+
+    invoice = models.ForeignKey(Invoice, related_name="fx_revaluations", on_delete=models.PROTECT)
+    # Null when every adjustment in the run was zero and nothing was posted.
+    entry = models.ForeignKey(
+        "ledger.JournalEntry",
+        related_name="fx_revaluations",
+        on_delete=models.PROTECT,
+        null=True,
+        blank=True,
+    )
+    as_of = models.DateField()
+    rate = models.DecimalField(max_digits=18, decimal_places=8)
+    open_amount = models.DecimalField(max_digits=14, decimal_places=2)
+    adjustment = models.DecimalField(max_digits=14, decimal_places=2)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["-as_of", "invoice"]
+        unique_together = ("invoice", "as_of")
+
+    def __str__(self) -> str:
+        return f"{self.invoice} {self.as_of} {self.adjustment}"
+
+
+class NumberSequence(models.Model):
+    """Next free invoice number for a prefix and year; processes reserve blocks from it."""
+
+    prefix = models.CharField(max_length=16)
+    year = models.PositiveIntegerField()
+    next_value = models.PositiveBigIntegerField(default=1)
+
+    class Meta:
+        ordering = ["prefix", "year"]
+        constraints = [
+            models.UniqueConstraint(fields=["prefix", "year"], name="unique_number_sequence"),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.prefix}-{self.year}: {self.next_value}"
+
+
+class BillingRun(models.Model):
+    """A batch of invoices, one per customer, built from the same line templates."""
+
+    class Status(models.TextChoices):
+        PENDING = "pending", "Pending"
+        RUNNING = "running", "Running"
+        COMPLETED = "completed", "Completed"
+        FAILED = "failed", "Failed"
+
+    name = models.CharField(max_length=128)
+    customer_ids = models.JSONField(default=list)
+    issue_date = models.DateField()
+    due_date = models.DateField()
+    currency = models.CharField(max_length=3, default="USD")
+    description = models.CharField(max_length=255, blank=True)
+    invoice_status = models.CharField(max_length=16, choices=Invoice.Status.choices, default=Invoice.Status.DRAFT)
+    # Blank uses INVOICE_NUMBER_PREFIX.
+    number_prefix = models.CharField(max_length=16, blank=True)
+
+    status = models.CharField(max_length=16, choices=Status.choices, default=Status.PENDING)
+    invoices_created = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True)
+    created_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        related_name="billing_runs_created",
+        on_delete=models.PROTECT,
+    )
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["-created_at"]
+
+    def __str__(self) -> str:
+        return self.name
+
+    @property
+    def total_customers(self) -> int:
+        return len(self.customer_ids)
+
+
+class BillingRunLine(models.Model):
+    run = models.ForeignKey(BillingRun, related_name="lines", on_delete=models.CASCADE)
+    description = models.CharField(max_length=255)
+    quantity = models.DecimalField(max_digits=10, decimal_places=2, default=Decimal("1.00"))
+    unit_price = models.DecimalField(max_digits=12, decimal_places=2, validators=[MinValueValidator(0)])
+
+    class Meta:
+        ordering = ["id"]
+
+    def __str__(self) -> str:
+        return f"{self.description} x {self.quantity}"
+
+
+class BankStatement(models.Model):
+    class Format(models.TextChoices):
+        CSV = "csv", "CSV"
+        OFX = "ofx", "OFX"
+
+    name = models.CharField(max_length=255)
+    format = models.CharField(max_length=8, choices=Format.choices)
+    currency = models.CharField(max_length=3, default="USD")
+    created_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        related_name="bank_statements_imported",
+        on_delete=models.PROTECT,
+    )
+
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["-created_at"]
+
+    def __str__(self) -> str:
+        return self.name
+
+
+class BankStatementLine(models.Model):
+    class Status(models.TextChoices):
+        UNMATCHED = "unmatched", "Unmatched"
+        SUGGESTED = "suggested", "Suggested"
+        MATCHED = "matched", "Matched"
+        IGNORED = "ignored", "Ignored"
+
+    statement = models.ForeignKey(BankStatement, related_name="lines", on_delete=models.CASCADE)
+    line_number = models.PositiveIntegerField()
+    date = models.DateField()
+    amount = models.DecimalField(max_digits=14, decimal_places=2)
+    reference = models.CharField(max_length=255, blank=True)
+    counterparty = models.CharField(max_length=255, blank=True)
+    description = models.TextField(blank=True)
+    # Bank-assigned transaction id (OFX FITID) when the format has one.
+    transaction_id = models.CharField(max_length=255, blank=True)
+
+    status = models.CharField(max_length=16, choices=Status.choices, default=Status.UNMATCHED)
+    invoice = models.ForeignKey(
+        Invoice,
+        related_name="bank_statement_lines",
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+    )
+    # Matcher rule that proposed `invoice`, e.g. `reference` or `amount_customer`.
+    match_rule = models.CharField(max_length=32, blank=True)
+    confidence = models.DecimalField(max_digits=3, decimal_places=2, null=True, blank=True)
+    payment = models.OneToOneField(
+        Payment,
+        related_name="bank_statement_line",
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+    )
+
+    class Meta:
+        ordering = ["statement", "line_number"]
+        indexes = [models.Index(fields=["statement", "status"])]
+
+    def __str__(self) -> str:
+        return f"{self.date} {self.amount} {self.reference}"
+
+
+class PostingRule(models.Model):
+    """Accounts a posting batch debits and credits for invoices or payments.
+
+    Payment rules may name a `payment_method`; payments with other methods use the rule
+    without one.
+    """
+
+    class DocumentType(models.TextChoices):
+        INVOICE = "invoice", "Invoice"
+        PAYMENT = "payment", "Payment"
+
+    document_type = models.CharField(max_length=16, choices=DocumentType.choices)
+    payment_method = models.CharField(max_length=64, blank=True)
+    debit_account = models.ForeignKey("ledger.Account", related_name="+", on_delete=models.PROTECT)
+    credit_account = models.ForeignKey("ledger.Account", related_name="+", on_delete=models.PROTECT)
+    is_active = models.BooleanField(default=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ["document_type", "payment_method"]
+        constraints = [
+            models.UniqueConstraint(fields=["document_type", "payment_method"], name="unique_posting_rule"),
+        ]
+
+    def __str__(self) -> str:
+        method = f" ({self.payment_method})" if self.payment_method else ""
+        return f"{self.get_document_type_display()}{method}: Dr {self.debit_account_id} / Cr {self.credit_account_id}"
+
+
+class PostingBatch(models.Model):
+    class GroupBy(models.TextChoices):
+        DAY = "day", "One entry per document date"
+        RUN = "run", "One entry for the run"
+
+    document_type = models.CharField(max_length=16, choices=PostingRule.DocumentType.choices)
+    group_by = models.CharField(max_length=8, choices=GroupBy.choices, default=GroupBy.DAY)
+    up_to = models.DateField()
+    document_count = models.PositiveIntegerField(default=0)
+    entries = models.ManyToManyField("ledger.JournalEntry", related_name="posting_batches", blank=True)
+    created_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        related_name="posting_batches_created",
+        on_delete=models.PROTECT,
+    )
+
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["-created_at"]
+
+    def __str__(self) -> str:
+        return f"{self.get_document_type_display()} posting up to {self.up_to}"
+
+
+class DunningLevel(models.Model):
+    """Collection step an open invoice reaches once it is `days_overdue` days past due."""
+
+    class Action(models.TextChoices):
+        REMINDER = "reminder", "Send reminder"
+        CALL = "call", "Call customer"
+        FINAL_NOTICE = "final_notice", "Send final notice"
+        COLLECTIONS = "collections", "Refer to collections"
+
+    name = models.CharField(max_length=64)
+    days_overdue = models.PositiveIntegerField(unique=True)
+    action = models.CharField(max_length=16, choices=Action.choices, default=Action.REMINDER)
+    is_active = models.BooleanField(default=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ["days_overdue"]
+
+    def __str__(self) -> str:
+        return f"{self.name} ({self.days_overdue} days)"
+
+
+class DunningRun(models.Model):
+    as_of = models.DateField()
+    notices_created = models.PositiveIntegerField(default=0)
+    notices_closed = models.PositiveIntegerField(default=0)
+    created_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        related_name="dunning_runs_created",
+        on_delete=models.PROTECT,
+    )
+
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["-created_at"]
+
+    def __str__(self) -> str:
+        return f"Dunning run as of {self.as_of}"
+
+
+class DunningNotice(models.Model):
+    """An invoice reaching a dunning level; the collector's worklist is their open notices."""
+
+    class Status(models.TextChoices):
+        OPEN = "open", "Open"
+        DONE = "done", "Done"
+        # Superseded by a higher level, or the invoice was settled or voided.
+        CLOSED = "closed", "Closed"
+
+    run = models.ForeignKey(DunningRun, related_name="notices", on_delete=models.CASCADE)
+    invoice = models.ForeignKey(Invoice, related_name="dunning_notices", on_delete=models.CASCADE)
+    level = models.ForeignKey(DunningLevel, related_name="notices", on_delete=models.PROTECT)
+    collector = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        related_name="dunning_notices",
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+    )
+    days_overdue = models.PositiveIntegerField()
+    open_balance = models.DecimalField(max_digits=14, decimal_places=2)
+    status = models.CharField(max_length=8, choices=Status.choices, default=Status.OPEN)
+    notes = models.TextField(blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ["-days_overdue", "id"]
+        constraints = [
+            models.UniqueConstraint(fields=["invoice", "level"], name="unique_dunning_notice_level"),
+        ]
+        indexes = [
+            models.Index(fields=["status", "collector"], name="dunning_notice_worklist_idx"),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.level} for invoice {self.invoice_id}"
@@ -2,15 +2,38 @@ from __future__ import annotations
 
 from decimal import Decimal
 
+from django.conf import settings
+from django.db import transaction
 from rest_framework import serializers
+from rest_framework.validators import UniqueValidator
 
-from .models import Customer, Invoice, InvoiceLine, Payment
+from apps.core.models import ChangeEvent
+from apps.core.services import lock_rows, record_change
+from apps.ledger.services import fx_rates
+
+from .models import (
+    BankStatement,
+    BankStatementLine,
+    BillingRun,
+    BillingRunLine,
+    Customer,
+    DunningLevel,
+    DunningNotice,
+    DunningRun,
+    FxRevaluation,
+    Invoice,
+    InvoiceLine,
+    Payment,
+    PostingBatch,
+    PostingRule,
+)
+from .services import SERVER_NUMBER, invoice_numbers
 
 
 class CustomerSerializer(serializers.ModelSerializer):
     class Meta:
         model = Customer
-        fields = ["id", "name", "email", "billing_address", "created_at", "updated_at"]
+        fields = ["id", "name", "email", "billing_address", "collector", "created_at", "updated_at"]
         read_only_fields = ["id", "created_at", "updated_at"]
 
 
@@ -34,12 +57,17 @@ class PaymentSerializer(serializers.ModelSerializer):
             "method",
             "reference",
             "notes",
+            "posting_batch",
             "created_at",
             "remaining_balance",
         ]
-        read_only_fields = ["id", "created_at", "remaining_balance"]
+        read_only_fields = ["id", "posting_batch", "created_at", "remaining_balance"]
 
     def validate(self, attrs):
+        if self.instance is not None and self.instance.posting_batch_id:
+            changed = [name for name in ("invoice", "date", "amount") if name in attrs and attrs[name] != getattr(self.instance, name)]
+            if changed:
+                raise serializers.ValidationError({name: "Posted payments cannot change." for name in changed})
         invoice = attrs.get("invoice") or getattr(self.instance, "invoice", None)
         amount = attrs.get("amount")
         if invoice is None or amount is None:
@@ -47,13 +75,28 @@ class PaymentSerializer(serializers.ModelSerializer):
         amount = amount or Decimal("0")
         if amount <= 0:
             raise serializers.ValidationError({"amount": "Amount must be greater than zero."})
+        attrs["remaining_balance"] = self._remaining_after(invoice, amount)
+        return attrs
+
+    def _remaining_after(self, invoice: Invoice, amount: Decimal) -> Decimal:
         balance = invoice.balance_due
-        if self.instance:
+        if self.instance and self.instance.invoice_id == invoice.pk:
             balance += self.instance.amount
         if amount > balance:
             raise serializers.ValidationError({"amount": "Payment exceeds remaining balance."})
-        attrs["remaining_balance"] = balance - amount
-        return attrs
+        return balance - amount
+
+    def _lock_invoice(self, validated_data) -> None:
+        """Lock the invoice(s) and re-check the balance, so concurrent payments cannot over-apply."""
+        invoice = validated_data.get("invoice") or self.instance.invoice
+        invoice_ids = {invoice.pk}
+        if self.instance:
+            invoice_ids.add(self.instance.invoice_id)
+        locked = {row.pk: row for row in lock_rows(Invoice.objects.filter(pk__in=invoice_ids).order_by("pk"), "invoicing.invoice")}
+        validated_data["invoice"] = locked[invoice.pk]
+        amount = validated_data.get("amount", self.instance.amount if self.instance else None)
+        if amount is not None:
+            self._remaining_after(locked[invoice.pk], amount)
 
     def to_representation(self, instance):
         data = super().to_representation(instance)
@@ -62,11 +105,15 @@ class PaymentSerializer(serializers.ModelSerializer):
 
     def create(self, validated_data):
         validated_data.pop("remaining_balance", None)
-        return super().create(validated_data)
+        with transaction.atomic():
+            self._lock_invoice(validated_data)
+            return super().create(validated_data)
 
     def update(self, instance, validated_data):
         validated_data.pop("remaining_balance", None)
-        return super().update(instance, validated_data)
+        with transaction.atomic():
+            self._lock_invoice(validated_data)
+            return super().update(instance, validated_data)
 
 
 class InvoiceSerializer(serializers.ModelSerializer):
@@ -74,6 +121,12 @@ class InvoiceSerializer(serializers.ModelSerializer):
     customer_id = serializers.PrimaryKeyRelatedField(
         queryset=Customer.objects.all(), source="customer", write_only=True
     )
+    number = serializers.CharField(
+        max_length=32,
+        required=False,
+        validators=[UniqueValidator(queryset=Invoice.objects.all())],
+        help_text="Leave out to get the next number from the invoice sequence.",
+    )
     line_items = InvoiceLineSerializer(many=True)
     payments = PaymentSerializer(many=True, read_only=True)
     total = serializers.DecimalField(max_digits=12, decimal_places=2, read_only=True)
@@ -88,6 +141,7 @@ class InvoiceSerializer(serializers.ModelSerializer):
             "description",
             "status",
             "currency",
+            "fx_rate",
             "issue_date",
             "due_date",
             "notes",
@@ -98,12 +152,15 @@ class InvoiceSerializer(serializers.ModelSerializer):
             "total",
             "amount_paid",
             "balance_due",
+            "posting_batch",
             "created_by",
             "created_at",
             "updated_at",
         ]
         read_only_fields = [
             "id",
+            "fx_rate",
+            "posting_batch",
             "payments",
             "total",
             "amount_paid",
@@ -113,32 +170,445 @@ class InvoiceSerializer(serializers.ModelSerializer):
             "updated_at",
         ]
 
+    def validate(self, attrs):
+        if self.instance is not None and self.instance.posting_batch_id:
+            self._check_posted(attrs)
+        if self.instance is not None and "currency" not in attrs and "issue_date" not in attrs:
+            return attrs
+        currency = attrs.get("currency", getattr(self.instance, "currency", settings.BASE_CURRENCY)).upper()
+        issue_date = attrs.get("issue_date", getattr(self.instance, "issue_date", None))
+        if "currency" in attrs:
+            attrs["currency"] = currency
+        if currency == settings.BASE_CURRENCY:
+            attrs["fx_rate"] = None
+        elif issue_date is not None:
+            rate = fx_rates().rate(currency, settings.BASE_CURRENCY, issue_date)
+            if rate is None:
+                raise serializers.ValidationError(
+                    {"currency": f"No {currency}/{settings.BASE_CURRENCY} rate on or before {issue_date}."}
+                )
+            attrs["fx_rate"] = rate
+        return attrs
+
+    def validate_number(self, value):
+        if value != getattr(self.instance, "number", None) and SERVER_NUMBER.fullmatch(value):
+            raise serializers.ValidationError(
+                "Numbers shaped like PREFIX-YEAR-NNNNNN are assigned by the server; leave number out to get one."
+            )
+        return value
+
+    def _check_posted(self, attrs) -> None:
+        """Posted invoices keep the amounts, currency and date the ledger was given."""
+        errors = {}
+        for name in ("currency", "issue_date", "customer"):
+            if name in attrs and attrs[name] != getattr(self.instance, name):
+                errors[name] = "Posted invoices cannot change."
+        if attrs.get("status") in (Invoice.Status.DRAFT, Invoice.Status.VOID):
+            errors["status"] = "Posted invoices cannot go back to draft or be voided."
+        if "line_items" in attrs:
+            current = [(line.description, line.quantity, line.unit_price) for line in self.instance.line_items.all()]
+            submitted = [
+                (line.get("description", ""), line.get("quantity") or 1, line.get("unit_price") or 0) for line in attrs["line_items"]
+            ]
+            if current != submitted:
+                errors["line_items"] = "Posted invoices cannot change."
+        if errors:
+            raise serializers.ValidationError(errors)
+
     def create(self, validated_data):
         line_items_data = validated_data.pop("line_items", [])
         request = self.context.get("request")
         if request and request.user.is_authenticated:
             validated_data["created_by"] = request.user
-        invoice = Invoice.objects.create(**validated_data)
-        self._create_lines(invoice, line_items_data)
+        if not validated_data.get("number"):
+            validated_data["number"] = invoice_numbers.next_number(validated_data["issue_date"].year)
+        with transaction.atomic():
+            invoice = Invoice.objects.create(**validated_data)
+            self._create_lines(invoice, line_items_data)
+            record_change(ChangeEvent.Action.CREATED, invoice)
         return invoice
 
     def update(self, instance, validated_data):
         line_items_data = validated_data.pop("line_items", None)
-        invoice = super().update(instance, validated_data)
-        if line_items_data is not None:
-            invoice.line_items.all().delete()
-            self._create_lines(invoice, line_items_data)
+        with transaction.atomic():
+            invoice = super().update(instance, validated_data)
+            if line_items_data is not None:
+                invoice.line_items.all().delete()
+                self._create_lines(invoice, line_items_data)
+            record_change(ChangeEvent.Action.UPDATED, invoice)
         return invoice
 
     def _create_lines(self, invoice: Invoice, line_items_data):
+        lines = []
         for line in line_items_data:
             quantity = line.get("quantity") or 1
             unit_price = line.get("unit_price") or 0
-            amount = quantity * unit_price
-            InvoiceLine.objects.create(
-                invoice=invoice,
-                description=line.get("description", ""),
-                quantity=quantity,
-                unit_price=unit_price,
-                amount=amount,
+            lines.append(
+                InvoiceLine(
+                    invoice=invoice,
+                    description=line.get("description", ""),
+                    quantity=quantity,
+                    unit_price=unit_price,
+                    amount=quantity * unit_price,
+                )
             )
+        InvoiceLine.objects.bulk_create(lines)
+
+
+class FxRevaluationSerializer(serializers.ModelSerializer):
+    invoice_number = serializers.CharField(source="invoice.number", read_only=True)
+    currency = serializers.CharField(source="invoice.currency", read_only=True)
+
+    class Meta:
+        model = FxRevaluation
+        fields = ["id", "invoice", "invoice_number", "currency", "entry", "as_of", "rate", "open_amount", "adjustment", "created_at"]
+        read_only_fields = fields
+
+
+class RevaluationRunSerializer(serializers.Serializer):
+    as_of = serializers.DateField()
+
+
+class BillingRunLineSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = BillingRunLine
+        fields = ["id", "description", "quantity", "unit_price"]
+        read_only_fields = ["id"]
+
+
+class BillingRunSerializer(serializers.ModelSerializer):
+    lines = BillingRunLineSerializer(many=True)
+    customer_ids = serializers.ListField(child=serializers.IntegerField(), required=False)
+    all_customers = serializers.BooleanField(default=False, write_only=True)
+    total_customers = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = BillingRun
+        fields = [
+            "id",
+            "name",
+            "customer_ids",
+            "all_customers",
+            "issue_date",
+            "due_date",
+            "currency",
+            "description",
+            "invoice_status",
+            "number_prefix",
+            "lines",
+            "status",
+            "total_customers",
+            "invoices_created",
+            "error",
+            "created_by",
+            "created_at",
+            "started_at",
+            "finished_at",
+        ]
+        read_only_fields = [
+            "id",
+            "status",
+            "total_customers",
+            "invoices_created",
+            "error",
+            "created_by",
+            "created_at",
+            "started_at",
+            "finished_at",
+        ]
+
+    def validate(self, attrs):
+        if self.instance is not None:
+            raise serializers.ValidationError("Billing runs cannot be edited; create a new run instead.")
+        if not attrs.get("lines"):
+            raise serializers.ValidationError({"lines": "At least one line is required."})
+        if attrs["due_date"] < attrs["issue_date"]:
+            raise serializers.ValidationError({"due_date": "Due date cannot be before the issue date."})
+        if attrs.pop("all_customers"):
+            customer_ids = list(Customer.objects.order_by("pk").values_list("pk", flat=True))
+        else:
+            customer_ids = sorted(set(attrs.get("customer_ids") or []))
+            missing = set(customer_ids) - set(Customer.objects.filter(pk__in=customer_ids).values_list("pk", flat=True))
+            if missing:
+                raise serializers.ValidationError({"customer_ids": f"Unknown customers: {sorted(missing)}."})
+        if not customer_ids:
+            raise serializers.ValidationError({"customer_ids": "Select at least one customer or set all_customers."})
+        attrs["customer_ids"] = customer_ids
+        attrs["currency"] = attrs.get("currency", settings.BASE_CURRENCY).upper()
+        return attrs
+
+    def create(self, validated_data):
+        lines = validated_data.pop("lines")
+        validated_data["created_by"] = self.context["request"].user
+        with transaction.atomic():
+            run = BillingRun.objects.create(**validated_data)
+            BillingRunLine.objects.bulk_create(BillingRunLine(run=run, **line) for line in lines)
+        return run
+
+
+class BillingRunExecuteSerializer(serializers.Serializer):
+    chunk_size = serializers.IntegerField(min_value=1, max_value=10_000, default=500)
+
+
+class BankStatementLineSerializer(serializers.ModelSerializer):
+    invoice_number = serializers.CharField(source="invoice.number", read_only=True, default=None)
+
+    class Meta:
+        model = BankStatementLine
+        fields = [
+            "id",
+            "statement",
+            "line_number",
+            "date",
+            "amount",
+            "reference",
+            "counterparty",
+            "description",
+            "transaction_id",
+            "status",
+            "invoice",
+            "invoice_number",
+            "match_rule",
+            "confidence",
+            "payment",
+        ]
+        read_only_fields = [
+            "id",
+            "statement",
+            "line_number",
+            "date",
+            "amount",
+            "reference",
+            "counterparty",
+            "description",
+            "transaction_id",
+            "match_rule",
+            "confidence",
+            "payment",
+        ]
+
+    def validate(self, attrs):
+        if self.instance.status == BankStatementLine.Status.MATCHED:
+            raise serializers.ValidationError("Matched lines are already paid; delete the payment to change them.")
+        status = attrs.get("status")
+        if status == BankStatementLine.Status.MATCHED:
+            raise serializers.ValidationError({"status": "Confirm the statement's lines to match them."})
+        if "invoice" in attrs:
+            # A manual pick is a suggestion with full confidence until it is confirmed.
+            if attrs["invoice"] is None:
+                attrs.setdefault("status", BankStatementLine.Status.UNMATCHED)
+            else:
+                attrs.setdefault("status", BankStatementLine.Status.SUGGESTED)
+            attrs["match_rule"] = "manual" if attrs["invoice"] else ""
+            attrs["confidence"] = Decimal("1.00") if attrs["invoice"] else None
+        if attrs.get("status") == BankStatementLine.Status.SUGGESTED and not attrs.get("invoice", self.instance.invoice):
+            raise serializers.ValidationError({"invoice": "Pick the invoice this line pays."})
+        return attrs
+
+
+class BankStatementSerializer(serializers.ModelSerializer):
+    line_counts = serializers.SerializerMethodField()
+
+    class Meta:
+        model = BankStatement
+        fields = ["id", "name", "format", "currency", "line_counts", "created_by", "created_at"]
+        read_only_fields = fields
+
+    def get_line_counts(self, statement) -> dict[str, int]:
+        # Annotated by BankStatementViewSet as `<status>_lines`.
+        return {status: getattr(statement, f"{status}_lines", 0) for status in BankStatementLine.Status.values}
+
+
+class BankStatementImportSerializer(serializers.Serializer):
+    file = serializers.FileField(required=False)
+    content = serializers.CharField(required=False, trim_whitespace=False)
+    format = serializers.ChoiceField(choices=BankStatement.Format.choices)
+    name = serializers.CharField(max_length=255, required=False)
+    currency = serializers.CharField(max_length=3, required=False)
+    auto_confirm = serializers.BooleanField(default=False)
+
+    def validate(self, attrs):
+        upload = attrs.pop("file", None)
+        if upload is not None:
+            try:
+                attrs["content"] = upload.read().decode("utf-8-sig")
+            except UnicodeDecodeError:
+                raise serializers.ValidationError({"file": "Statements must be UTF-8 encoded."})
+            attrs.setdefault("name", upload.name)
+        if not attrs.get("content"):
+            raise serializers.ValidationError("Upload a statement file or send its content.")
+        attrs.setdefault("name", f"{attrs['format'].upper()} statement")
+        return attrs
+
+
+class StatementConfirmSerializer(serializers.Serializer):
+    line_ids = serializers.ListField(child=serializers.IntegerField(), required=False)
+    min_confidence = serializers.DecimalField(max_digits=3, decimal_places=2, min_value=0, max_value=1, required=False)
+
+    def validate(self, attrs):
+        if "line_ids" not in attrs and "min_confidence" not in attrs:
+            raise serializers.ValidationError("Pass line_ids or min_confidence.")
+        return attrs
+
+
+class RemittanceAllocationSerializer(serializers.Serializer):
+    invoice = serializers.IntegerField()
+    amount = serializers.DecimalField(max_digits=12, decimal_places=2, min_value=Decimal("0.01"))
+
+
+class RemittanceSerializer(serializers.Serializer):
+    customer = serializers.IntegerField()
+    amount = serializers.DecimalField(max_digits=12, decimal_places=2, min_value=Decimal("0.01"))
+    date = serializers.DateField(required=False)
+    method = serializers.CharField(max_length=64, required=False, default="")
+    reference = serializers.CharField(max_length=64, required=False, default="", allow_blank=True)
+    allocations = RemittanceAllocationSerializer(many=True, required=False)
+
+    def validate_allocations(self, value):
+        invoice_ids = [allocation["invoice"] for allocation in value]
+        if len(set(invoice_ids)) != len(invoice_ids):
+            raise serializers.ValidationError("Allocate to each invoice once.")
+        return value
+
+
+class BulkPaymentSerializer(serializers.Serializer):
+    remittances = RemittanceSerializer(many=True, required=False)
+    file = serializers.FileField(required=False)
+    date = serializers.DateField(required=False, help_text="Payment date for remittances without their own.")
+
+    def validate(self, attrs):
+        if ("remittances" in attrs) == ("file" in attrs):
+            raise serializers.ValidationError("Send either remittances or a remittance file.")
+        if not attrs.get("remittances", True):
+            raise serializers.ValidationError({"remittances": "Send at least one remittance."})
+        return attrs
+
+
+class PostingRuleSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = PostingRule
+        fields = [
+            "id",
+            "document_type",
+            "payment_method",
+            "debit_account",
+            "credit_account",
+            "is_active",
+            "created_at",
+            "updated_at",
+        ]
+        read_only_fields = ["id", "created_at", "updated_at"]
+
+    def validate(self, attrs):
+        document_type = attrs.get("document_type", getattr(self.instance, "document_type", None))
+        if document_type == PostingRule.DocumentType.INVOICE and attrs.get("payment_method"):
+            raise serializers.ValidationError({"payment_method": "Only payment rules can name a payment method."})
+        debit = attrs.get("debit_account", getattr(self.instance, "debit_account", None))
+        credit = attrs.get("credit_account", getattr(self.instance, "credit_account", None))
+        if debit is not None and debit == credit:
+            raise serializers.ValidationError({"credit_account": "Debit and credit accounts must differ."})
+        return attrs
+
+
+class PostingBatchSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = PostingBatch
+        fields = ["id", "document_type", "group_by", "up_to", "document_count", "entries", "created_by", "created_at"]
+        read_only_fields = fields
+
+
+class PostingRunSerializer(serializers.Serializer):
+    document_type = serializers.ChoiceField(choices=[*PostingRule.DocumentType.choices, ("all", "All")], default="all")
+    up_to = serializers.DateField(required=False)
+    group_by = serializers.ChoiceField(choices=PostingBatch.GroupBy.choices, default=PostingBatch.GroupBy.DAY)
+
+
+class CustomerStatementQuerySerializer(serializers.Serializer):
+    start_date = serializers.DateField()
+    end_date = serializers.DateField()
+    output = serializers.ChoiceField(choices=[("json", "JSON"), ("csv", "CSV"), ("html", "HTML")], default="json")
+
+    def validate(self, attrs):
+        if attrs["start_date"] > attrs["end_date"]:
+            raise serializers.ValidationError("start_date must be before end_date")
+        return attrs
+
+
+class StatementActivitySerializer(serializers.Serializer):
+    date = serializers.DateField()
+    type = serializers.CharField(source="kind")
+    reference = serializers.CharField()
+    invoice = serializers.CharField(source="invoice_number")
+    charges = serializers.DecimalField(max_digits=14, decimal_places=2)
+    credits = serializers.DecimalField(max_digits=14, decimal_places=2)
+    balance = serializers.DecimalField(max_digits=14, decimal_places=2)
+
+
+class CustomerStatementSerializer(serializers.Serializer):
+    customer = serializers.IntegerField(source="customer_id")
+    customer_name = serializers.CharField()
+    currency = serializers.CharField()
+    start_date = serializers.DateField(source="start")
+    end_date = serializers.DateField(source="end")
+    opening_balance = serializers.DecimalField(max_digits=14, decimal_places=2)
+    invoiced = serializers.DecimalField(max_digits=14, decimal_places=2)
+    paid = serializers.DecimalField(max_digits=14, decimal_places=2)
+    closing_balance = serializers.DecimalField(max_digits=14, decimal_places=2)
+    activity = StatementActivitySerializer(many=True)
+
+
+class DunningLevelSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = DunningLevel
+        fields = ["id", "name", "days_overdue", "action", "is_active", "created_at", "updated_at"]
+        read_only_fields = ["id", "created_at", "updated_at"]
+
+
+class DunningRunSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = DunningRun
+        fields = ["id", "as_of", "notices_created", "notices_closed", "created_by", "created_at"]
+        read_only_fields = fields
+
+
+class DunningRunRequestSerializer(serializers.Serializer):
+    as_of = serializers.DateField(required=False)
+
+
+class DunningNoticeSerializer(serializers.ModelSerializer):
+    invoice_number = serializers.CharField(source="invoice.number", read_only=True)
+    customer = serializers.IntegerField(source="invoice.customer_id", read_only=True)
+    customer_name = serializers.CharField(source="invoice.customer.name", read_only=True)
+    level_name = serializers.CharField(source="level.name", read_only=True)
+    action = serializers.CharField(source="level.action", read_only=True)
+
+    class Meta:
+        model = DunningNotice
+        fields = [
+            "id",
+            "run",
+            "invoice",
+            "invoice_number",
+            "customer",
+            "customer_name",
+            "level",
+            "level_name",
+            "action",
+            "collector",
+            "days_overdue",
+            "open_balance",
+            "status",
+            "notes",
+            "created_at",
+            "updated_at",
+        ]
+        read_only_fields = [
+            "id",
+            "run",
+            "invoice",
+            "level",
+            "days_overdue",
+            "open_balance",
+            "created_at",
+            "updated_at",
+        ]
@@ -0,0 +1,1465 @@
+from __future__ import annotations
+
+import csv
+import difflib
+import io
+import os
+import re
+import threading
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta
+from decimal import Decimal, InvalidOperation
+from typing import Callable, Iterable, Iterator
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, transaction
+from django.db.models import Case, Count, F, IntegerField, Max, Q, Sum, Value, When
+from django.utils import timezone
+from django.utils.html import escape, format_html
+
+from apps.core.models import ChangeEvent
+from apps.core.services import iter_in_processes, lock_metrics, lock_rows, record_changes
+from apps.ledger.models import JournalEntry, JournalLine
+from apps.ledger.services import FX_RATE_PLACES, chart_of_accounts, ensure_periods_open, fx_rates
+
+from .models import (
+    BankStatement,
+    BankStatementLine,
+    BillingRun,
+    Customer,
+    DunningLevel,
+    DunningNotice,
+    DunningRun,
+    FxRevaluation,
+    Invoice,
+    InvoiceLine,
+    NumberSequence,
+    Payment,
+    PostingBatch,
+    PostingRule,
+)
+
+CENT = Decimal("0.01")
+
+
+SERVER_NUMBER = re.compile(r".+-\d{4}-\d{6,}")
+
+
+def format_invoice_number(prefix: str, year: int, value: int) -> str:
+    return f"{prefix}-{year}-{value:06d}"
+
+
+def sequence_alias() -> str:
+    """Database alias sequence reservations run on: a connection of their own where configured."""
+    return "sequences" if "sequences" in settings.DATABASES else DEFAULT_DB_ALIAS
+
+
+def reserve_numbers(prefix: str, year: int, count: int) -> range:
+    """Reserve `count` consecutive sequence values with one locking UPDATE of the sequence row.
+
+    Runs on `sequence_alias()`, so with a separate connection the reservation commits at once
+    whatever transaction the caller is in. Without one it commits, or rolls back, with the caller.
+    """
+    using = sequence_alias()
+    sequence = NumberSequence.objects.using(using).filter(prefix=prefix, year=year)
+    with transaction.atomic(using=using):
+        started = time.perf_counter()
+        if not sequence.update(next_value=F("next_value") + count):
+            try:
+                with transaction.atomic(using=using):
+                    NumberSequence.objects.using(using).create(prefix=prefix, year=year, next_value=1 + count)
+            except IntegrityError:  # another process created the row first
+                sequence.update(next_value=F("next_value") + count)
+        lock_metrics.observe_wait("invoicing.number_sequence", time.perf_counter() - started)
+        end = sequence.values_list("next_value", flat=True).get()
+    return range(end - count, end)
+
+
+class InvoiceNumberAllocator:
+    """Hands out invoice numbers from blocks reserved per prefix and year, so creating an
+    invoice only touches the sequence row once every `INVOICE_NUMBER_BLOCK_SIZE` numbers.
+
+    Numbers stay unique but are not gapless: a block's unused numbers are lost when the
+    process exits. Forked worker processes drop the blocks inherited from their parent.
+    """
+
+    def __init__(self) -> None:
+        self._blocks: dict[tuple[str, int], range] = {}
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+
+    def next_number(self, year: int, prefix: str | None = None) -> str:
+        prefix = prefix or settings.INVOICE_NUMBER_PREFIX
+        key = (prefix, year)
+        with self._lock:
+            if self._pid != os.getpid():
+                self._blocks.clear()
+                self._pid = os.getpid()
+            block = self._blocks.pop(key, None)
+            if block:
+                value, self._blocks[key] = block[0], block[1:]
+                return format_invoice_number(prefix, year, value)
+        block = reserve_numbers(prefix, year, max(1, settings.INVOICE_NUMBER_BLOCK_SIZE))
+        if transaction.get_connection(sequence_alias()).in_atomic_block:
+            # The reservation commits with the caller; a rolled-back block would be handed out again.
+            transaction.on_commit(lambda: self._keep(key, block[1:]), using=sequence_alias())
+        else:
+            self._keep(key, block[1:])
+        return format_invoice_number(prefix, year, block[0])
+
+    def _keep(self, key: tuple[str, int], block: range) -> None:
+        with self._lock:
+            if self._pid == os.getpid() and not self._blocks.get(key):
+                self._blocks[key] = block
+
+    def take(self, year: int, count: int, prefix: str | None = None) -> list[str]:
+        """Reserve `count` numbers directly from the sequence for a batch."""
+        prefix = prefix or settings.INVOICE_NUMBER_PREFIX
+        if count <= 0:
+            return []
+        return [format_invoice_number(prefix, year, value) for value in reserve_numbers(prefix, year, count)]
+
+    def reset(self) -> None:
+        with self._lock:
+            self._blocks.clear()
+
+
+invoice_numbers = InvoiceNumberAllocator()
+
+
+class RevaluationError(Exception):
+    pass
+
+
+class BillingRunError(Exception):
+    pass
+
+
+@dataclass
+class RevaluationResult:
+    entry: JournalEntry | None = None
+    revaluations: list[FxRevaluation] = field(default_factory=list)
+    skipped: dict[str, str] = field(default_factory=dict)
+
+    @property
+    def net_adjustment(self) -> Decimal:
+        return sum((revaluation.adjustment for revaluation in self.revaluations), Decimal("0"))
+
+
+def revalue_receivables(as_of: date, user) -> RevaluationResult:
+    """Post unrealized FX gains and losses on open foreign-currency receivables as of `as_of`.
+
+    Each invoice's cumulative unrealized amount is `open balance x (rate now - booking rate)`;
+    only the change since earlier revaluations is posted, so paid-down invoices unwind.
+    All adjustments go out as one entry with one receivable line per invoice.
+    """
+    from apps.ledger.signals import entries_posted
+
+    base = settings.BASE_CURRENCY
+    chart = chart_of_accounts()
+    receivables = chart.get_by_code(settings.RECEIVABLES_ACCOUNT_CODE)
+    gain_loss = chart.get_by_code(settings.FX_GAIN_LOSS_ACCOUNT_CODE)
+    if receivables is None or gain_loss is None:
+        raise RevaluationError(
+            f"Accounts {settings.RECEIVABLES_ACCOUNT_CODE} (receivables) and "
+            f"{settings.FX_GAIN_LOSS_ACCOUNT_CODE} (FX gain/loss) must exist."
+        )
+    rates = fx_rates()
+    result = RevaluationResult()
+
+    with transaction.atomic():
+        ensure_periods_open(as_of)
+        latest = FxRevaluation.objects.aggregate(latest=Max("as_of"))["latest"]
+        if latest is not None and as_of <= latest:
+            raise RevaluationError(f"Receivables were already revalued as of {latest}.")
+        booked = {
+            row["invoice_id"]: row["total"]
+            for row in FxRevaluation.objects.values("invoice_id")
+            .annotate(total=Sum("adjustment"))
+            .order_by()
+            if row["total"]
+        }
+        not_receivable = [Invoice.Status.DRAFT, Invoice.Status.VOID]
+        invoices = (
+            Invoice.objects.with_balances()
+            .exclude(currency=base)
+            .filter(issue_date__lte=as_of)
+            # Invoices with earlier adjustments stay in scope until those are unwound.
+            .filter((Q(open_balance__gt=0) & ~Q(status__in=not_receivable)) | Q(pk__in=list(booked)))
+            .order_by("pk")
+            .values_list("pk", "number", "status", "currency", "issue_date", "fx_rate", "open_balance")
+        )
+
+        lines: list[JournalLine] = []
+        for invoice_id, number, status, currency, issue_date, booking_rate, open_balance in invoices:
+            rate = rates.rate(currency, base, as_of)
+            booking_rate = booking_rate or rates.rate(currency, base, issue_date)
+            if rate is None or booking_rate is None:
+                result.skipped[currency] = f"No {currency}/{base} rate on or before {as_of}."
+                continue
+            open_balance = Decimal("0") if status in not_receivable else max(open_balance, Decimal("0"))
+            target = (open_balance * rate).quantize(CENT) - (open_balance * booking_rate).quantize(CENT)
+            adjustment = target - booked.get(invoice_id, Decimal("0"))
+            result.revaluations.append(
+                FxRevaluation(invoice_id=invoice_id, as_of=as_of, rate=rate, open_amount=open_balance, adjustment=adjustment)
+            )
+            if adjustment:
+                lines.append(
+                    JournalLine(
+                        account_id=receivables.id,
+                        debit=max(adjustment, Decimal("0")),
+                        credit=max(-adjustment, Decimal("0")),
+                        dimensions={"invoice": number, "fx_revaluation": as_of.isoformat()},
+                        currency=currency,
+                        amount_currency=Decimal("0"),
+                        fx_rate=rate,
+                    )
+                )
+        if not result.revaluations:
+            return result
+
+        if lines:
+            net = result.net_adjustment
+            if net:
+                lines.append(
+                    JournalLine(
+                        account_id=gain_loss.id,
+                        debit=max(-net, Decimal("0")),
+                        credit=max(net, Decimal("0")),
+                        dimensions={"fx_revaluation": as_of.isoformat()},
+                    )
+                )
+            result.entry = JournalEntry.objects.create(
+                date=as_of,
+                memo=f"FX revaluation of receivables as of {as_of.isoformat()}",
+                status=JournalEntry.Status.POSTED,
+                created_by=user,
+                approved_by=user,
+            )
+            for line in lines:
+                line.entry = result.entry
+            created = JournalLine.objects.bulk_create(lines)
+            record_changes(ChangeEvent.Action.CREATED, [result.entry])
+            record_changes(ChangeEvent.Action.CREATED, created)
+        for revaluation in result.revaluations:
+            revaluation.entry = result.entry
+        result.revaluations = FxRevaluation.objects.bulk_create(result.revaluations)
+        if result.entry is not None:
+            entries_posted.send(sender=JournalEntry, entry_ids=[result.entry.pk])
+    return result
+
+
+def _bill_chunk(job: tuple[int, list[int], str | None]) -> tuple[int, int]:
+    """Invoice the customers of one partition; customers already invoiced by the run are skipped."""
+    run_id, customer_ids, fx_rate = job
+    run = BillingRun.objects.get(pk=run_id)
+    templates = list(run.lines.all())
+    done = set(Invoice.objects.filter(billing_run=run, customer_id__in=customer_ids).values_list("customer_id", flat=True))
+    existing = set(Customer.objects.filter(pk__in=customer_ids).values_list("pk", flat=True))
+    pending = [customer_id for customer_id in customer_ids if customer_id in existing and customer_id not in done]
+    # The block is reserved before the chunk's transaction so workers never wait on the sequence row while inserting.
+    numbers = invoice_numbers.take(run.issue_date.year, len(pending), prefix=run.number_prefix)
+    with transaction.atomic():
+        invoices = Invoice.objects.bulk_create(
+            Invoice(
+                customer_id=customer_id,
+                number=number,
+                description=run.description,
+                status=run.invoice_status,
+                currency=run.currency,
+                fx_rate=Decimal(fx_rate) if fx_rate is not None else None,
+                issue_date=run.issue_date,
+                due_date=run.due_date,
+                created_by_id=run.created_by_id,
+                billing_run=run,
+            )
+            for customer_id, number in zip(pending, numbers)
+        )
+        lines = InvoiceLine.objects.bulk_create(
+            InvoiceLine(
+                invoice=invoice,
+                description=template.description,
+                quantity=template.quantity,
+                unit_price=template.unit_price,
+                amount=template.quantity * template.unit_price,
+            )
+            for invoice in invoices
+            for template in templates
+        )
+        record_changes(ChangeEvent.Action.CREATED, invoices)
+        record_changes(ChangeEvent.Action.CREATED, lines)
+        BillingRun.objects.filter(pk=run_id).update(invoices_created=F("invoices_created") + len(invoices))
+    return len(customer_ids), len(invoices)
+
+
+def run_billing(
+    run: BillingRun,
+    workers: int = 1,
+    chunk_size: int = 500,
+    progress: Callable[[int, int], None] | None = None,
+    force: bool = False,
+) -> BillingRun:
+    """Create the run's invoices in committed chunks, one partition per worker process.
+
+    Each chunk commits on its own, so a failed run can be executed again and only
+    bills the customers that are still missing an invoice. `progress` receives the
+    number of customers handled so far and the run's total after every chunk.
+    """
+    resumable = [BillingRun.Status.PENDING, BillingRun.Status.FAILED]
+    if force:
+        resumable.append(BillingRun.Status.RUNNING)
+    started = BillingRun.objects.filter(pk=run.pk, status__in=resumable).update(
+        status=BillingRun.Status.RUNNING, started_at=timezone.now(), finished_at=None, error=""
+    )
+    if not started:
+        run.refresh_from_db()
+        raise BillingRunError(f"Billing run {run.pk} is {run.status} and cannot be executed.")
+
+    try:
+        fx_rate = None
+        if run.currency != settings.BASE_CURRENCY:
+            rate = fx_rates().rate(run.currency, settings.BASE_CURRENCY, run.issue_date)
+            if rate is None:
+                raise BillingRunError(f"No {run.currency}/{settings.BASE_CURRENCY} rate on or before {run.issue_date}.")
+            fx_rate = str(rate)
+        customer_ids = list(run.customer_ids)
+        chunk_size = max(chunk_size, 1)
+        jobs = [
+            (run.pk, customer_ids[start : start + chunk_size], fx_rate)
+            for start in range(0, len(customer_ids), chunk_size)
+        ]
+        handled = 0
+        for count, _created in iter_in_processes(_bill_chunk, jobs, workers):
+            handled += count
+            if progress is not None:
+                progress(handled, len(customer_ids))
+    except Exception as exc:
+        BillingRun.objects.filter(pk=run.pk).update(
+            status=BillingRun.Status.FAILED, error=str(exc), finished_at=timezone.now()
+        )
+        run.refresh_from_db()
+        raise
+
+    BillingRun.objects.filter(pk=run.pk).update(status=BillingRun.Status.COMPLETED, finished_at=timezone.now())
+    run.refresh_from_db()
+    return run
+
+
+class StatementError(Exception):
+    pass
+
+
+@dataclass
+class StatementEntry:
+    date: date
+    amount: Decimal
+    reference: str = ""
+    counterparty: str = ""
+    description: str = ""
+    transaction_id: str = ""
+
+
+_CSV_COLUMNS = {
+    "date": ("date", "booking_date", "value_date", "posted"),
+    "amount": ("amount", "value"),
+    "credit": ("credit",),
+    "debit": ("debit",),
+    "reference": ("reference", "ref", "payment_reference"),
+    "counterparty": ("counterparty", "payer", "name"),
+    "description": ("description", "memo", "details"),
+    "transaction_id": ("transaction_id", "id", "fitid"),
+}
+
+
+def _parse_amount(value: str, where: str) -> Decimal:
+    text = (value or "").strip().replace(",", "")
+    if not text:
+        return Decimal("0")
+    try:
+        return Decimal(text).quantize(CENT)
+    except InvalidOperation:
+        raise StatementError(f"{where}: {value!r} is not an amount.")
+
+
+def parse_csv_statement(content: str) -> list[StatementEntry]:
+    """Rows need `date` (YYYY-MM-DD) and either `amount` (credits positive) or `credit`/`debit` columns."""
+    reader = csv.DictReader(io.StringIO(content))
+    headers = {(name or "").strip().lower(): name for name in reader.fieldnames or []}
+    columns = {
+        key: next((headers[alias] for alias in aliases if alias in headers), None) for key, aliases in _CSV_COLUMNS.items()
+    }
+    if columns["date"] is None or (columns["amount"] is None and columns["credit"] is None):
+        raise StatementError("CSV statements need a date column and an amount or credit column.")
+
+    entries = []
+    for row_number, row in enumerate(reader, start=2):
+        where = f"Row {row_number}"
+        try:
+            posted = date.fromisoformat((row[columns["date"]] or "").strip())
+        except ValueError:
+            raise StatementError(f"{where}: {row[columns['date']]!r} is not a YYYY-MM-DD date.")
+        if columns["amount"] is not None:
+            amount = _parse_amount(row[columns["amount"]], where)
+        else:
+            amount = _parse_amount(row[columns["credit"]], where)
+            if columns["debit"] is not None:
+                amount -= abs(_parse_amount(row[columns["debit"]], where))
+        text = {key: (row[column] or "").strip() if column else "" for key, column in columns.items()}
+        entries.append(
+            StatementEntry(
+                date=posted,
+                amount=amount,
+                reference=text["reference"],
+                counterparty=text["counterparty"],
+                description=text["description"],
+                transaction_id=text["transaction_id"],
+            )
+        )
+    return entries
+
+
+_OFX_TRANSACTION = re.compile(r"<STMTTRN>(.*?)(?:</STMTTRN>|(?=<STMTTRN>)|(?=</BANKTRANLIST>))", re.S | re.I)
+_OFX_FIELD = re.compile(r"<([A-Z0-9.]+)>([^<\r\n]*)", re.I)
+
+
+def parse_ofx_statement(content: str) -> list[StatementEntry]:
+    """Read `STMTTRN` records from OFX 1.x (SGML) or 2.x (XML) statements."""
+    entries = []
+    for number, block in enumerate(_OFX_TRANSACTION.findall(content), start=1):
+        fields = {tag.upper(): value.strip() for tag, value in _OFX_FIELD.findall(block)}
+        where = f"Transaction {number}"
+        try:
+            posted = datetime.strptime(fields.get("DTPOSTED", "")[:8], "%Y%m%d").date()
+        except ValueError:
+            raise StatementError(f"{where}: DTPOSTED {fields.get('DTPOSTED')!r} is not a date.")
+        entries.append(
+            StatementEntry(
+                date=posted,
+                amount=_parse_amount(fields.get("TRNAMT", ""), where),
+                reference=fields.get("REFNUM") or fields.get("CHECKNUM", ""),
+                counterparty=fields.get("NAME", ""),
+                description=fields.get("MEMO", ""),
+                transaction_id=fields.get("FITID", ""),
+            )
+        )
+    if not entries and "<OFX>" not in content.upper():
+        raise StatementError("Not an OFX statement.")
+    return entries
+
+
+STATEMENT_PARSERS: dict[str, Callable[[str], list[StatementEntry]]] = {
+    BankStatement.Format.CSV: parse_csv_statement,
+    BankStatement.Format.OFX: parse_ofx_statement,
+}
+
+
+def _match_key(text: str) -> str:
+    return re.sub(r"[^A-Z0-9]", "", text.upper())
+
+
+def _one_deletion_variants(key: str) -> set[str]:
+    return {key} | {key[:index] + key[index + 1 :] for index in range(len(key))}
+
+
+_REFERENCE_TOKEN = re.compile(r"[A-Za-z0-9][A-Za-z0-9/_.-]*[A-Za-z0-9]")
+
+
+@dataclass
+class OpenInvoice:
+    pk: int
+    number: str
+    customer_id: int
+    currency: str
+    open_balance: Decimal
+
+
+@dataclass(frozen=True)
+class StatementMatch:
+    invoice: OpenInvoice
+    rule: str
+    confidence: Decimal
+
+
+class StatementMatcher:
+    """Matches statement credits to open invoices from in-memory indexes, so a statement of
+    any size costs one query for the invoices and one for customer names.
+
+    Rules, strongest first: an invoice number in the reference or description, the payer's
+    customer plus the exact open amount, a unique open amount, the payer's only open invoice,
+    then a fuzzy invoice number. Matched amounts are taken off the in-memory balances so two
+    lines cannot both claim the last of an invoice's balance.
+    """
+
+    def __init__(self, invoices: Iterable[OpenInvoice], customer_names: dict[int, str]) -> None:
+        self.by_number: dict[str, OpenInvoice] = {}
+        self.by_amount: defaultdict[tuple[str, Decimal], list[OpenInvoice]] = defaultdict(list)
+        self.by_customer: defaultdict[int, list[OpenInvoice]] = defaultdict(list)
+        # Symmetric-delete index: keys one edit apart share a variant, so fuzzy lookups skip the full scan.
+        self.numbers_by_variant: defaultdict[str, set[str]] = defaultdict(set)
+        for invoice in invoices:
+            key = _match_key(invoice.number)
+            self.by_number[key] = invoice
+            for variant in _one_deletion_variants(key):
+                self.numbers_by_variant[variant].add(key)
+            self.by_amount[(invoice.currency, invoice.open_balance)].append(invoice)
+            self.by_customer[invoice.customer_id].append(invoice)
+        self.customers_by_name: defaultdict[str, list[int]] = defaultdict(list)
+        for customer_id, name in customer_names.items():
+            if customer_id in self.by_customer:
+                self.customers_by_name[_match_key(name)].append(customer_id)
+        self.cutoff = settings.BANK_MATCH_FUZZY_CUTOFF
+
+    @classmethod
+    def for_open_invoices(cls) -> StatementMatcher:
+        rows = (
+            Invoice.objects.with_balances()
+            .exclude(status__in=[Invoice.Status.DRAFT, Invoice.Status.VOID])
+            .filter(open_balance__gt=0)
+            .order_by("due_date", "pk")
+            .values_list("pk", "number", "customer_id", "currency", "open_balance")
+        )
+        invoices = [OpenInvoice(*row) for row in rows]
+        customer_ids = {invoice.customer_id for invoice in invoices}
+        names = dict(Customer.objects.filter(pk__in=customer_ids).values_list("pk", "name"))
+        return cls(invoices, names)
+
+    def match(self, line: BankStatementLine, currency: str) -> StatementMatch | None:
+        amount = line.amount
+        if amount <= 0:
+            return None
+        text = f"{line.reference} {line.description}"
+        tokens = [_match_key(token) for token in _REFERENCE_TOKEN.findall(text)]
+        tokens.append(_match_key(line.reference))
+
+        def fits(invoice: OpenInvoice) -> bool:
+            return invoice.currency == currency and amount <= invoice.open_balance
+
+        for token in tokens:
+            invoice = self.by_number.get(token)
+            if invoice is not None and fits(invoice):
+                return self._take(invoice, amount, "reference", "1.00")
+
+        customer_ids = self._customers(line.counterparty)
+        exact = [invoice for invoice in self.by_amount.get((currency, amount), ()) if invoice.open_balance == amount]
+        for invoice in exact:
+            if invoice.customer_id in customer_ids:
+                return self._take(invoice, amount, "amount_customer", "0.90")
+        if len(exact) == 1:
+            return self._take(exact[0], amount, "amount", "0.75")
+        if len(customer_ids) == 1:
+            candidates = [invoice for invoice in self.by_customer[next(iter(customer_ids))] if invoice.open_balance > 0]
+            if len(candidates) == 1 and fits(candidates[0]):
+                return self._take(candidates[0], amount, "customer", "0.70")
+
+        for token in tokens:
+            if not any(char.isdigit() for char in token):
+                continue
+            nearby = set()
+            for variant in _one_deletion_variants(token):
+                nearby.update(self.numbers_by_variant.get(variant, ()))
+            for key in difflib.get_close_matches(token, sorted(nearby), n=3, cutoff=self.cutoff):
+                if fits(self.by_number[key]):
+                    return self._take(self.by_number[key], amount, "fuzzy_reference", "0.60")
+        return None
+
+    def _customers(self, counterparty: str) -> set[int]:
+        key = _match_key(counterparty)
+        if not key:
+            return set()
+        if key in self.customers_by_name:
+            return set(self.customers_by_name[key])
+        close = difflib.get_close_matches(key, list(self.customers_by_name), n=1, cutoff=self.cutoff)
+        return set(self.customers_by_name[close[0]]) if close else set()
+
+    def _take(self, invoice: OpenInvoice, amount: Decimal, rule: str, confidence: str) -> StatementMatch:
+        self.by_amount[(invoice.currency, invoice.open_balance)].remove(invoice)
+        invoice.open_balance -= amount
+        if invoice.open_balance > 0:
+            self.by_amount[(invoice.currency, invoice.open_balance)].append(invoice)
+        return StatementMatch(invoice, rule, Decimal(confidence))
+
+    def match_lines(self, lines: Iterable[BankStatementLine], currency: str) -> list[BankStatementLine]:
+        """Set `invoice`, `match_rule`, `confidence` and `status` on each line; returns the lines changed."""
+        changed = []
+        for line in lines:
+            found = self.match(line, currency)
+            if found is None:
+                if line.status != BankStatementLine.Status.UNMATCHED:
+                    line.status, line.invoice_id, line.match_rule, line.confidence = BankStatementLine.Status.UNMATCHED, None, "", None
+                    changed.append(line)
+                continue
+            line.status = BankStatementLine.Status.SUGGESTED
+            line.invoice_id = found.invoice.pk
+            line.match_rule = found.rule
+            line.confidence = found.confidence
+            changed.append(line)
+        return changed
+
+
+def lock_invoice_balances(condition: Q) -> list[Invoice]:
+    """Lock the invoices matching `condition` (which may use `open_balance`), then load their balances.
+
+    The balances are read by a second statement: one that waited on a lock still sees the
+    snapshot it started with, and would miss payments the lock holder just committed.
+    """
+    invoices = Invoice.objects.with_balances()
+    ids = lock_rows(invoices.filter(condition).order_by("pk").values_list("pk", flat=True), "invoicing.invoice")
+    return list(invoices.filter(condition, pk__in=ids).order_by("pk"))
+
+
+def insert_payments(payments: list[Payment]) -> tuple[list[Payment], list[int]]:
+    """Bulk-insert payments whose invoices the caller has locked and re-sync those invoices' statuses.
+
+    Returns the saved payments and the ids of invoices whose status changed.
+    """
+    payments = Payment.objects.bulk_create(payments, batch_size=1000)
+    record_changes(ChangeEvent.Action.CREATED, payments)
+    paid_ids = {payment.invoice_id for payment in payments}
+    changed = Invoice.objects.filter(pk__in=paid_ids).sync_statuses()
+    Invoice.objects.filter(pk__in=paid_ids).exclude(pk__in=changed).update(updated_at=timezone.now())
+    record_changes(ChangeEvent.Action.UPDATED, Invoice.objects.filter(pk__in=changed))
+    return payments, changed
+
+
+def _statement_lines_to_match(statement: BankStatement):
+    return statement.lines.filter(
+        status__in=[BankStatementLine.Status.UNMATCHED, BankStatementLine.Status.SUGGESTED], amount__gt=0
+    ).order_by("line_number")
+
+
+def match_statement(statement: BankStatement) -> int:
+    """Re-run the matcher over the statement's unconfirmed credits; returns how many lines got a suggestion."""
+    changed = StatementMatcher.for_open_invoices().match_lines(_statement_lines_to_match(statement), statement.currency)
+    BankStatementLine.objects.bulk_update(changed, ["status", "invoice", "match_rule", "confidence"], batch_size=1000)
+    return sum(1 for line in changed if line.status == BankStatementLine.Status.SUGGESTED)
+
+
+def import_statement(
+    name: str, format: str, content: str, user, currency: str | None = None, auto_confirm: bool = False
+) -> BankStatement:
+    try:
+        entries = STATEMENT_PARSERS[format](content)
+    except KeyError:
+        raise StatementError(f"Unsupported statement format {format!r}.")
+    if not entries:
+        raise StatementError("The statement has no transactions.")
+    with transaction.atomic():
+        statement = BankStatement.objects.create(
+            name=name, format=format, currency=(currency or settings.BASE_CURRENCY).upper(), created_by=user
+        )
+        BankStatementLine.objects.bulk_create(
+            (
+                BankStatementLine(
+                    statement=statement,
+                    line_number=number,
+                    date=entry.date,
+                    amount=entry.amount,
+                    reference=entry.reference[:255],
+                    counterparty=entry.counterparty[:255],
+                    description=entry.description,
+                    transaction_id=entry.transaction_id[:255],
+                )
+                for number, entry in enumerate(entries, start=1)
+            ),
+            batch_size=1000,
+        )
+        match_statement(statement)
+    if auto_confirm:
+        confident = statement.lines.filter(
+            status=BankStatementLine.Status.SUGGESTED, confidence__gte=settings.BANK_MATCH_AUTO_CONFIRM
+        )
+        apply_statement_lines(list(confident.values_list("pk", flat=True)), user)
+    return statement
+
+
+@dataclass
+class ApplyResult:
+    payments: list[Payment] = field(default_factory=list)
+    skipped: dict[int, str] = field(default_factory=dict)
+    invoices_updated: list[int] = field(default_factory=list)
+
+
+def apply_statement_lines(line_ids: Iterable[int], user) -> ApplyResult:
+    """Turn suggested statement lines into payments in one transaction.
+
+    The invoices are locked like single payments lock them, balances are re-checked
+    against the database, payments are bulk-inserted and the invoices' statuses are
+    recomputed set-wise. Lines that would over-apply an invoice are skipped.
+    """
+    result = ApplyResult()
+    with transaction.atomic():
+        candidates = lock_rows(
+            BankStatementLine.objects.filter(pk__in=list(line_ids)).select_related("statement").order_by("pk"),
+            "invoicing.bank_statement_line",
+        )
+        invoice_ids = {line.invoice_id for line in candidates if line.invoice_id}
+        invoices = {
+            invoice.pk: (invoice.pk, invoice.status, invoice.currency, invoice.open_balance)
+            for invoice in lock_invoice_balances(Q(pk__in=invoice_ids))
+        }
+
+        applied = []
+        for line in sorted(candidates, key=lambda line: (line.statement_id, line.line_number)):
+            if line.status != BankStatementLine.Status.SUGGESTED or line.payment_id:
+                result.skipped[line.pk] = f"Line is {line.status}."
+                continue
+            pk, status, currency, open_balance = invoices.get(line.invoice_id, (None, None, None, None))
+            if pk is None or status == Invoice.Status.VOID:
+                result.skipped[line.pk] = "Invoice is void or missing."
+            elif currency != line.statement.currency:
+                result.skipped[line.pk] = f"Invoice is in {currency}, the statement in {line.statement.currency}."
+            elif line.amount <= 0 or line.amount > open_balance:
+                result.skipped[line.pk] = f"Amount exceeds the invoice's open balance of {open_balance}."
+            else:
+                invoices[pk] = (pk, status, currency, open_balance - line.amount)
+                line.payment = Payment(
+                    invoice_id=pk,
+                    date=line.date,
+                    amount=line.amount,
+                    method="bank transfer",
+                    reference=(line.reference or line.transaction_id)[:64],
+                    notes=f"Bank statement {line.statement_id}, line {line.line_number}",
+                )
+                applied.append(line)
+        if not applied:
+            return result
+
+        result.payments, result.invoices_updated = insert_payments([line.payment for line in applied])
+        for line in applied:
+            line.payment_id = line.payment.pk
+            line.status = BankStatementLine.Status.MATCHED
+        BankStatementLine.objects.bulk_update(applied, ["payment", "status"], batch_size=1000)
+    return result
+
+
+class RemittanceError(Exception):
+    def __init__(self, message: str, errors: dict[int, str] | None = None) -> None:
+        super().__init__(message)
+        # Remittance index -> problem, for errors tied to particular remittances.
+        self.errors = errors or {}
+
+
+@dataclass
+class Remittance:
+    customer_id: int
+    amount: Decimal
+    date: date
+    method: str = ""
+    reference: str = ""
+    # Explicit invoice id -> amount; whatever is left is spread over the customer's other open invoices.
+    allocations: dict[int, Decimal] = field(default_factory=dict)
+
+
+@dataclass
+class RemittanceResult:
+    remittance: Remittance
+    payments: list[Payment] = field(default_factory=list)
+    unapplied: Decimal = Decimal("0")
+
+
+_OPEN_FOR_PAYMENT = Q(open_balance__gt=0) & ~Q(status__in=[Invoice.Status.DRAFT, Invoice.Status.VOID])
+
+
+def allocate_remittances(remittances: list[Remittance]) -> tuple[list[RemittanceResult], list[int]]:
+    """Turn lump-sum remittances into payments: explicit allocations first, then the
+    customer's open invoices oldest due date first.
+
+    All remittances' invoices are locked and their balances read in one query, the
+    payments are bulk-inserted and statuses re-synced set-wise. Either every remittance
+    is applied or, when any of them is invalid, none is and `RemittanceError` lists why.
+    Amounts that exceed the customer's open invoices are reported as `unapplied`.
+    """
+    customer_ids = {remittance.customer_id for remittance in remittances}
+    explicit_ids = {invoice_id for remittance in remittances for invoice_id in remittance.allocations}
+    errors: dict[int, str] = {}
+    results = []
+    known = set(Customer.objects.filter(pk__in=customer_ids).values_list("pk", flat=True))
+    for index, remittance in enumerate(remittances):
+        if remittance.customer_id not in known:
+            errors[index] = f"Customer {remittance.customer_id} does not exist."
+    with transaction.atomic():
+        locked = lock_invoice_balances((Q(customer_id__in=customer_ids) & _OPEN_FOR_PAYMENT) | Q(pk__in=explicit_ids))
+        balances = {invoice.pk: invoice.open_balance for invoice in locked}
+        by_pk = {invoice.pk: invoice for invoice in locked}
+        oldest_first: defaultdict[int, list[Invoice]] = defaultdict(list)
+        for invoice in sorted(locked, key=lambda invoice: (invoice.due_date, invoice.issue_date, invoice.pk)):
+            if invoice.open_balance > 0 and invoice.status not in (Invoice.Status.DRAFT, Invoice.Status.VOID):
+                oldest_first[invoice.customer_id].append(invoice)
+
+        payments: list[Payment] = []
+        for index, remittance in enumerate(remittances):
+            result = RemittanceResult(remittance)
+            results.append(result)
+            if index in errors:
+                continue
+
+            def pay(invoice_id: int, amount: Decimal) -> None:
+                amount = amount.quantize(CENT)
+                balances[invoice_id] -= amount
+                result.payments.append(
+                    Payment(
+                        invoice_id=invoice_id,
+                        date=remittance.date,
+                        amount=amount,
+                        method=remittance.method,
+                        reference=remittance.reference[:64],
+                    )
+                )
+
+            remaining = remittance.amount
+            for invoice_id, amount in remittance.allocations.items():
+                invoice = by_pk.get(invoice_id)
+                if invoice is None or invoice.status == Invoice.Status.VOID:
+                    errors[index] = f"Invoice {invoice_id} does not exist or is void."
+                elif invoice.customer_id != remittance.customer_id:
+                    errors[index] = f"Invoice {invoice.number} belongs to another customer."
+                elif amount > balances[invoice_id]:
+                    errors[index] = f"{amount} exceeds the open balance of {balances[invoice_id]:.2f} on {invoice.number}."
+                elif amount > remaining:
+                    errors[index] = "Allocations add up to more than the remittance."
+                else:
+                    pay(invoice_id, amount)
+                    remaining -= amount
+                    continue
+                break
+            if index in errors:
+                continue
+            for invoice in oldest_first[remittance.customer_id]:
+                if remaining <= 0:
+                    break
+                amount = min(remaining, balances[invoice.pk])
+                if amount > 0:
+                    pay(invoice.pk, amount)
+                    remaining -= amount
+            result.unapplied = remaining
+            payments.extend(result.payments)
+        if errors:
+            message = "; ".join(f"Remittance {index + 1}: {detail}" for index, detail in sorted(errors.items()))
+            raise RemittanceError(message, errors)
+        if not payments:
+            return results, []
+        # bulk_create sets the primary keys on the same objects the results hold.
+        _, changed = insert_payments(payments)
+    return results, changed
+
+
+def parse_remittance_csv(content: str, default_date: date) -> list[Remittance]:
+    """Rows have `customer` (id or email) and `amount`, optionally `date`, `reference`, `method`
+    and `invoice` (a number the whole amount goes to). Customers and invoices are resolved
+    with one query each."""
+    reader = csv.DictReader(io.StringIO(content))
+    rows = [{(key or "").strip().lower(): (value or "").strip() for key, value in row.items()} for row in reader]
+    if not rows:
+        raise RemittanceError("The remittance file has no rows.")
+    if not {"customer", "amount"} <= set(rows[0]):
+        raise RemittanceError("Remittance files need customer and amount columns.")
+    emails = {row["customer"].lower() for row in rows if not row["customer"].isdigit()}
+    ids = {int(row["customer"]) for row in rows if row["customer"].isdigit()}
+    customers = Customer.objects.filter(Q(email__in=emails) | Q(pk__in=ids)).values_list("pk", "email")
+    customers_by_email, customer_ids = {}, set()
+    for pk, email in customers:
+        customers_by_email[email.lower()] = pk
+        customer_ids.add(pk)
+    numbers = {row["invoice"] for row in rows if row.get("invoice")}
+    invoices_by_number = dict(Invoice.objects.filter(number__in=numbers).values_list("number", "pk")) if numbers else {}
+
+    remittances = []
+    for row_number, row in enumerate(rows, start=2):
+        where = f"Row {row_number}"
+        customer = row["customer"]
+        if customer.isdigit():
+            customer_id = int(customer)
+            if customer_id not in customer_ids:
+                raise RemittanceError(f"{where}: no customer {customer_id}.")
+        else:
+            customer_id = customers_by_email.get(customer.lower())
+            if customer_id is None:
+                raise RemittanceError(f"{where}: no customer with email {customer!r}.")
+        try:
+            amount = _parse_amount(row["amount"], where)
+        except StatementError as exc:
+            raise RemittanceError(str(exc))
+        if amount <= 0:
+            raise RemittanceError(f"{where}: amount must be greater than zero.")
+        try:
+            paid_on = date.fromisoformat(row["date"]) if row.get("date") else default_date
+        except ValueError:
+            raise RemittanceError(f"{where}: {row['date']!r} is not a YYYY-MM-DD date.")
+        allocations = {}
+        if row.get("invoice"):
+            if row["invoice"] not in invoices_by_number:
+                raise RemittanceError(f"{where}: no invoice {row['invoice']!r}.")
+            allocations[invoices_by_number[row["invoice"]]] = amount
+        remittances.append(
+            Remittance(
+                customer_id=customer_id,
+                amount=amount,
+                date=paid_on,
+                method=row.get("method", ""),
+                reference=row.get("reference", ""),
+                allocations=allocations,
+            )
+        )
+    return remittances
+
+
+class PostingError(Exception):
+    pass
+
+
+@dataclass
+class _PostingLine:
+    base: Decimal = Decimal("0")
+    foreign: Decimal = Decimal("0")
+    references: list = field(default_factory=list)
+
+
+class _EntryDraft:
+    """Sums documents into one line per account, side and currency."""
+
+    def __init__(self, batch: PostingBatch, reference_key: str) -> None:
+        self.batch = batch
+        self.reference_key = reference_key
+        self.document_count = 0
+        self.lines: defaultdict[tuple[int, str, str], _PostingLine] = defaultdict(_PostingLine)
+
+    def add(self, account_id: int, side: str, currency: str, base: Decimal, foreign: Decimal | None, reference) -> None:
+        line = self.lines[(account_id, side, currency if foreign is not None else "")]
+        line.base += base
+        line.foreign += foreign or Decimal("0")
+        line.references.append(reference)
+
+    def journal_lines(self) -> list[JournalLine]:
+        lines = []
+        for (account_id, side, currency), line in sorted(self.lines.items()):
+            if not line.base:
+                continue
+            signed_foreign = line.foreign if side == "debit" else -line.foreign
+            lines.append(
+                JournalLine(
+                    account_id=account_id,
+                    debit=line.base if side == "debit" else Decimal("0"),
+                    credit=line.base if side == "credit" else Decimal("0"),
+                    dimensions={
+                        "posting_batch": self.batch.pk,
+                        "document_count": len(line.references),
+                        self.reference_key: line.references,
+                    },
+                    currency=currency,
+                    amount_currency=signed_foreign if currency else None,
+                    # Documents booked at different rates share a line, so this is their blended rate.
+                    fx_rate=(line.base / line.foreign).quantize(FX_RATE_PLACES) if currency and line.foreign else None,
+                )
+            )
+        return lines
+
+
+def _posting_rules(document_type: str) -> dict[str, PostingRule]:
+    rules = {
+        rule.payment_method: rule
+        for rule in PostingRule.objects.filter(document_type=document_type, is_active=True)
+    }
+    if "" not in rules and (document_type == PostingRule.DocumentType.INVOICE or not rules):
+        raise PostingError(f"No active {document_type} posting rule.")
+    return rules
+
+
+def post_documents(document_type: str, up_to: date, user, group_by: str = PostingBatch.GroupBy.DAY) -> PostingBatch | None:
+    """Post every unposted invoice (by issue date) or payment (by date) up to `up_to` to the ledger.
+
+    Documents are summarized into one entry per document date, or one entry dated
+    `up_to` for the whole run, with a line per rule account and currency that lists
+    the documents in its dimensions. Foreign-currency payments relieve receivables at
+    the invoice's booking rate and book the difference as realized FX gain or loss.
+    """
+    from apps.ledger.signals import entries_posted
+
+    base_currency = settings.BASE_CURRENCY
+    rules = _posting_rules(document_type)
+    is_invoice = document_type == PostingRule.DocumentType.INVOICE
+    rates = fx_rates()
+    gain_loss = None
+
+    with transaction.atomic():
+        if is_invoice:
+            documents = lock_rows(
+                Invoice.objects.with_balances()
+                .filter(posting_batch__isnull=True, issue_date__lte=up_to)
+                .exclude(status__in=[Invoice.Status.DRAFT, Invoice.Status.VOID])
+                .order_by("pk"),
+                "invoicing.invoice",
+            )
+        else:
+            documents = lock_rows(
+                Payment.objects.select_related("invoice").filter(posting_batch__isnull=True, date__lte=up_to).order_by("pk"),
+                "invoicing.payment",
+            )
+        if not documents:
+            return None
+
+        def entry_date(document) -> date:
+            if group_by == PostingBatch.GroupBy.RUN:
+                return up_to
+            return document.issue_date if is_invoice else document.date
+
+        ensure_periods_open(*{entry_date(document) for document in documents})
+        batch = PostingBatch.objects.create(
+            document_type=document_type, group_by=group_by, up_to=up_to, document_count=len(documents), created_by=user
+        )
+        drafts: dict[date, _EntryDraft] = {}
+        for document in documents:
+            draft = drafts.setdefault(entry_date(document), _EntryDraft(batch, "invoices" if is_invoice else "payments"))
+            draft.document_count += 1
+            if is_invoice:
+                rule = rules[""]
+                foreign, base = None, document.total_amount
+                if document.currency != base_currency:
+                    # Invoices from before fx_rate was stored book at the rate on their issue date, as their payments do.
+                    booked_rate = document.fx_rate or rates.rate(document.currency, base_currency, document.issue_date)
+                    if booked_rate is None:
+                        raise PostingError(f"No {document.currency}/{base_currency} rate for invoice {document.number}.")
+                    foreign, base = document.total_amount, (document.total_amount * booked_rate).quantize(CENT)
+                draft.add(rule.debit_account_id, "debit", document.currency, base, foreign, document.number)
+                draft.add(rule.credit_account_id, "credit", document.currency, base, foreign, document.number)
+                continue
+
+            rule = rules.get(document.method) or rules.get("")
+            if rule is None:
+                raise PostingError(f"No posting rule for {document.method!r} payments and no default payment rule.")
+            invoice = document.invoice
+            reference = f"{invoice.number}/{document.pk}"
+            if invoice.currency == base_currency:
+                draft.add(rule.debit_account_id, "debit", "", document.amount, None, reference)
+                draft.add(rule.credit_account_id, "credit", "", document.amount, None, reference)
+                continue
+            booked_rate = invoice.fx_rate or rates.rate(invoice.currency, base_currency, invoice.issue_date)
+            settled_rate = rates.rate(invoice.currency, base_currency, document.date) or booked_rate
+            if booked_rate is None:
+                raise PostingError(f"No {invoice.currency}/{base_currency} rate for payment {document.pk}.")
+            received = (document.amount * settled_rate).quantize(CENT)
+            relieved = (document.amount * booked_rate).quantize(CENT)
+            draft.add(rule.debit_account_id, "debit", invoice.currency, received, document.amount, reference)
+            draft.add(rule.credit_account_id, "credit", invoice.currency, relieved, document.amount, reference)
+            if received != relieved:
+                if gain_loss is None:
+                    gain_loss = chart_of_accounts().get_by_code(settings.FX_GAIN_LOSS_ACCOUNT_CODE)
+                    if gain_loss is None:
+                        raise PostingError(f"Account {settings.FX_GAIN_LOSS_ACCOUNT_CODE} (FX gain/loss) must exist.")
+                side = "credit" if received > relieved else "debit"
+                draft.add(gain_loss.id, side, "", abs(received - relieved), None, reference)
+
+        label = "Invoices" if is_invoice else "Payments"
+        entries, lines = [], []
+        for posted_on, draft in sorted(drafts.items()):
+            draft_lines = draft.journal_lines()
+            if not draft_lines:
+                continue
+            entry = JournalEntry(
+                date=posted_on,
+                memo=f"{label} posted in batch {batch.pk} ({draft.document_count} documents)",
+                status=JournalEntry.Status.POSTED,
+                created_by=user,
+                approved_by=user,
+            )
+            entries.append(entry)
+            lines.append(draft_lines)
+        entries = JournalEntry.objects.bulk_create(entries)
+        for entry, entry_lines in zip(entries, lines):
+            for line in entry_lines:
+                line.entry = entry
+        created_lines = JournalLine.objects.bulk_create([line for entry_lines in lines for line in entry_lines], batch_size=1000)
+        batch.entries.set(entries)
+        model = Invoice if is_invoice else Payment
+        model.objects.filter(pk__in=[document.pk for document in documents]).update(posting_batch=batch)
+        record_changes(ChangeEvent.Action.CREATED, entries)
+        record_changes(ChangeEvent.Action.CREATED, created_lines)
+        if entries:
+            entries_posted.send(sender=JournalEntry, entry_ids=[entry.pk for entry in entries])
+    return batch
+
+
+_STATEMENT_COLUMNS = ["customer_id", "customer", "currency", "date", "type", "reference", "invoice", "charges", "credits", "balance"]
+
+
+@dataclass
+class StatementActivity:
+    date: date
+    kind: str  # opening, invoice, payment or closing
+    reference: str
+    invoice_number: str
+    charges: Decimal
+    credits: Decimal
+    balance: Decimal = Decimal("0")
+
+
+@dataclass
+class CustomerStatement:
+    """One customer's activity in one invoice currency between `start` and `end`."""
+
+    customer_id: int
+    customer_name: str
+    customer_email: str
+    billing_address: str
+    currency: str
+    start: date
+    end: date
+    opening_balance: Decimal = Decimal("0")
+    activity: list[StatementActivity] = field(default_factory=list)
+
+    @property
+    def invoiced(self) -> Decimal:
+        return sum((item.charges for item in self.activity), Decimal("0"))
+
+    @property
+    def paid(self) -> Decimal:
+        return sum((item.credits for item in self.activity), Decimal("0"))
+
+    @property
+    def closing_balance(self) -> Decimal:
+        return self.opening_balance + self.invoiced - self.paid
+
+
+def customer_statements(start: date, end: date, first_id: int | None = None, last_id: int | None = None) -> list[CustomerStatement]:
+    """Statements for customers with ids in `first_id`..`last_id`, one per customer and invoice currency.
+
+    Uses five grouped queries however many customers the range holds. Customers with no
+    opening balance and no activity in the period get no statement.
+    """
+    scope = ~Q(status__in=[Invoice.Status.DRAFT, Invoice.Status.VOID])
+    if first_id is not None:
+        scope &= Q(customer_id__gte=first_id)
+    if last_id is not None:
+        scope &= Q(customer_id__lte=last_id)
+    invoices = Invoice.objects.filter(scope)
+    payments = Payment.objects.filter(invoice__in=invoices)
+
+    opening: defaultdict[tuple[int, str], Decimal] = defaultdict(Decimal)
+    charged_before = (
+        InvoiceLine.objects.filter(invoice__in=invoices.filter(issue_date__lt=start))
+        .values("invoice__customer_id", "invoice__currency")
+        .annotate(total=Sum("amount"))
+        .order_by()
+        .values_list("invoice__customer_id", "invoice__currency", "total")
+    )
+    for customer_id, currency, total in charged_before:
+        opening[customer_id, currency] += total or 0
+    paid_before = (
+        payments.filter(date__lt=start)
+        .values("invoice__customer_id", "invoice__currency")
+        .annotate(total=Sum("amount"))
+        .order_by()
+        .values_list("invoice__customer_id", "invoice__currency", "total")
+    )
+    for customer_id, currency, total in paid_before:
+        opening[customer_id, currency] -= total or 0
+
+    # Charges sort before credits on the same day so a same-day payment never shows a negative balance.
+    activity: defaultdict[tuple[int, str], list[tuple]] = defaultdict(list)
+    charged = (
+        invoices.filter(issue_date__range=(start, end))
+        .annotate(total=Sum("line_items__amount"))
+        .values_list("customer_id", "currency", "pk", "issue_date", "number", "total")
+    )
+    for customer_id, currency, pk, issued, number, total in charged:
+        activity[customer_id, currency].append(
+            (issued, 0, pk, StatementActivity(issued, "invoice", number, number, (total or Decimal("0")).quantize(CENT), Decimal("0")))
+        )
+    paid = payments.filter(date__range=(start, end)).values_list(
+        "invoice__customer_id", "invoice__currency", "pk", "date", "reference", "invoice__number", "amount"
+    )
+    for customer_id, currency, pk, paid_on, reference, number, amount in paid:
+        activity[customer_id, currency].append(
+            (paid_on, 1, pk, StatementActivity(paid_on, "payment", reference, number, Decimal("0"), amount.quantize(CENT)))
+        )
+
+    keys = sorted({key for key, balance in opening.items() if balance} | set(activity))
+    customers = Customer.objects.all()
+    if first_id is not None:
+        customers = customers.filter(pk__gte=first_id)
+    if last_id is not None:
+        customers = customers.filter(pk__lte=last_id)
+    wanted = {customer_id for customer_id, _ in keys}
+    details = {
+        pk: (name, email, address)
+        for pk, name, email, address in customers.values_list("pk", "name", "email", "billing_address")
+        if pk in wanted
+    }
+    statements = []
+    for customer_id, currency in keys:
+        name, email, address = details[customer_id]
+        statement = CustomerStatement(
+            customer_id, name, email, address, currency, start, end, opening[customer_id, currency].quantize(CENT)
+        )
+        balance = statement.opening_balance
+        for *_, item in sorted(activity[customer_id, currency], key=lambda row: row[:3]):
+            balance += item.charges - item.credits
+            item.balance = balance
+            statement.activity.append(item)
+        statements.append(statement)
+    return statements
+
+
+def statement_partitions(size: int, customer_ids: Iterable[int] | None = None) -> list[tuple[int, int]]:
+    """Split customers into id ranges of about `size` customers each."""
+    ids = sorted(customer_ids) if customer_ids is not None else list(Customer.objects.order_by("pk").values_list("pk", flat=True))
+    return [(ids[index], ids[min(index + size, len(ids)) - 1]) for index in range(0, len(ids), size)]
+
+
+def iter_customer_statements(start: date, end: date, partition_size: int = 1000) -> Iterator[CustomerStatement]:
+    """Yield every customer's statements one id partition at a time so memory stays bounded."""
+    for first_id, last_id in statement_partitions(partition_size):
+        yield from customer_statements(start, end, first_id, last_id)
+
+
+def _statement_rows(statement: CustomerStatement) -> Iterator[StatementActivity]:
+    yield StatementActivity(statement.start, "opening", "", "", Decimal("0"), Decimal("0"), statement.opening_balance)
+    yield from statement.activity
+    yield StatementActivity(statement.end, "closing", "", "", statement.invoiced, statement.paid, statement.closing_balance)
+
+
+class _Echo:
+    def write(self, value: str) -> str:
+        return value
+
+
+def render_statements_csv(statements: Iterable[CustomerStatement]) -> Iterator[str]:
+    """Yield CSV text row by row, with opening and closing rows around each statement's activity."""
+    writer = csv.writer(_Echo())
+    yield writer.writerow(_STATEMENT_COLUMNS)
+    for statement in statements:
+        for row in _statement_rows(statement):
+            yield writer.writerow(
+                [
+                    statement.customer_id,
+                    statement.customer_name,
+                    statement.currency,
+                    row.date.isoformat(),
+                    row.kind,
+                    row.reference,
+                    row.invoice_number,
+                    row.charges,
+                    row.credits,
+                    row.balance,
+                ]
+            )
+
+
+_STATEMENT_HTML_HEAD = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>{title}</title>
+<style>
+body {{ font-family: sans-serif; font-size: 12px; }}
+.statement {{ page-break-after: always; margin-bottom: 32px; }}
+table {{ border-collapse: collapse; width: 100%; }}
+th, td {{ border-bottom: 1px solid #ddd; padding: 4px; text-align: left; }}
+td.amount, th.amount {{ text-align: right; }}
+</style></head><body>
+"""
+
+_STATEMENT_LABELS = {
+    "opening": "Opening balance",
+    "invoice": "Invoice",
+    "payment": "Payment",
+    "closing": "Closing balance",
+}
+
+
+def _render_statement_html(statement: CustomerStatement) -> str:
+    parts = [
+        format_html(
+            '<section class="statement"><h2>Statement for {}</h2><p>{}<br>{}</p><p>{} to {} &middot; {}</p>',
+            statement.customer_name,
+            statement.customer_email,
+            statement.billing_address,
+            statement.start.isoformat(),
+            statement.end.isoformat(),
+            statement.currency,
+        ),
+        '<table><thead><tr><th>Date</th><th>Type</th><th>Reference</th><th>Invoice</th>'
+        '<th class="amount">Charges</th><th class="amount">Credits</th><th class="amount">Balance</th></tr></thead><tbody>',
+    ]
+    for row in _statement_rows(statement):
+        parts.append(
+            format_html(
+                '<tr><td>{}</td><td>{}</td><td>{}</td><td>{}</td><td class="amount">{}</td>'
+                '<td class="amount">{}</td><td class="amount">{}</td></tr>',
+                row.date.isoformat(),
+                _STATEMENT_LABELS[row.kind],
+                row.reference,
+                row.invoice_number,
+                row.charges if row.charges else "",
+                row.credits if row.credits else "",
+                row.balance,
+            )
+        )
+    parts.append("</tbody></table></section>\n")
+    return "".join(parts)
+
+
+def render_statements_html(statements: Iterable[CustomerStatement], title: str = "Customer statements") -> Iterator[str]:
+    """Yield a printable HTML document one statement at a time; each statement starts a new page."""
+    yield _STATEMENT_HTML_HEAD.format(title=escape(title))
+    for statement in statements:
+        yield _render_statement_html(statement)
+    yield "</body></html>\n"
+
+
+STATEMENT_RENDERERS: dict[str, Callable[[Iterable[CustomerStatement]], Iterator[str]]] = {
+    "csv": render_statements_csv,
+    "html": render_statements_html,
+}
+
+
+def _write_statement_partition(job: tuple[date, date, int, int, str, str]) -> tuple[str, int]:
+    start, end, first_id, last_id, output_format, path = job
+    statements = customer_statements(start, end, first_id, last_id)
+    with open(path, "w", encoding="utf-8", newline="") as handle:
+        for chunk in STATEMENT_RENDERERS[output_format](statements):
+            handle.write(chunk)
+    return path, len(statements)
+
+
+def write_customer_statements(
+    start: date,
+    end: date,
+    output_format: str,
+    output_dir: str,
+    workers: int = 1,
+    partition_size: int = 1000,
+    progress: Callable[[str, int], None] | None = None,
+) -> int:
+    """Write every customer's statements to one file per customer partition; returns the statement count."""
+    os.makedirs(output_dir, exist_ok=True)
+    jobs = [
+        (start, end, first_id, last_id, output_format, os.path.join(output_dir, f"statements-{start}-{end}-{index:04d}.{output_format}"))
+        for index, (first_id, last_id) in enumerate(statement_partitions(partition_size), start=1)
+    ]
+    written = 0
+    for path, count in iter_in_processes(_write_statement_partition, jobs, workers):
+        written += count
+        if progress:
+            progress(path, count)
+    return written
+
+
+class DunningError(Exception):
+    pass
+
+
+def _reached_level(levels: list[DunningLevel], as_of: date, attribute: str) -> Case:
+    # Levels are ordered highest first, so the first matching branch is the highest level reached.
+    return Case(
+        *[When(due_date__lte=as_of - timedelta(days=level.days_overdue), then=Value(getattr(level, attribute))) for level in levels],
+        default=None,
+        output_field=IntegerField(),
+    )
+
+
+def run_dunning(as_of: date, user, batch_size: int = 5000) -> DunningRun:
+    """Move overdue open invoices up to the highest active dunning level they have reached.
+
+    One annotated query returns only the invoices that need a new notice. Notices are
+    upserted in bulk, reopening an earlier notice at the same level, and invoices move up
+    with one UPDATE per level and batch. Notices that a higher level supersedes, and open
+    notices for invoices since settled or voided, are closed. Runs lock the active levels
+    first, so overlapping runs take turns and each sees what the previous one did.
+    """
+    with transaction.atomic():
+        levels = lock_rows(DunningLevel.objects.filter(is_active=True).order_by("pk"), "invoicing.dunning")
+        if not levels:
+            raise DunningError("Define at least one active dunning level first.")
+        levels.sort(key=lambda level: level.days_overdue, reverse=True)
+        escalations = list(
+            Invoice.objects.filter(
+                status__in=[Invoice.Status.SENT, Invoice.Status.PARTIALLY_PAID],
+                due_date__lte=as_of - timedelta(days=levels[-1].days_overdue),
+            )
+            .with_balances()
+            .annotate(target_level=_reached_level(levels, as_of, "pk"), target_days=_reached_level(levels, as_of, "days_overdue"))
+            .filter(Q(dunning_level__isnull=True) | Q(dunning_level__days_overdue__lt=F("target_days")), open_balance__gt=0)
+            .order_by("pk")
+            .values_list("pk", "customer__collector_id", "due_date", "open_balance", "target_level")
+        )
+
+        run = DunningRun.objects.create(as_of=as_of, created_by=user)
+        now = timezone.now()
+        closed = (
+            DunningNotice.objects.filter(status=DunningNotice.Status.OPEN, invoice__status__in=[Invoice.Status.PAID, Invoice.Status.VOID])
+            .update(status=DunningNotice.Status.CLOSED, updated_at=now)
+        )
+        written = 0
+        for offset in range(0, len(escalations), batch_size):
+            batch = escalations[offset : offset + batch_size]
+            invoice_ids = [row[0] for row in batch]
+            closed += DunningNotice.objects.filter(invoice_id__in=invoice_ids, status=DunningNotice.Status.OPEN).update(
+                status=DunningNotice.Status.CLOSED, updated_at=now
+            )
+            # An invoice can already hold a notice at its new level, e.g. after levels were
+            # re-ordered; that notice is reopened for this run rather than skipped.
+            written += len(
+                DunningNotice.objects.bulk_create(
+                    [
+                        DunningNotice(
+                            run=run,
+                            invoice_id=pk,
+                            level_id=level_id,
+                            collector_id=collector_id,
+                            days_overdue=(as_of - due_date).days,
+                            open_balance=Decimal(open_balance).quantize(CENT),
+                        )
+                        for pk, collector_id, due_date, open_balance, level_id in batch
+                    ],
+                    update_conflicts=True,
+                    unique_fields=["invoice", "level"],
+                    update_fields=["run", "collector", "days_overdue", "open_balance", "status", "updated_at"],
+                )
+            )
+            by_level: defaultdict[int, list[int]] = defaultdict(list)
+            for pk, *_, level_id in batch:
+                by_level[level_id].append(pk)
+            for level_id, ids in by_level.items():
+                Invoice.objects.filter(pk__in=ids).update(dunning_level_id=level_id, updated_at=now)
+        run.notices_created = written
+        run.notices_closed = closed
+        run.save(update_fields=["notices_created", "notices_closed"])
+    return run
+
+
+def dunning_worklists(collector_id: int | None = None) -> list[dict]:
+    """Open notices per collector, with counts and open balances per dunning level."""
+    notices = DunningNotice.objects.filter(status=DunningNotice.Status.OPEN)
+    if collector_id is not None:
+        notices = notices.filter(collector_id=collector_id)
+    rows = (
+        notices.values("collector_id", "collector__username", "level_id", "level__name", "level__action", "level__days_overdue")
+        .annotate(notices=Count("pk"), open_balance=Sum("open_balance"))
+        .order_by("collector__username", "level__days_overdue")
+    )
+    worklists: dict[int | None, dict] = {}
+    for row in rows:
+        worklist = worklists.setdefault(
+            row["collector_id"],
+            {
+                "collector": row["collector_id"],
+                "collector_username": row["collector__username"],
+                "notices": 0,
+                "open_balance": Decimal("0"),
+                "levels": [],
+            },
+        )
+        balance = Decimal(row["open_balance"] or 0).quantize(CENT)
+        worklist["notices"] += row["notices"]
+        worklist["open_balance"] += balance
+        worklist["levels"].append(
+            {
+                "level": row["level_id"],
+                "name": row["level__name"],
+                "action": row["level__action"],
+                "notices": row["notices"],
+                "open_balance": str(balance),
+            }
+        )
+    for worklist in worklists.values():
+        worklist["open_balance"] = str(worklist["open_balance"])
+    return list(worklists.values())
@@ -1,14 +1,82 @@
 from __future__ import annotations
 
 from django.db import transaction
-from rest_framework import viewsets
+from django.db.models import Count, ProtectedError, Q
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from rest_framework import status, viewsets
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
 
 from apps.accounts.permissions import IsAdminOrAccountant
+from apps.core.models import ChangeEvent
+from apps.core.services import lock_rows, record_change, run_with_retry
+from apps.core.viewsets import IdempotentCreateMixin
 
 from .filters import InvoiceFilterSet
-from .models import Customer, Invoice, Payment
-from .serializers import CustomerSerializer, InvoiceSerializer, PaymentSerializer
+from apps.ledger.services import PeriodLockedError
+
+from .models import (
+    BankStatement,
+    BankStatementLine,
+    BillingRun,
+    Customer,
+    DunningLevel,
+    DunningNotice,
+    DunningRun,
+    FxRevaluation,
+    Invoice,
+    Payment,
+    PostingBatch,
+    PostingRule,
+)
+from .serializers import (
+    BankStatementImportSerializer,
+    BankStatementLineSerializer,
+    BankStatementSerializer,
+    BulkPaymentSerializer,
+    BillingRunExecuteSerializer,
+    BillingRunSerializer,
+    CustomerSerializer,
+    CustomerStatementQuerySerializer,
+    CustomerStatementSerializer,
+    DunningLevelSerializer,
+    DunningNoticeSerializer,
+    DunningRunRequestSerializer,
+    DunningRunSerializer,
+    FxRevaluationSerializer,
+    InvoiceSerializer,
+    PaymentSerializer,
+    PostingBatchSerializer,
+    PostingRuleSerializer,
+    PostingRunSerializer,
+    RevaluationRunSerializer,
+    StatementConfirmSerializer,
+)
+from .services import (
+    STATEMENT_RENDERERS,
+    BillingRunError,
+    DunningError,
+    PostingError,
+    Remittance,
+    RemittanceError,
+    RevaluationError,
+    StatementError,
+    allocate_remittances,
+    apply_statement_lines,
+    customer_statements,
+    dunning_worklists,
+    import_statement,
+    iter_customer_statements,
+    match_statement,
+    parse_remittance_csv,
+    post_documents,
+    revalue_receivables,
+    run_billing,
+    run_dunning,
+)
 
 
 class CustomerViewSet(viewsets.ModelViewSet):
@@ -18,9 +86,38 @@ class CustomerViewSet(viewsets.ModelViewSet):
     search_fields = ["name", "email"]
     ordering_fields = ["name", "created_at"]
 
+    @staticmethod
+    def _statement_response(statements, output: str, filename: str) -> StreamingHttpResponse:
+        content_type = "text/csv" if output == "csv" else "text/html"
+        response = StreamingHttpResponse(STATEMENT_RENDERERS[output](statements), content_type=f"{content_type}; charset=utf-8")
+        if output == "csv":
+            response["Content-Disposition"] = f'attachment; filename="{filename}.csv"'
+        return response
+
+    @action(detail=True, methods=["get"])
+    def statement(self, request, pk=None):
+        customer = self.get_object()
+        query = CustomerStatementQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        start, end, output = (query.validated_data[key] for key in ("start_date", "end_date", "output"))
+        statements = customer_statements(start, end, customer.pk, customer.pk)
+        if output == "json":
+            return Response(CustomerStatementSerializer(statements, many=True).data)
+        return self._statement_response(statements, output, f"statement-{customer.pk}-{start}-{end}")
+
+    @action(detail=False, methods=["get"])
+    def statements(self, request):
+        query = CustomerStatementQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        start, end, output = (query.validated_data[key] for key in ("start_date", "end_date", "output"))
+        if output == "json":
+            raise ValidationError({"output": "Statements for all customers are streamed as csv or html."})
+        return self._statement_response(iter_customer_statements(start, end), output, f"statements-{start}-{end}")
+
 
-class InvoiceViewSet(viewsets.ModelViewSet):
+class InvoiceViewSet(IdempotentCreateMixin, viewsets.ModelViewSet):
     serializer_class = InvoiceSerializer
+    retry_label = "invoicing.invoice"
     queryset = Invoice.objects.select_related("customer", "created_by").prefetch_related("line_items", "payments")
     permission_classes = [IsAuthenticated, IsAdminOrAccountant]
     filterset_class = InvoiceFilterSet
@@ -32,30 +129,106 @@ class InvoiceViewSet(viewsets.ModelViewSet):
         context["request"] = self.request
         return context
 
+    def perform_destroy(self, instance):
+        if instance.posting_batch_id:
+            raise ValidationError("Posted invoices cannot be deleted.")
+        try:
+            with transaction.atomic():
+                record_change(ChangeEvent.Action.DELETED, instance)
+                instance.delete()
+        except ProtectedError:
+            raise ValidationError("Invoices with posted FX revaluations cannot be deleted; void them instead.")
+
 
-class PaymentViewSet(viewsets.ModelViewSet):
+class PaymentViewSet(IdempotentCreateMixin, viewsets.ModelViewSet):
     serializer_class = PaymentSerializer
+    retry_label = "invoicing.payment"
     queryset = Payment.objects.select_related("invoice", "invoice__customer")
     permission_classes = [IsAuthenticated, IsAdminOrAccountant]
     ordering_fields = ["date", "amount"]
 
     def perform_create(self, serializer):
-        with transaction.atomic():
-            payment = serializer.save()
-            self._sync_invoice(payment.invoice)
+        # Runs inside the retried transaction of IdempotentCreateMixin.create.
+        payment = serializer.save()
+        record_change(ChangeEvent.Action.CREATED, payment)
+        self._sync_invoice(payment.invoice)
 
     def perform_update(self, serializer):
-        with transaction.atomic():
+        previous_invoice_id = serializer.instance.invoice_id
+
+        def update():
             payment = serializer.save()
+            record_change(ChangeEvent.Action.UPDATED, payment)
+            if payment.invoice_id != previous_invoice_id:
+                self._sync_invoice(Invoice.objects.get(pk=previous_invoice_id))
             self._sync_invoice(payment.invoice)
 
+        run_with_retry(update, "invoicing.payment")
+
     def perform_destroy(self, instance):
-        invoice = instance.invoice
-        with transaction.atomic():
-            super().perform_destroy(instance)
+        if instance.posting_batch_id:
+            raise ValidationError("Posted payments cannot be deleted.")
+
+        def destroy():
+            (invoice,) = lock_rows(Invoice.objects.filter(pk=instance.invoice_id), "invoicing.invoice")
+            record_change(ChangeEvent.Action.DELETED, instance)
+            super(PaymentViewSet, self).perform_destroy(instance)
             self._sync_invoice(invoice)
 
+        run_with_retry(destroy, "invoicing.payment")
+
+    @action(detail=False, methods=["post"])
+    def bulk(self, request):
+        """Apply lump-sum remittances across invoices, oldest due first unless `allocations` name them."""
+        serializer = BulkPaymentSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        default_date = data.get("date") or timezone.localdate()
+        try:
+            if "file" in data:
+                try:
+                    content = data["file"].read().decode("utf-8-sig")
+                except UnicodeDecodeError:
+                    raise ValidationError({"file": "Remittance files must be UTF-8 encoded."})
+                remittances = parse_remittance_csv(content, default_date)
+            else:
+                remittances = [
+                    Remittance(
+                        customer_id=item["customer"],
+                        amount=item["amount"],
+                        date=item.get("date") or default_date,
+                        method=item["method"],
+                        reference=item["reference"],
+                        allocations={allocation["invoice"]: allocation["amount"] for allocation in item.get("allocations", [])},
+                    )
+                    for item in data["remittances"]
+                ]
+            results, invoices_updated = run_with_retry(lambda: allocate_remittances(remittances), "invoicing.invoice")
+        except RemittanceError as exc:
+            if exc.errors:
+                raise ValidationError({"remittances": {index: [detail] for index, detail in exc.errors.items()}})
+            raise ValidationError(str(exc))
+        return Response(
+            {
+                "remittances": [
+                    {
+                        "customer": result.remittance.customer_id,
+                        "amount": str(result.remittance.amount),
+                        "unapplied": str(result.unapplied),
+                        "payments": [
+                            {"id": payment.pk, "invoice": payment.invoice_id, "amount": str(payment.amount)}
+                            for payment in result.payments
+                        ],
+                    }
+                    for result in results
+                ],
+                "invoices_updated": invoices_updated,
+            },
+            status=status.HTTP_201_CREATED,
+        )
+
     def _sync_invoice(self, invoice: Invoice) -> None:
+        """Recompute the invoice status; callers hold the invoice row lock."""
         total = invoice.total
         paid = invoice.amount_paid
         if paid >= total and total > 0:
@@ -70,5 +243,224 @@ class PaymentViewSet(viewsets.ModelViewSet):
         if invoice.status != new_status:
             invoice.status = new_status
             invoice.save(update_fields=["status", "updated_at"])
+            record_change(ChangeEvent.Action.UPDATED, invoice)
         else:
             invoice.save(update_fields=["updated_at"])
+
+
+class FxRevaluationViewSet(viewsets.ReadOnlyModelViewSet):
+    serializer_class = FxRevaluationSerializer
+    queryset = FxRevaluation.objects.select_related("invoice")
+    permission_classes = [IsAuthenticated, IsAdminOrAccountant]
+    filterset_fields = ["as_of", "invoice", "entry"]
+    ordering_fields = ["as_of"]
+
+    @action(detail=False, methods=["post"], permission_classes=[IsAuthenticated, IsAdminOrAccountant])
+    def run(self, request):
+        serializer = RevaluationRunSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            result = revalue_receivables(serializer.validated_data["as_of"], request.user)
+        except (RevaluationError, PeriodLockedError) as exc:
+            raise ValidationError(str(exc))
+        return Response(
+            {
+                "entry": result.entry.pk if result.entry else None,
+                "net_adjustment": str(result.net_adjustment),
+                "revaluations": FxRevaluationSerializer(result.revaluations, many=True).data,
+                "skipped": [{"currency": currency, "detail": detail} for currency, detail in sorted(result.skipped.items())],
+            },
+            status=status.HTTP_201_CREATED if result.revaluations else status.HTTP_200_OK,
+        )
+
+
+class BillingRunViewSet(viewsets.ModelViewSet):
+    serializer_class = BillingRunSerializer
+    queryset = BillingRun.objects.select_related("created_by").prefetch_related("lines")
+    permission_classes = [IsAuthenticated, IsAdminOrAccountant]
+    http_method_names = ["get", "post", "delete", "head", "options"]
+    filterset_fields = ["status"]
+    ordering_fields = ["created_at", "issue_date"]
+
+    def perform_destroy(self, instance):
+        if instance.status != BillingRun.Status.PENDING:
+            raise ValidationError("Only pending billing runs can be deleted.")
+        instance.delete()
+
+    @action(detail=True, methods=["post"])
+    def execute(self, request, pk=None):
+        """Bill the run's customers; failed runs resume with the customers still missing an invoice.
+
+        Runs in the request's process; large runs go through `manage.py run_billing --workers`.
+        """
+        run = self.get_object()
+        serializer = BillingRunExecuteSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            run = run_billing(run, workers=1, chunk_size=serializer.validated_data["chunk_size"])
+        except BillingRunError as exc:
+            raise ValidationError(str(exc))
+        return Response(self.get_serializer(run).data)
+
+
+class BankStatementViewSet(viewsets.ModelViewSet):
+    serializer_class = BankStatementSerializer
+    permission_classes = [IsAuthenticated, IsAdminOrAccountant]
+    http_method_names = ["get", "post", "delete", "head", "options"]
+    ordering_fields = ["created_at", "name"]
+    search_fields = ["name"]
+
+    def get_queryset(self):
+        counts = {
+            f"{status}_lines": Count("lines", filter=Q(lines__status=status)) for status in BankStatementLine.Status.values
+        }
+        return BankStatement.objects.annotate(**counts)
+
+    def create(self, request, *args, **kwargs):
+        serializer = BankStatementImportSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            statement = import_statement(user=request.user, **serializer.validated_data)
+        except StatementError as exc:
+            raise ValidationError(str(exc))
+        statement = self.get_queryset().get(pk=statement.pk)
+        return Response(self.get_serializer(statement).data, status=status.HTTP_201_CREATED)
+
+    def perform_destroy(self, instance):
+        if instance.lines.filter(payment__isnull=False).exists():
+            raise ValidationError("Statements with confirmed payments cannot be deleted.")
+        instance.delete()
+
+    @action(detail=True, methods=["post"])
+    def match(self, request, pk=None):
+        """Re-run the matcher over unconfirmed lines, e.g. after invoices were created or edited."""
+        statement = self.get_object()
+        suggested = match_statement(statement)
+        return Response({"suggested": suggested})
+
+    @action(detail=True, methods=["post"])
+    def confirm(self, request, pk=None):
+        """Create payments for the given suggested lines, or all suggestions at or above `min_confidence`."""
+        statement = self.get_object()
+        serializer = StatementConfirmSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        lines = statement.lines.filter(status=BankStatementLine.Status.SUGGESTED)
+        if "line_ids" in serializer.validated_data:
+            lines = statement.lines.filter(pk__in=serializer.validated_data["line_ids"])
+        if "min_confidence" in serializer.validated_data:
+            lines = lines.filter(confidence__gte=serializer.validated_data["min_confidence"])
+        line_ids = list(lines.values_list("pk", flat=True))
+        result = run_with_retry(lambda: apply_statement_lines(line_ids, request.user), "invoicing.invoice")
+        return Response(
+            {
+                "payments": [payment.pk for payment in result.payments],
+                "invoices_updated": result.invoices_updated,
+                "skipped": [{"line": line_id, "detail": detail} for line_id, detail in sorted(result.skipped.items())],
+            }
+        )
+
+
+class BankStatementLineViewSet(viewsets.ModelViewSet):
+    serializer_class = BankStatementLineSerializer
+    queryset = BankStatementLine.objects.select_related("invoice")
+    permission_classes = [IsAuthenticated, IsAdminOrAccountant]
+    http_method_names = ["get", "patch", "head", "options"]
+    filterset_fields = ["statement", "status", "match_rule"]
+    ordering_fields = ["line_number", "date", "amount", "confidence"]
+    search_fields = ["reference", "counterparty", "description"]
+
+
+class PostingRuleViewSet(viewsets.ModelViewSet):
+    serializer_class = PostingRuleSerializer
+    queryset = PostingRule.objects.all()
+    permission_classes = [IsAuthenticated, IsAdminOrAccountant]
+    filterset_fields = ["document_type", "is_active"]
+
+
+class PostingBatchViewSet(viewsets.ReadOnlyModelViewSet):
+    serializer_class = PostingBatchSerializer
+    queryset = PostingBatch.objects.prefetch_related("entries")
+    permission_classes = [IsAuthenticated, IsAdminOrAccountant]
+    filterset_fields = ["document_type", "up_to"]
+    ordering_fields = ["created_at", "up_to"]
+
+    @action(detail=False, methods=["post"])
+    def run(self, request):
+        """Post unposted invoices and/or payments dated up to `up_to` (default today)."""
+        serializer = PostingRunSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        up_to = data.get("up_to") or timezone.localdate()
+        document_types = (
+            PostingRule.DocumentType.values if data["document_type"] == "all" else [data["document_type"]]
+        )
+        batches = []
+        try:
+            for document_type in document_types:
+                batch = run_with_retry(
+                    lambda: post_documents(document_type, up_to, request.user, data["group_by"]), f"invoicing.{document_type}"
+                )
+                if batch is not None:
+                    batches.append(batch)
+        except (PostingError, PeriodLockedError) as exc:
+            raise ValidationError(str(exc))
+        return Response(
+            PostingBatchSerializer(batches, many=True).data,
+            status=status.HTTP_201_CREATED if batches else status.HTTP_200_OK,
+        )
+
+
+class DunningLevelViewSet(viewsets.ModelViewSet):
+    serializer_class = DunningLevelSerializer
+    queryset = DunningLevel.objects.all()
+    permission_classes = [IsAuthenticated, IsAdminOrAccountant]
+    filterset_fields = ["action", "is_active"]
+
+    def perform_destroy(self, instance):
+        try:
+            instance.delete()
+        except ProtectedError:
+            raise ValidationError("Dunning levels with notices cannot be deleted; deactivate them instead.")
+
+
+class DunningRunViewSet(viewsets.ReadOnlyModelViewSet):
+    serializer_class = DunningRunSerializer
+    queryset = DunningRun.objects.all()
+    permission_classes = [IsAuthenticated, IsAdminOrAccountant]
+    filterset_fields = ["as_of"]
+    ordering_fields = ["created_at", "as_of"]
+
+    @action(detail=False, methods=["post"])
+    def run(self, request):
+        """Issue notices for overdue invoices that reached a new dunning level by `as_of` (default today)."""
+        serializer = DunningRunRequestSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        as_of = serializer.validated_data.get("as_of") or timezone.localdate()
+        try:
+            run = run_dunning(as_of, request.user)
+        except DunningError as exc:
+            raise ValidationError(str(exc))
+        return Response(DunningRunSerializer(run).data, status=status.HTTP_201_CREATED)
+
+
+class DunningNoticeViewSet(viewsets.ModelViewSet):
+    serializer_class = DunningNoticeSerializer
+    queryset = DunningNotice.objects.select_related("invoice__customer", "level")
+    permission_classes = [IsAuthenticated, IsAdminOrAccountant]
+    http_method_names = ["get", "patch", "head", "options"]
+    filterset_fields = ["run", "status", "level", "collector", "invoice__customer"]
+    ordering_fields = ["days_overdue", "open_balance", "created_at"]
+    search_fields = ["invoice__number", "invoice__customer__name"]
+
+    @action(detail=False, methods=["get"])
+    def worklists(self, request):
+        """Open notices per collector and level; `collector=me` limits it to the caller's worklist."""
+        collector = request.query_params.get("collector")
+        if collector == "me":
+            collector = request.user.pk
+        elif collector is not None:
+            try:
+                collector = int(collector)
+            except ValueError:
+                raise ValidationError({"collector": "Expected a user id or `me`."})
+        return Response(dunning_worklists(collector))
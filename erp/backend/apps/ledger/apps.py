@@ -5,3 +5,5 @@ class LedgerConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "apps.ledger"
 
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,30 @@
+from __future__ import annotations
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.ledger.services import FiscalYearCloseError, close_fiscal_year
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = "Close a fiscal year's revenue and expense balances into retained earnings."
+
+    def add_arguments(self, parser):
+        parser.add_argument("year", type=int)
+        parser.add_argument("--user", required=True, help="Username recorded as the closer.")
+        parser.add_argument("--retained-earnings", dest="retained_earnings_code", help="Account code (default RETAINED_EARNINGS_ACCOUNT_CODE).")
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options["user"])
+        except User.DoesNotExist:
+            raise CommandError(f"User {options['user']} does not exist.")
+        try:
+            closing = close_fiscal_year(options["year"], user, options["retained_earnings_code"])
+        except FiscalYearCloseError as exc:
+            raise CommandError(str(exc))
+        self.stdout.write(
+            self.style.SUCCESS(f"Closed {closing.year}: net income {closing.net_income} (entry #{closing.closing_entry_id}).")
+        )
@@ -0,0 +1,29 @@
+from __future__ import annotations
+
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.ledger.models import RecurringEntryTemplate
+from apps.ledger.services import generate_recurring_entries
+
+
+class Command(BaseCommand):
+    help = "Create journal entries for every recurring template occurrence due up to a date."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--through", type=date.fromisoformat, default=date.today(), help="Last occurrence date (YYYY-MM-DD).")
+        parser.add_argument("--template", type=int, action="append", dest="templates", help="Limit to template id (repeatable).")
+
+    def handle(self, *args, **options):
+        templates = RecurringEntryTemplate.objects.filter(is_active=True)
+        if options["templates"]:
+            templates = templates.filter(id__in=options["templates"])
+        result = generate_recurring_entries(options["through"], templates)
+        for template_id, detail in result.failures.items():
+            self.stderr.write(f"Template {template_id} skipped: {detail}")
+        for entry_id in sorted(result.budget_warnings):
+            self.stderr.write(f"Entry {entry_id} is over budget.")
+        self.stdout.write(self.style.SUCCESS(f"Created {result.total_created} recurring entries."))
+        if result.failures and not result.created:
+            raise CommandError("No templates could be generated.")
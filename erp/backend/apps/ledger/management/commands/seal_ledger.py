@@ -0,0 +1,16 @@
+from __future__ import annotations
+
+from django.core.management.base import BaseCommand
+
+from apps.ledger.services import seal_unsealed_entries
+
+
+class Command(BaseCommand):
+    help = "Append seals for queued entries and for posted entries that have none, e.g. ones posted before sealing existed."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        sealed = seal_unsealed_entries(batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Sealed {sealed} posted entries."))
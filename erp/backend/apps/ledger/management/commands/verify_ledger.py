@@ -0,0 +1,30 @@
+from __future__ import annotations
+
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.ledger.services import verify_ledger
+
+
+class Command(BaseCommand):
+    help = "Verify posted entries balance and match their hash-chain seals and frozen period balances."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=1, help="Worker processes; 0 uses every CPU.")
+        parser.add_argument("--chunk-size", type=int, default=5000, help="Ids per unit of work.")
+
+    def handle(self, *args, **options):
+        workers = options["workers"] or os.cpu_count() or 1
+        if options["chunk_size"] < 1:
+            raise CommandError("--chunk-size must be positive.")
+        report = verify_ledger(workers=workers, chunk_size=options["chunk_size"])
+        for issue in report.issues:
+            self.stderr.write(f"[{issue.kind}] {issue.ref}: {issue.detail}")
+        summary = (
+            f"Checked {report.entries_checked} posted entries and {report.seals_checked} seals; "
+            f"chain head {report.head_digest}."
+        )
+        if not report.ok:
+            raise CommandError(f"{summary} Found {len(report.issues)} issue(s).")
+        self.stdout.write(self.style.SUCCESS(summary))
@@ -0,0 +1,64 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:52
+
+import django.core.validators
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ledger', '0002_alter_journalline_credit_alter_journalline_debit'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='journalentry',
+            name='recurrence_date',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='RecurringEntryTemplate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=128)),
+                ('memo', models.CharField(blank=True, max_length=255)),
+                ('frequency', models.CharField(choices=[('monthly', 'Monthly'), ('quarterly', 'Quarterly'), ('yearly', 'Yearly')], default='monthly', max_length=16)),
+                ('start_date', models.DateField()),
+                ('end_date', models.DateField(blank=True, null=True)),
+                ('entry_status', models.CharField(choices=[('draft', 'Draft'), ('posted', 'Posted')], default='posted', max_length=16)),
+                ('is_active', models.BooleanField(default=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('created_by', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='recurring_templates_created', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['name'],
+            },
+        ),
+        migrations.CreateModel(
+            name='RecurringEntryLine',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('debit', models.DecimalField(decimal_places=2, default=0, max_digits=14, validators=[django.core.validators.MinValueValidator(0)])),
+                ('credit', models.DecimalField(decimal_places=2, default=0, max_digits=14, validators=[django.core.validators.MinValueValidator(0)])),
+                ('dimensions', models.JSONField(blank=True, default=dict)),
+                ('account', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='recurring_lines', to='ledger.account')),
+                ('template', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lines', to='ledger.recurringentrytemplate')),
+            ],
+            options={
+                'ordering': ['id'],
+            },
+        ),
+        migrations.AddField(
+            model_name='journalentry',
+            name='recurring_template',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='entries', to='ledger.recurringentrytemplate'),
+        ),
+        migrations.AddConstraint(
+            model_name='journalentry',
+            constraint=models.UniqueConstraint(fields=('recurring_template', 'recurrence_date'), name='unique_recurring_occurrence'),
+        ),
+    ]
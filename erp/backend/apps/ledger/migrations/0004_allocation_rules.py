@@ -0,0 +1,49 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:53
+
+import django.core.validators
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ledger', '0003_recurring_entry_templates'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AllocationRule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=128)),
+                ('dimension', models.CharField(max_length=64)),
+                ('driver_type', models.CharField(choices=[('fixed', 'Fixed percentages'), ('dimension_balance', 'Posted balances by dimension')], default='fixed', max_length=32)),
+                ('is_active', models.BooleanField(default=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('created_by', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='allocation_rules_created', to=settings.AUTH_USER_MODEL)),
+                ('driver_account', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='allocation_drivers', to='ledger.account')),
+                ('source_account', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='allocation_sources', to='ledger.account')),
+                ('target_account', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='allocation_targets', to='ledger.account')),
+            ],
+            options={
+                'ordering': ['name'],
+            },
+        ),
+        migrations.CreateModel(
+            name='AllocationDriver',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dimension_value', models.CharField(max_length=128)),
+                ('percentage', models.DecimalField(decimal_places=4, max_digits=7, validators=[django.core.validators.MinValueValidator(0)])),
+                ('rule', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='drivers', to='ledger.allocationrule')),
+            ],
+            options={
+                'ordering': ['dimension_value'],
+                'unique_together': {('rule', 'dimension_value')},
+            },
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:54
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ledger', '0004_allocation_rules'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='journalentry',
+            name='is_closing',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.CreateModel(
+            name='FiscalYearClose',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('year', models.PositiveIntegerField(unique=True)),
+                ('net_income', models.DecimalField(decimal_places=2, max_digits=16)),
+                ('closed_at', models.DateTimeField(auto_now_add=True)),
+                ('closed_by', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='fiscal_years_closed', to=settings.AUTH_USER_MODEL)),
+                ('closing_entry', models.OneToOneField(on_delete=django.db.models.deletion.PROTECT, related_name='fiscal_year_close', to='ledger.journalentry')),
+                ('retained_earnings_account', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='fiscal_year_closes', to='ledger.account')),
+            ],
+            options={
+                'ordering': ['-year'],
+            },
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:57
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ledger', '0005_fiscal_year_close'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FiscalPeriod',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start', models.DateField(unique=True)),
+                ('end', models.DateField()),
+                ('status', models.CharField(choices=[('open', 'Open'), ('locked', 'Locked')], default='open', max_length=16)),
+                ('locked_at', models.DateTimeField(blank=True, null=True)),
+                ('locked_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='fiscal_periods_locked', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['start'],
+            },
+        ),
+        migrations.CreateModel(
+            name='AccountPeriodBalance',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('debit', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+                ('credit', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+                ('account', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='period_balances', to='ledger.account')),
+                ('period', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='balances', to='ledger.fiscalperiod')),
+            ],
+            options={
+                'ordering': ['period', 'account'],
+                'unique_together': {('period', 'account')},
+            },
+        ),
+    ]
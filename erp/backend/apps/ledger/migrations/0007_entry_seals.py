@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-19 18:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ledger', '0006_fiscal_periods'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EntrySeal',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('entry_id', models.BigIntegerField(db_index=True)),
+                ('is_void', models.BooleanField(default=False)),
+                ('line_count', models.PositiveIntegerField(default=0)),
+                ('total_debit', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+                ('total_credit', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+                ('content_hash', models.CharField(max_length=64)),
+                ('previous_digest', models.CharField(max_length=64, unique=True)),
+                ('digest', models.CharField(max_length=64, unique=True)),
+                ('sealed_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['id'],
+            },
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-19 18:11
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ledger', '0007_entry_seals'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='journalline',
+            name='amount_currency',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=16, null=True),
+        ),
+        migrations.AddField(
+            model_name='journalline',
+            name='currency',
+            field=models.CharField(blank=True, max_length=3),
+        ),
+        migrations.AddField(
+            model_name='journalline',
+            name='fx_rate',
+            field=models.DecimalField(blank=True, decimal_places=8, max_digits=18, null=True),
+        ),
+        migrations.CreateModel(
+            name='ExchangeRate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('from_currency', models.CharField(max_length=3)),
+                ('to_currency', models.CharField(max_length=3)),
+                ('date', models.DateField()),
+                ('rate', models.DecimalField(decimal_places=8, max_digits=18, validators=[django.core.validators.MinValueValidator(0)])),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['from_currency', 'to_currency', '-date'],
+                'unique_together': {('from_currency', 'to_currency', 'date')},
+            },
+        ),
+    ]
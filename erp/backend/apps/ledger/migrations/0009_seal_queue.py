@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-19 19:03
+
+from django.db import migrations, models
+
+
+def create_chain_head(apps, schema_editor):
+    EntrySeal = apps.get_model("ledger", "EntrySeal")
+    SealChainHead = apps.get_model("ledger", "SealChainHead")
+    head = EntrySeal.objects.order_by("-id").values_list("digest", flat=True).first()
+    SealChainHead.objects.create(pk=1, digest=head or "0" * 64)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ledger', '0008_multi_currency'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PendingSeal',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('entry_id', models.BigIntegerField()),
+                ('queued_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['id'],
+            },
+        ),
+        migrations.CreateModel(
+            name='SealChainHead',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('digest', models.CharField(max_length=64)),
+            ],
+        ),
+        migrations.RunPython(create_chain_head, migrations.RunPython.noop),
+    ]
@@ -60,11 +60,27 @@ class JournalEntry(models.Model):
         blank=True,
     )
 
+    recurring_template = models.ForeignKey(
+        "RecurringEntryTemplate",
+        related_name="entries",
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+    )
+    recurrence_date = models.DateField(null=True, blank=True)
+    is_closing = models.BooleanField(default=False)
+
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ["-date", "-id"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["recurring_template", "recurrence_date"],
+                name="unique_recurring_occurrence",
+            ),
+        ]
 
     def __str__(self) -> str:
         return f"JournalEntry #{self.pk} ({self.date})"
@@ -98,6 +114,10 @@ class JournalLine(models.Model):
         validators=[MinValueValidator(0)],
     )
     dimensions = models.JSONField(default=dict, blank=True)
+    # Transaction currency; `amount_currency` is signed (debit positive) and null for base-currency lines.
+    currency = models.CharField(max_length=3, blank=True)
+    amount_currency = models.DecimalField(max_digits=16, decimal_places=2, null=True, blank=True)
+    fx_rate = models.DecimalField(max_digits=18, decimal_places=8, null=True, blank=True)
 
     class Meta:
         ordering = ["id"]
@@ -113,3 +133,247 @@ class JournalLine(models.Model):
         side = "Dr" if self.debit else "Cr"
         amount = self.debit or self.credit
         return f"{self.account.code} {side} {amount}"
+
+
+class RecurringEntryTemplate(models.Model):
+    class Frequency(models.TextChoices):
+        MONTHLY = "monthly", "Monthly"
+        QUARTERLY = "quarterly", "Quarterly"
+        YEARLY = "yearly", "Yearly"
+
+    name = models.CharField(max_length=128)
+    memo = models.CharField(max_length=255, blank=True)
+    frequency = models.CharField(max_length=16, choices=Frequency.choices, default=Frequency.MONTHLY)
+    start_date = models.DateField()
+    end_date = models.DateField(null=True, blank=True)
+    entry_status = models.CharField(
+        max_length=16,
+        choices=JournalEntry.Status.choices,
+        default=JournalEntry.Status.POSTED,
+    )
+    is_active = models.BooleanField(default=True)
+    created_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        related_name="recurring_templates_created",
+        on_delete=models.PROTECT,
+    )
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ["name"]
+
+    def __str__(self) -> str:
+        return self.name
+
+    @property
+    def months_between(self) -> int:
+        return {
+            self.Frequency.MONTHLY: 1,
+            self.Frequency.QUARTERLY: 3,
+            self.Frequency.YEARLY: 12,
+        }[self.frequency]
+
+
+class RecurringEntryLine(models.Model):
+    template = models.ForeignKey(
+        RecurringEntryTemplate,
+        related_name="lines",
+        on_delete=models.CASCADE,
+    )
+    account = models.ForeignKey(Account, related_name="recurring_lines", on_delete=models.PROTECT)
+    debit = models.DecimalField(
+        max_digits=14,
+        decimal_places=2,
+        default=0,
+        validators=[MinValueValidator(0)],
+    )
+    credit = models.DecimalField(
+        max_digits=14,
+        decimal_places=2,
+        default=0,
+        validators=[MinValueValidator(0)],
+    )
+    dimensions = models.JSONField(default=dict, blank=True)
+
+    class Meta:
+        ordering = ["id"]
+
+    def __str__(self) -> str:
+        side = "Dr" if self.debit else "Cr"
+        return f"{self.template} {side} {self.debit or self.credit}"
+
+
+class AllocationRule(models.Model):
+    class DriverType(models.TextChoices):
+        FIXED = "fixed", "Fixed percentages"
+        DIMENSION_BALANCE = "dimension_balance", "Posted balances by dimension"
+
+    name = models.CharField(max_length=128)
+    source_account = models.ForeignKey(Account, related_name="allocation_sources", on_delete=models.PROTECT)
+    target_account = models.ForeignKey(Account, related_name="allocation_targets", on_delete=models.PROTECT)
+    dimension = models.CharField(max_length=64)
+    driver_type = models.CharField(max_length=32, choices=DriverType.choices, default=DriverType.FIXED)
+    driver_account = models.ForeignKey(
+        Account,
+        related_name="allocation_drivers",
+        on_delete=models.PROTECT,
+        null=True,
+        blank=True,
+    )
+    is_active = models.BooleanField(default=True)
+    created_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        related_name="allocation_rules_created",
+        on_delete=models.PROTECT,
+    )
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ["name"]
+
+    def __str__(self) -> str:
+        return self.name
+
+
+class AllocationDriver(models.Model):
+    rule = models.ForeignKey(AllocationRule, related_name="drivers", on_delete=models.CASCADE)
+    dimension_value = models.CharField(max_length=128)
+    percentage = models.DecimalField(
+        max_digits=7,
+        decimal_places=4,
+        validators=[MinValueValidator(0)],
+    )
+
+    class Meta:
+        ordering = ["dimension_value"]
+        unique_together = ("rule", "dimension_value")
+
+    def __str__(self) -> str:
+        return f"{self.rule} {self.dimension_value} {self.percentage}%"
+
+
+class FiscalYearClose(models.Model):
+    year = models.PositiveIntegerField(unique=True)
+    closing_entry = models.OneToOneField(
+        JournalEntry,
+        related_name="fiscal_year_close",
+        on_delete=models.PROTECT,
+    )
+    retained_earnings_account = models.ForeignKey(
+        Account,
+        related_name="fiscal_year_closes",
+        on_delete=models.PROTECT,
+    )
+    net_income = models.DecimalField(max_digits=16, decimal_places=2)
+    closed_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        related_name="fiscal_years_closed",
+        on_delete=models.PROTECT,
+    )
+    closed_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["-year"]
+
+    def __str__(self) -> str:
+        return f"FY{self.year} close"
+
+
+class FiscalPeriod(models.Model):
+    class Status(models.TextChoices):
+        OPEN = "open", "Open"
+        LOCKED = "locked", "Locked"
+
+    start = models.DateField(unique=True)
+    end = models.DateField()
+    status = models.CharField(max_length=16, choices=Status.choices, default=Status.OPEN)
+    locked_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        related_name="fiscal_periods_locked",
+        on_delete=models.PROTECT,
+        null=True,
+        blank=True,
+    )
+    locked_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["start"]
+
+    def __str__(self) -> str:
+        return f"{self.start:%Y-%m} ({self.status})"
+
+
+class AccountPeriodBalance(models.Model):
+    period = models.ForeignKey(FiscalPeriod, related_name="balances", on_delete=models.CASCADE)
+    account = models.ForeignKey(Account, related_name="period_balances", on_delete=models.PROTECT)
+    debit = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+    credit = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+
+    class Meta:
+        ordering = ["period", "account"]
+        unique_together = ("period", "account")
+
+    def __str__(self) -> str:
+        return f"{self.period} {self.account_id} Dr {self.debit} Cr {self.credit}"
+
+
+class EntrySeal(models.Model):
+    """One link in the hash chain over posted entries.
+
+    A seal is appended each time a posted entry is posted, edited, unposted or deleted.
+    `entry_id` is not a foreign key, so the chain survives deletions.
+    """
+
+    entry_id = models.BigIntegerField(db_index=True)
+    is_void = models.BooleanField(default=False)
+    line_count = models.PositiveIntegerField(default=0)
+    total_debit = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+    total_credit = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+    content_hash = models.CharField(max_length=64)
+    previous_digest = models.CharField(max_length=64, unique=True)
+    digest = models.CharField(max_length=64, unique=True)
+    sealed_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["id"]
+
+    def __str__(self) -> str:
+        return f"Seal #{self.pk} for entry #{self.entry_id}"
+
+
+class SealChainHead(models.Model):
+    """Single row holding the digest of the newest seal; appends lock it to take turns."""
+
+    digest = models.CharField(max_length=64)
+
+
+class PendingSeal(models.Model):
+    """An entry whose posted state changed and still needs a seal appended after commit."""
+
+    entry_id = models.BigIntegerField()
+    queued_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["id"]
+
+
+class ExchangeRate(models.Model):
+    """Units of `to_currency` per one unit of `from_currency`, effective from `date`."""
+
+    from_currency = models.CharField(max_length=3)
+    to_currency = models.CharField(max_length=3)
+    date = models.DateField()
+    rate = models.DecimalField(max_digits=18, decimal_places=8, validators=[MinValueValidator(0)])
+
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["from_currency", "to_currency", "-date"]
+        unique_together = ("from_currency", "to_currency", "date")
+
+    def __str__(self) -> str:
+        return f"{self.from_currency}/{self.to_currency} {self.date} {self.rate}"
@@ -2,14 +2,61 @@ from __future__ import annotations
 
 from decimal import Decimal
 
+from django.conf import settings
 from django.db import transaction
 from rest_framework import serializers
 
-from .models import Account, JournalEntry, JournalLine
+from apps.budgets.services import BudgetControl, Posting, check_postings, expense_amounts, overrun_messages
+from apps.core.models import ChangeEvent
+from apps.core.services import record_change, record_changes
+
+from .models import (
+    Account,
+    AllocationDriver,
+    AllocationRule,
+    ExchangeRate,
+    FiscalPeriod,
+    FiscalYearClose,
+    JournalEntry,
+    JournalLine,
+    RecurringEntryLine,
+    RecurringEntryTemplate,
+)
+from .services import (
+    FX_RATE_PLACES,
+    PeriodLockedError,
+    chart_of_accounts,
+    ensure_periods_open,
+    fx_rates,
+    get_account,
+    month_start,
+    seal_entries,
+)
+from .signals import entries_posted, entries_unposting
+
+
+class AccountField(serializers.PrimaryKeyRelatedField):
+    """Primary key field resolved against the cached chart of accounts."""
+
+    def __init__(self, **kwargs):
+        kwargs.setdefault("queryset", Account.objects.all())
+        super().__init__(**kwargs)
+
+    def to_internal_value(self, data):
+        if isinstance(data, bool):
+            self.fail("incorrect_type", data_type=type(data).__name__)
+        try:
+            account_id = int(data)
+        except (TypeError, ValueError):
+            self.fail("incorrect_type", data_type=type(data).__name__)
+        if get_account(account_id) is None:
+            self.fail("does_not_exist", pk_value=data)
+        return chart_of_accounts().instance(account_id)
 
 
 class AccountSerializer(serializers.ModelSerializer):
-    parent_name = serializers.CharField(source="parent.name", read_only=True)
+    parent = AccountField(allow_null=True, required=False)
+    parent_name = serializers.SerializerMethodField()
 
     class Meta:
         model = Account
@@ -27,10 +74,15 @@ class AccountSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ["created_at", "updated_at"]
 
+    def get_parent_name(self, obj) -> str | None:
+        parent = get_account(obj.parent_id) if obj.parent_id else None
+        return parent.name if parent else None
+
 
 class JournalLineSerializer(serializers.ModelSerializer):
-    account_code = serializers.CharField(source="account.code", read_only=True)
-    account_name = serializers.CharField(source="account.name", read_only=True)
+    account = AccountField()
+    account_code = serializers.SerializerMethodField()
+    account_name = serializers.SerializerMethodField()
 
     class Meta:
         model = JournalLine
@@ -42,16 +94,39 @@ class JournalLineSerializer(serializers.ModelSerializer):
             "debit",
             "credit",
             "dimensions",
+            "currency",
+            "amount_currency",
+            "fx_rate",
         ]
-        read_only_fields = ["id", "account_code", "account_name"]
+        read_only_fields = ["id", "account_code", "account_name", "fx_rate"]
+
+    def get_account_code(self, obj) -> str | None:
+        account = get_account(obj.account_id)
+        return account.code if account else None
+
+    def get_account_name(self, obj) -> str | None:
+        account = get_account(obj.account_id)
+        return account.name if account else None
 
     def validate(self, attrs):
+        currency = (attrs.get("currency") or "").upper()
+        if currency == settings.BASE_CURRENCY:
+            currency = ""
+        if "currency" in attrs:
+            attrs["currency"] = currency
+        amount_currency = attrs.get("amount_currency")
+        if currency and not amount_currency:
+            raise serializers.ValidationError("Foreign-currency lines require a non-zero amount_currency.")
+        if amount_currency is not None and not currency:
+            raise serializers.ValidationError("amount_currency requires a foreign currency.")
         debit = attrs.get("debit") or Decimal("0")
         credit = attrs.get("credit") or Decimal("0")
         if debit and credit:
             raise serializers.ValidationError("A line cannot include both debit and credit values.")
-        if not debit and not credit:
+        if not debit and not credit and not amount_currency:
             raise serializers.ValidationError("A line requires a debit or credit value.")
+        if amount_currency and (debit or credit) and (amount_currency > 0) != bool(debit):
+            raise serializers.ValidationError("amount_currency must be positive for debits and negative for credits.")
         return attrs
 
 
@@ -71,6 +146,7 @@ class JournalEntrySerializer(serializers.ModelSerializer):
             "status",
             "created_by",
             "approved_by",
+            "recurring_template",
             "lines",
             "created_at",
             "updated_at",
@@ -81,12 +157,25 @@ class JournalEntrySerializer(serializers.ModelSerializer):
             "id",
             "created_by",
             "approved_by",
+            "recurring_template",
             "created_at",
             "updated_at",
             "total_debits",
             "total_credits",
         ]
 
+    def validate(self, attrs):
+        if self.instance is not None and self.instance.is_closing:
+            raise serializers.ValidationError("Closing entries are managed by the year-end close.")
+        self._ensure_periods_open(attrs.get("date"), getattr(self.instance, "date", None))
+        return attrs
+
+    def _ensure_periods_open(self, *dates) -> None:
+        try:
+            ensure_periods_open(*dates)
+        except PeriodLockedError as exc:
+            raise serializers.ValidationError(str(exc))
+
     def _validate_double_entry(self, status: str, lines_data) -> None:
         if status != JournalEntry.Status.POSTED:
             return
@@ -104,27 +193,37 @@ class JournalEntrySerializer(serializers.ModelSerializer):
             raise serializers.ValidationError("Posted entries must balance debits and credits.")
 
     def create(self, validated_data):
-        lines_data = validated_data.pop("lines", [])
+        lines_data = self._convert_lines(validated_data.pop("lines", []), validated_data["date"])
         status_value = validated_data.get("status", JournalEntry.Status.DRAFT)
         self._validate_double_entry(status_value, lines_data)
         request = self.context.get("request")
         if request and request.user.is_authenticated:
             validated_data["created_by"] = request.user
         with transaction.atomic():
+            # Checked again under the period share lock; validate() ran outside the transaction.
+            self._ensure_periods_open(validated_data.get("date"))
             entry = JournalEntry.objects.create(**validated_data)
-            self._upsert_lines(entry, lines_data)
+            record_change(ChangeEvent.Action.CREATED, entry)
+            lines = self._upsert_lines(entry, lines_data)
+            if entry.status == JournalEntry.Status.POSTED:
+                self._check_budgets(entry, expense_amounts(lines))
+                entries_posted.send(sender=JournalEntry, entry_ids=[entry.pk])
         return entry
 
     def update(self, instance, validated_data):
         lines_data = validated_data.pop("lines", None)
+        prev_status = instance.status
         status_value = validated_data.get("status", instance.status)
         if lines_data is None:
             lines_data = [
                 {
-                    "account": line.account,
+                    "account": line.account_id,
                     "debit": line.debit,
                     "credit": line.credit,
                     "dimensions": line.dimensions,
+                    "currency": line.currency,
+                    "amount_currency": line.amount_currency,
+                    "fx_rate": line.fx_rate,
                 }
                 for line in instance.lines.all()
             ]
@@ -137,40 +236,344 @@ class JournalEntrySerializer(serializers.ModelSerializer):
                     "debit": data.get("debit"),
                     "credit": data.get("credit"),
                     "dimensions": data.get("dimensions", {}),
+                    "currency": data.get("currency", ""),
+                    "amount_currency": data.get("amount_currency"),
                 })
-            lines_data = prepared
+            lines_data = self._convert_lines(prepared, validated_data.get("date", instance.date))
         self._validate_double_entry(status_value, lines_data)
         with transaction.atomic():
+            self._ensure_periods_open(validated_data.get("date"), instance.date)
+            previous = {}
+            if prev_status == JournalEntry.Status.POSTED:
+                entries_unposting.send(sender=JournalEntry, entry_ids=[instance.pk])
+                if month_start(instance.date) == month_start(validated_data.get("date", instance.date)):
+                    previous = expense_amounts(instance.lines.all())
             entry = super().update(instance, validated_data)
+            record_change(ChangeEvent.Action.UPDATED, entry)
+            lines = []
             if lines_data is not None and self.partial is False:
-                entry.lines.all().delete()
-                self._upsert_lines(entry, lines_data)
+                self._delete_lines(entry)
+                lines = self._upsert_lines(entry, lines_data)
             elif lines_data is not None and self.partial is True:
-                entry.lines.all().delete()
-                self._upsert_lines(entry, lines_data)
+                self._delete_lines(entry)
+                lines = self._upsert_lines(entry, lines_data)
+            if entry.status == JournalEntry.Status.POSTED:
+                self._check_budgets(entry, expense_amounts(lines), previous)
+                entries_posted.send(sender=JournalEntry, entry_ids=[entry.pk])
+            elif prev_status == JournalEntry.Status.POSTED:
+                seal_entries([entry.pk])
         return entry
 
     def to_representation(self, instance):
         data = super().to_representation(instance)
         data["total_debits"] = f"{instance.total_debits:.2f}"
         data["total_credits"] = f"{instance.total_credits:.2f}"
+        warnings = getattr(instance, "budget_warnings", None)
+        if warnings:
+            data["budget_warnings"] = [overrun.as_dict() for overrun in warnings]
         return data
 
+    def _check_budgets(self, entry: JournalEntry, amounts: dict[int, Decimal], previous: dict[int, Decimal] | None = None) -> None:
+        """Reject or flag the posting if it raises spending on an expense account past a budget."""
+        overruns = check_postings([Posting(entry.pk, entry.date, amounts, previous or {})]).get(entry.pk)
+        if not overruns:
+            return
+        if settings.BUDGET_CONTROL == BudgetControl.BLOCK:
+            raise serializers.ValidationError({"lines": overrun_messages(overruns)})
+        entry.budget_warnings = overruns
+
     def _upsert_lines(self, entry: JournalEntry, lines_data):
         line_instances = []
         for payload in lines_data:
             account = payload["account"]
-            if isinstance(account, Account):
-                account_obj = account
-            else:
-                account_obj = Account.objects.get(pk=account)
+            account_id = account.pk if isinstance(account, Account) else int(account)
+            if get_account(account_id) is None:
+                raise serializers.ValidationError({"lines": f"Account {account_id} does not exist."})
             line_instances.append(
                 JournalLine(
                     entry=entry,
-                    account=account_obj,
+                    account_id=account_id,
                     debit=Decimal(str(payload.get("debit") or "0")),
                     credit=Decimal(str(payload.get("credit") or "0")),
                     dimensions=payload.get("dimensions", {}),
+                    currency=payload.get("currency") or "",
+                    amount_currency=payload.get("amount_currency"),
+                    fx_rate=payload.get("fx_rate"),
                 )
             )
-        JournalLine.objects.bulk_create(line_instances)
+        created = JournalLine.objects.bulk_create(line_instances)
+        record_changes(ChangeEvent.Action.CREATED, created)
+        return created
+
+    def _convert_lines(self, lines_data, entry_date):
+        """Fill base-currency debit/credit for foreign lines from the rate on the entry date."""
+        rates = fx_rates()
+        converted = []
+        for payload in lines_data:
+            amount = payload.get("amount_currency")
+            if not payload.get("currency") or amount is None:
+                converted.append(payload)
+                continue
+            payload = dict(payload)
+            base = payload.get("debit") or payload.get("credit")
+            if not base:
+                rate = rates.rate(payload["currency"], settings.BASE_CURRENCY, entry_date)
+                if rate is None:
+                    raise serializers.ValidationError(
+                        {"lines": f"No {payload['currency']}/{settings.BASE_CURRENCY} rate on or before {entry_date}."}
+                    )
+                base = (abs(amount) * rate).quantize(Decimal("0.01"))
+                payload["fx_rate"] = rate
+                payload["debit"], payload["credit"] = (base, Decimal("0")) if amount > 0 else (Decimal("0"), base)
+            elif not payload.get("fx_rate"):
+                payload["fx_rate"] = (Decimal(str(base)) / abs(amount)).quantize(FX_RATE_PLACES)
+            converted.append(payload)
+        return converted
+
+    def _delete_lines(self, entry: JournalEntry) -> None:
+        existing = list(entry.lines.all())
+        entry.lines.all().delete()
+        record_changes(ChangeEvent.Action.DELETED, existing)
+
+
+class BatchPostSerializer(serializers.Serializer):
+    ids = serializers.ListField(child=serializers.IntegerField(min_value=1), required=False, allow_empty=False)
+    filter = serializers.DictField(required=False)
+
+    def validate(self, attrs):
+        if ("ids" in attrs) == ("filter" in attrs):
+            raise serializers.ValidationError("Provide either ids or filter.")
+        return attrs
+
+
+class RecurringEntryLineSerializer(JournalLineSerializer):
+    class Meta(JournalLineSerializer.Meta):
+        model = RecurringEntryLine
+        fields = ["id", "account", "account_code", "account_name", "debit", "credit", "dimensions"]
+        read_only_fields = ["id", "account_code", "account_name"]
+
+
+class RecurringEntryTemplateSerializer(serializers.ModelSerializer):
+    lines = RecurringEntryLineSerializer(many=True)
+    created_by = serializers.StringRelatedField(read_only=True)
+
+    class Meta:
+        model = RecurringEntryTemplate
+        fields = [
+            "id",
+            "name",
+            "memo",
+            "frequency",
+            "start_date",
+            "end_date",
+            "entry_status",
+            "is_active",
+            "created_by",
+            "lines",
+            "created_at",
+            "updated_at",
+        ]
+        read_only_fields = ["id", "created_by", "created_at", "updated_at"]
+
+    def validate(self, attrs):
+        start = attrs.get("start_date", getattr(self.instance, "start_date", None))
+        end = attrs.get("end_date", getattr(self.instance, "end_date", None))
+        if start and end and end < start:
+            raise serializers.ValidationError("end_date must be on or after start_date.")
+        lines = attrs.get("lines")
+        if lines is not None:
+            if not lines:
+                raise serializers.ValidationError({"lines": "Templates require at least one line."})
+            debit = sum((line.get("debit") or Decimal("0") for line in lines), Decimal("0"))
+            credit = sum((line.get("credit") or Decimal("0") for line in lines), Decimal("0"))
+            if debit != credit:
+                raise serializers.ValidationError({"lines": "Template lines must balance debits and credits."})
+        return attrs
+
+    def create(self, validated_data):
+        lines_data = validated_data.pop("lines", [])
+        with transaction.atomic():
+            template = RecurringEntryTemplate.objects.create(**validated_data)
+            self._replace_lines(template, lines_data)
+        return template
+
+    def update(self, instance, validated_data):
+        lines_data = validated_data.pop("lines", None)
+        with transaction.atomic():
+            template = super().update(instance, validated_data)
+            if lines_data is not None:
+                template.lines.all().delete()
+                self._replace_lines(template, lines_data)
+        return template
+
+    def _replace_lines(self, template: RecurringEntryTemplate, lines_data) -> None:
+        RecurringEntryLine.objects.bulk_create(
+            [
+                RecurringEntryLine(
+                    template=template,
+                    account_id=payload["account"].pk,
+                    debit=payload.get("debit") or Decimal("0"),
+                    credit=payload.get("credit") or Decimal("0"),
+                    dimensions=payload.get("dimensions", {}),
+                )
+                for payload in lines_data
+            ]
+        )
+
+
+class RecurringRunSerializer(serializers.Serializer):
+    through = serializers.DateField()
+    templates = serializers.ListField(child=serializers.IntegerField(min_value=1), required=False, allow_empty=False)
+
+
+class AllocationDriverSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = AllocationDriver
+        fields = ["id", "dimension_value", "percentage"]
+        read_only_fields = ["id"]
+
+
+class AllocationRuleSerializer(serializers.ModelSerializer):
+    source_account = AccountField()
+    target_account = AccountField()
+    driver_account = AccountField(allow_null=True, required=False)
+    drivers = AllocationDriverSerializer(many=True, required=False)
+    created_by = serializers.StringRelatedField(read_only=True)
+
+    class Meta:
+        model = AllocationRule
+        fields = [
+            "id",
+            "name",
+            "source_account",
+            "target_account",
+            "dimension",
+            "driver_type",
+            "driver_account",
+            "drivers",
+            "is_active",
+            "created_by",
+            "created_at",
+            "updated_at",
+        ]
+        read_only_fields = ["id", "created_by", "created_at", "updated_at"]
+
+    def validate(self, attrs):
+        def current(name, default=None):
+            return attrs.get(name, getattr(self.instance, name, default))
+
+        driver_type = current("driver_type", AllocationRule.DriverType.FIXED)
+        if driver_type == AllocationRule.DriverType.FIXED:
+            drivers = attrs.get("drivers")
+            if drivers is None and self.instance is None:
+                drivers = []
+            if drivers is not None:
+                total = sum((driver["percentage"] for driver in drivers), Decimal("0"))
+                if total != Decimal("100"):
+                    raise serializers.ValidationError({"drivers": "Fixed percentages must total 100."})
+        elif current("driver_account") is None:
+            raise serializers.ValidationError({"driver_account": "Dimension balance drivers require a driver account."})
+        return attrs
+
+    def create(self, validated_data):
+        drivers_data = validated_data.pop("drivers", [])
+        with transaction.atomic():
+            rule = AllocationRule.objects.create(**validated_data)
+            self._replace_drivers(rule, drivers_data)
+        return rule
+
+    def update(self, instance, validated_data):
+        drivers_data = validated_data.pop("drivers", None)
+        with transaction.atomic():
+            rule = super().update(instance, validated_data)
+            if drivers_data is not None:
+                rule.drivers.all().delete()
+                self._replace_drivers(rule, drivers_data)
+        return rule
+
+    def _replace_drivers(self, rule: AllocationRule, drivers_data) -> None:
+        AllocationDriver.objects.bulk_create([AllocationDriver(rule=rule, **driver) for driver in drivers_data])
+
+
+class AllocationRunSerializer(serializers.Serializer):
+    start_date = serializers.DateField()
+    end_date = serializers.DateField()
+    entry_date = serializers.DateField(required=False)
+    preview = serializers.BooleanField(default=False)
+
+    def validate(self, attrs):
+        if attrs["start_date"] > attrs["end_date"]:
+            raise serializers.ValidationError("start_date must be before end_date")
+        return attrs
+
+
+class FiscalYearCloseSerializer(serializers.ModelSerializer):
+    closed_by = serializers.StringRelatedField(read_only=True)
+
+    class Meta:
+        model = FiscalYearClose
+        fields = [
+            "id",
+            "year",
+            "closing_entry",
+            "retained_earnings_account",
+            "net_income",
+            "closed_by",
+            "closed_at",
+        ]
+        read_only_fields = fields
+
+
+class FiscalYearCloseRequestSerializer(serializers.Serializer):
+    year = serializers.IntegerField(min_value=1900, max_value=9999)
+    retained_earnings_code = serializers.CharField(max_length=16, required=False)
+
+
+class FiscalPeriodSerializer(serializers.ModelSerializer):
+    locked_by = serializers.StringRelatedField(read_only=True)
+
+    class Meta:
+        model = FiscalPeriod
+        fields = ["id", "start", "end", "status", "locked_by", "locked_at"]
+        read_only_fields = fields
+
+
+class PeriodLockSerializer(serializers.Serializer):
+    period = serializers.DateField(input_formats=["%Y-%m", "%Y-%m-%d"])
+
+
+class ExchangeRateSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ExchangeRate
+        fields = ["id", "from_currency", "to_currency", "date", "rate", "created_at"]
+        read_only_fields = ["id", "created_at"]
+
+    def validate(self, attrs):
+        for name in ("from_currency", "to_currency"):
+            if name in attrs:
+                attrs[name] = attrs[name].upper()
+        if attrs.get("from_currency") and attrs.get("from_currency") == attrs.get("to_currency"):
+            raise serializers.ValidationError("from_currency and to_currency must differ.")
+        if "rate" in attrs and attrs["rate"] <= 0:
+            raise serializers.ValidationError({"rate": "Rate must be positive."})
+        return attrs
+
+
+class ExchangeRateLoadSerializer(ExchangeRateSerializer):
+    """Rows of a bulk rate load, which may overwrite existing (pair, date) rates."""
+
+    class Meta(ExchangeRateSerializer.Meta):
+        validators = []
+
+
+class RateLookupSerializer(serializers.Serializer):
+    from_currency = serializers.CharField(max_length=3)
+    to_currency = serializers.CharField(max_length=3, required=False)
+    date = serializers.DateField()
+
+
+class AccountAutocompleteQuerySerializer(serializers.Serializer):
+    q = serializers.CharField(required=False, allow_blank=True, max_length=128, default="")
+    type = serializers.MultipleChoiceField(choices=Account.Type.choices, required=False)
+    include_inactive = serializers.BooleanField(default=False)
+    limit = serializers.IntegerField(min_value=1, max_value=1000, default=20)
@@ -0,0 +1,1245 @@
+from __future__ import annotations
+
+import bisect
+import calendar
+import hashlib
+import itertools
+import json
+import re
+import threading
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+from datetime import date
+from decimal import Decimal
+from functools import cached_property
+from typing import Iterable
+
+from django.conf import settings
+from django.db import connection, models, transaction
+from django.db.models import Count, F, Max, Min, Sum, Value
+from django.db.models.fields.json import KeyTextTransform
+from django.db.models.functions import Coalesce, TruncMonth
+from django.utils import timezone
+
+from apps.core.models import ChangeEvent
+from apps.core.services import lock_metrics, lock_rows, map_in_processes, record_changes
+
+from .models import (
+    Account,
+    AccountPeriodBalance,
+    AllocationRule,
+    EntrySeal,
+    ExchangeRate,
+    FiscalPeriod,
+    FiscalYearClose,
+    JournalEntry,
+    JournalLine,
+    PendingSeal,
+    RecurringEntryTemplate,
+    SealChainHead,
+)
+
+ACCOUNT_FIELDS = ("id", "code", "name", "type", "is_active", "parent_id")
+
+
+@dataclass(frozen=True)
+class AccountRecord:
+    id: int
+    code: str
+    name: str
+    type: str
+    is_active: bool
+    parent_id: int | None
+
+    @property
+    def label(self) -> str:
+        return f"{self.code} – {self.name}"
+
+
+class ChartOfAccounts:
+    """Immutable snapshot of every account, indexed by id, code and type."""
+
+    def __init__(self, version: int, records: Iterable[AccountRecord]) -> None:
+        self.version = version
+        self.loaded_at = time.monotonic()
+        ordered = sorted(records, key=lambda record: record.code)
+        self.by_id = {record.id: record for record in ordered}
+        self.by_code = {record.code: record for record in ordered}
+        by_type: dict[str, list[AccountRecord]] = {}
+        for record in ordered:
+            by_type.setdefault(record.type, []).append(record)
+        self.by_type = {key: tuple(value) for key, value in by_type.items()}
+
+    def __iter__(self):
+        return iter(self.by_id.values())
+
+    def __len__(self) -> int:
+        return len(self.by_id)
+
+    def get(self, account_id) -> AccountRecord | None:
+        return self.by_id.get(account_id)
+
+    def get_by_code(self, code: str) -> AccountRecord | None:
+        return self.by_code.get(code)
+
+    def of_type(self, *types: str) -> list[AccountRecord]:
+        records: list[AccountRecord] = []
+        for account_type in types:
+            records.extend(self.by_type.get(account_type, ()))
+        return sorted(records, key=lambda record: record.code)
+
+    def parent_chain(self, account_id) -> list[AccountRecord]:
+        chain: list[AccountRecord] = []
+        seen = {account_id}
+        record = self.by_id.get(account_id)
+        while record is not None and record.parent_id is not None and record.parent_id not in seen:
+            seen.add(record.parent_id)
+            record = self.by_id.get(record.parent_id)
+            if record is not None:
+                chain.append(record)
+        return chain
+
+    def instance(self, account_id) -> Account:
+        record = self.by_id[account_id]
+        # Remaining fields stay deferred and load on first access.
+        return Account.from_db("default", ACCOUNT_FIELDS, [getattr(record, name) for name in ACCOUNT_FIELDS])
+
+    @cached_property
+    def digest(self) -> str:
+        """Content hash of the chart, identical in every process that loaded the same accounts."""
+        payload = json.dumps([[getattr(record, name) for name in ACCOUNT_FIELDS] for record in self.by_id.values()])
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32]
+
+    @cached_property
+    def _prefix_index(self) -> tuple[list[str], list[int]]:
+        # Sorted (token, account id) pairs over codes and name words; a prefix is one bisect range.
+        pairs = sorted({(token, record.id) for record in self for token in _account_tokens(record)})
+        return [token for token, _ in pairs], [account_id for _, account_id in pairs]
+
+    def complete(
+        self, query: str, limit: int = 20, types: Iterable[str] | None = None, include_inactive: bool = False
+    ) -> list[AccountRecord]:
+        """Accounts whose code or name words start with every term of `query`.
+
+        Code matches come first, then names starting with the query, then other word matches.
+        """
+        terms = _TOKEN.findall(query.lower())
+        if terms:
+            tokens, ids = self._prefix_index
+            matches: set[int] | None = None
+            for term in terms:
+                found = set(ids[bisect.bisect_left(tokens, term) : bisect.bisect_left(tokens, term + "\uffff")])
+                matches = found if matches is None else matches & found
+                if not matches:
+                    return []
+            records = [self.by_id[account_id] for account_id in matches]
+        else:
+            records = list(self)
+        types = set(types or ())
+        records = [
+            record
+            for record in records
+            if (include_inactive or record.is_active) and (not types or record.type in types)
+        ]
+        prefix = query.strip().lower()
+
+        def rank(record: AccountRecord) -> tuple:
+            if record.code.lower().startswith(prefix):
+                return (0, record.code)
+            if record.name.lower().startswith(prefix):
+                return (1, record.code)
+            return (2, record.code)
+
+        return sorted(records, key=rank)[:limit]
+
+
+_TOKEN = re.compile(r"\w+")
+
+
+def _account_tokens(record: AccountRecord) -> set[str]:
+    return {record.code.lower(), *_TOKEN.findall(record.code.lower()), *_TOKEN.findall(record.name.lower())}
+
+
+_lock = threading.Lock()
+_chart: ChartOfAccounts | None = None
+_version = 0
+
+
+def _load_chart() -> ChartOfAccounts:
+    global _chart
+    with _lock:
+        version = _version
+        records = [AccountRecord(*row) for row in Account.objects.values_list(*ACCOUNT_FIELDS)]
+        chart = ChartOfAccounts(version, records)
+        if version == _version:
+            _chart = chart
+        return chart
+
+
+def chart_of_accounts() -> ChartOfAccounts:
+    chart = _chart
+    timeout = getattr(settings, "LEDGER_CHART_CACHE_TIMEOUT", 300)
+    if chart is None or time.monotonic() - chart.loaded_at > timeout:
+        chart = _load_chart()
+    return chart
+
+
+def _reload_for_miss(chart: ChartOfAccounts) -> ChartOfAccounts:
+    """Reload after a lookup missed, unless the chart is fresher than the miss reload interval.
+
+    Accounts saved in this process invalidate the chart at once; the reload only catches ones
+    another process created, and the interval keeps unknown ids from forcing a table read each.
+    """
+    if time.monotonic() - chart.loaded_at < settings.LEDGER_CHART_MISS_RELOAD_INTERVAL:
+        return chart
+    return _load_chart()
+
+
+def chart_covering(account_ids: Iterable[int]) -> ChartOfAccounts:
+    """Return a chart that knows every id in `account_ids`, reloading once if needed."""
+    chart = chart_of_accounts()
+    if any(account_id not in chart.by_id for account_id in account_ids):
+        chart = _reload_for_miss(chart)
+    return chart
+
+
+def get_account(account_id) -> AccountRecord | None:
+    """Resolve an account by id, reloading once in case another process created it."""
+    chart = chart_of_accounts()
+    record = chart.get(account_id)
+    if record is None:
+        record = _reload_for_miss(chart).get(account_id)
+    return record
+
+
+def invalidate_chart_of_accounts() -> None:
+    global _chart, _version
+    with _lock:
+        _version += 1
+        _chart = None
+
+
+FX_RATE_PLACES = Decimal("0.00000001")
+
+
+class FxRateMissing(Exception):
+    pass
+
+
+class RateTable:
+    """Immutable snapshot of every exchange rate, as date-sorted series per currency pair.
+
+    Lookups use the latest rate on or before the requested date and never touch the database.
+    """
+
+    def __init__(self, version: int, rows: Iterable[tuple[str, str, date, Decimal]]) -> None:
+        self.version = version
+        self.loaded_at = time.monotonic()
+        series: dict[tuple[str, str], tuple[list[date], list[Decimal]]] = {}
+        for from_currency, to_currency, day, rate in sorted(rows):
+            dates, rates = series.setdefault((from_currency, to_currency), ([], []))
+            dates.append(day)
+            rates.append(rate)
+        self.series = series
+
+    def _lookup(self, pair: tuple[str, str], on: date) -> Decimal | None:
+        found = self.series.get(pair)
+        if found is None:
+            return None
+        dates, rates = found
+        index = bisect.bisect_right(dates, on) - 1
+        return rates[index] if index >= 0 else None
+
+    def rate(self, from_currency: str, to_currency: str, on: date) -> Decimal | None:
+        if from_currency == to_currency:
+            return Decimal("1")
+        direct = self._lookup((from_currency, to_currency), on)
+        if direct is not None:
+            return direct
+        inverse = self._lookup((to_currency, from_currency), on)
+        if inverse:
+            return (Decimal("1") / inverse).quantize(FX_RATE_PLACES)
+        return None
+
+    def convert(self, amount: Decimal, currency: str, on: date, to_currency: str | None = None) -> Decimal:
+        to_currency = to_currency or settings.BASE_CURRENCY
+        rate = self.rate(currency, to_currency, on)
+        if rate is None:
+            raise FxRateMissing(f"No {currency}/{to_currency} rate on or before {on.isoformat()}.")
+        return (amount * rate).quantize(Decimal("0.01"))
+
+
+_rates_lock = threading.Lock()
+_rate_table: RateTable | None = None
+_rates_version = 0
+
+
+def _load_rates() -> RateTable:
+    global _rate_table
+    with _rates_lock:
+        version = _rates_version
+        table = RateTable(version, ExchangeRate.objects.values_list("from_currency", "to_currency", "date", "rate"))
+        if version == _rates_version:
+            _rate_table = table
+        return table
+
+
+def fx_rates() -> RateTable:
+    table = _rate_table
+    timeout = getattr(settings, "FX_RATE_CACHE_TIMEOUT", 300)
+    if table is None or time.monotonic() - table.loaded_at > timeout:
+        table = _load_rates()
+    return table
+
+
+def invalidate_fx_rates() -> None:
+    global _rate_table, _rates_version
+    with _rates_lock:
+        _rates_version += 1
+        _rate_table = None
+
+
+
+class PeriodLockedError(Exception):
+    pass
+
+
+def month_start(value: date) -> date:
+    return value.replace(day=1)
+
+
+def month_end(value: date) -> date:
+    return value.replace(day=calendar.monthrange(value.year, value.month)[1])
+
+
+def locked_months(start: date, end: date) -> set[date]:
+    return set(
+        FiscalPeriod.objects.filter(
+            status=FiscalPeriod.Status.LOCKED,
+            start__gte=month_start(start),
+            start__lte=end,
+        ).values_list("start", flat=True)
+    )
+
+
+def _closed_months(months: set[date]) -> set[date]:
+    closed = set(FiscalYearClose.objects.filter(year__in={value.year for value in months}).values_list("year", flat=True))
+    return {value for value in months if value.year in closed}
+
+
+def _create_periods(months: set[date]) -> None:
+    existing = set(FiscalPeriod.objects.filter(start__in=months).values_list("start", flat=True))
+    if months - existing:
+        FiscalPeriod.objects.bulk_create(
+            [FiscalPeriod(start=value, end=month_end(value)) for value in sorted(months - existing)],
+            ignore_conflicts=True,
+        )
+
+
+def hold_months(months: Iterable[date]) -> set[date]:
+    """Return which of `months` are locked or fall in a closed fiscal year.
+
+    Inside a transaction each month's FiscalPeriod row is created if missing and share-locked,
+    so a concurrent lock_period or year-end close waits for this transaction's postings before
+    freezing totals, while postings into the same month still run side by side.
+    """
+    months = {month_start(value) for value in months}
+    if not months:
+        return set()
+    if not transaction.get_connection().in_atomic_block:
+        return _closed_months(months) | set(
+            FiscalPeriod.objects.filter(start__in=months, status=FiscalPeriod.Status.LOCKED).values_list("start", flat=True)
+        )
+    _create_periods(months)
+    periods = FiscalPeriod.objects.filter(start__in=months).order_by("start").values_list("start", "status")
+    if connection.vendor == "postgresql":
+        started = time.perf_counter()
+        sql, params = periods.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f"{sql} FOR SHARE", params)
+            rows = cursor.fetchall()
+        lock_metrics.observe_wait("ledger.fiscal_period", time.perf_counter() - started)
+    else:
+        rows = lock_rows(periods, "ledger.fiscal_period")
+    # Read after the row locks so a year-end close that just committed is seen.
+    return _closed_months(months) | {start for start, status in rows if status == FiscalPeriod.Status.LOCKED}
+
+
+def _hold_fiscal_year(year: int) -> dict[date, FiscalPeriod]:
+    """Lock the year's twelve periods, waiting for postings into any of them to commit."""
+    months = {date(year, month, 1) for month in range(1, 13)}
+    _create_periods(months)
+    periods = lock_rows(FiscalPeriod.objects.filter(start__in=months).order_by("start"), "ledger.fiscal_period")
+    return {period.start: period for period in periods}
+
+
+def ensure_periods_open(*dates: date | None) -> None:
+    dates = [value for value in dates if value]
+    if not dates:
+        return
+    blocked = sorted(hold_months(dates))
+    if blocked:
+        if FiscalYearClose.objects.filter(year=blocked[0].year).exists():
+            raise PeriodLockedError(f"Fiscal year {blocked[0].year} is closed.")
+        raise PeriodLockedError(f"Period {blocked[0]:%Y-%m} is locked.")
+
+
+def is_range_locked(start: date, end: date) -> bool:
+    """True when every month touching [start, end] is locked, so its postings can no longer change."""
+    months = set()
+    cursor = month_start(start)
+    while cursor <= end:
+        months.add(cursor)
+        cursor = add_months(cursor, 1)
+    return months <= locked_months(start, end)
+
+
+def lock_period(period_start: date, user) -> FiscalPeriod:
+    """Lock a month and freeze its per-account posted totals."""
+    start = month_start(period_start)
+    end = month_end(start)
+    with transaction.atomic():
+        period, _ = FiscalPeriod.objects.get_or_create(start=start, defaults={"end": end})
+        (period,) = lock_rows(FiscalPeriod.objects.filter(pk=period.pk), "ledger.fiscal_period")
+        if period.status == FiscalPeriod.Status.LOCKED:
+            return period
+        totals = (
+            _posted_lines(start, end)
+            .values("account_id")
+            .annotate(total_debit=Sum("debit"), total_credit=Sum("credit"))
+            .order_by()
+        )
+        period.balances.all().delete()
+        AccountPeriodBalance.objects.bulk_create(
+            [
+                AccountPeriodBalance(
+                    period=period,
+                    account_id=row["account_id"],
+                    debit=row["total_debit"] or Decimal("0"),
+                    credit=row["total_credit"] or Decimal("0"),
+                )
+                for row in totals
+            ]
+        )
+        period.status = FiscalPeriod.Status.LOCKED
+        period.locked_by = user
+        period.locked_at = timezone.now()
+        period.save(update_fields=["status", "locked_by", "locked_at"])
+    return period
+
+
+def unlock_period(period: FiscalPeriod) -> FiscalPeriod:
+    from .signals import period_unlocked
+
+    with transaction.atomic():
+        period.balances.all().delete()
+        period.status = FiscalPeriod.Status.OPEN
+        period.locked_by = None
+        period.locked_at = None
+        period.save(update_fields=["status", "locked_by", "locked_at"])
+        period_unlocked.send(sender=FiscalPeriod, period=period)
+    return period
+
+
+def locked_account_totals(start: date, end: date) -> list[dict] | None:
+    """Per-account debit/credit totals for whole locked months, read from the frozen balances.
+
+    Returns None when the range is not made of whole, locked months.
+    """
+    if start != month_start(start) or end != month_end(end) or not is_range_locked(start, end):
+        return None
+    return list(
+        AccountPeriodBalance.objects.filter(period__start__gte=start, period__end__lte=end)
+        .values("account_id")
+        .annotate(total_debit=Sum("debit"), total_credit=Sum("credit"))
+        .order_by()
+    )
+
+
+@dataclass
+class BatchPostResult:
+    posted: list[int] = field(default_factory=list)
+    failures: dict[int, str] = field(default_factory=dict)
+    budget_warnings: dict[int, list] = field(default_factory=dict)
+
+
+def post_entries(entries: Iterable[int] | models.QuerySet, user) -> BatchPostResult:
+    """Post many draft entries with one balance check, one lock and one UPDATE.
+
+    Entries that would overrun a budget are rejected under `BUDGET_CONTROL=block` and
+    listed in `budget_warnings` otherwise.
+    """
+    from apps.budgets.services import BudgetControl, Posting, check_postings, entry_expense_amounts, overrun_messages
+
+    from .signals import entries_posted
+
+    result = BatchPostResult()
+    with transaction.atomic():
+        if isinstance(entries, models.QuerySet):
+            # Re-select by id so filters that use DISTINCT still allow row locks.
+            queryset = JournalEntry.objects.filter(
+                id__in=entries.filter(status=JournalEntry.Status.DRAFT).values("id")
+            )
+            requested: set[int] = set()
+        else:
+            requested = {int(entry_id) for entry_id in entries}
+            queryset = JournalEntry.objects.filter(id__in=requested)
+        rows = lock_rows(queryset.order_by("id").values_list("id", "status", "date"), "ledger.journal_entry")
+        found = {row[0] for row in rows}
+
+        for entry_id in sorted(requested - found):
+            result.failures[entry_id] = "Journal entry not found."
+        locked = hold_months(row[2] for row in rows if row[1] == JournalEntry.Status.DRAFT)
+        drafts = []
+        for entry_id, status, entry_date in rows:
+            if status != JournalEntry.Status.DRAFT:
+                result.failures[entry_id] = "Entry is already posted."
+            elif month_start(entry_date) in locked:
+                result.failures[entry_id] = f"Period {entry_date:%Y-%m} is locked."
+            else:
+                drafts.append(entry_id)
+
+        totals = {
+            row["entry_id"]: row
+            for row in JournalLine.objects.filter(entry_id__in=drafts)
+            .values("entry_id")
+            .annotate(total_debit=Sum("debit"), total_credit=Sum("credit"), line_count=Count("id"))
+            .order_by()
+        }
+        for entry_id in drafts:
+            row = totals.get(entry_id)
+            if row is None or not row["line_count"]:
+                result.failures[entry_id] = "Posted entries require at least one line."
+            elif (row["total_debit"] or Decimal("0")) != (row["total_credit"] or Decimal("0")):
+                result.failures[entry_id] = "Posted entries must balance debits and credits."
+            else:
+                result.posted.append(entry_id)
+
+        dates = {entry_id: entry_date for entry_id, _, entry_date in rows}
+        amounts = entry_expense_amounts(result.posted)
+        overruns = check_postings(
+            Posting(entry_id, dates[entry_id], amounts[entry_id]) for entry_id in result.posted if entry_id in amounts
+        )
+        if settings.BUDGET_CONTROL == BudgetControl.BLOCK:
+            for entry_id, overrun in overruns.items():
+                result.failures[entry_id] = " ".join(overrun_messages(overrun))
+            result.posted = [entry_id for entry_id in result.posted if entry_id not in overruns]
+        else:
+            result.budget_warnings = overruns
+
+        if result.posted:
+            JournalEntry.objects.filter(id__in=result.posted).update(
+                status=JournalEntry.Status.POSTED,
+                approved_by=Coalesce(F("approved_by"), Value(user.pk), output_field=models.BigIntegerField()),
+                updated_at=timezone.now(),
+            )
+            record_changes(ChangeEvent.Action.UPDATED, JournalEntry.objects.filter(id__in=result.posted))
+            entries_posted.send(sender=JournalEntry, entry_ids=result.posted)
+    return result
+
+
+def add_months(value: date, months: int) -> date:
+    month_index = value.month - 1 + months
+    year = value.year + month_index // 12
+    month = month_index % 12 + 1
+    return date(year, month, min(value.day, calendar.monthrange(year, month)[1]))
+
+
+def occurrence_dates(template: RecurringEntryTemplate, through: date) -> list[date]:
+    last = min(through, template.end_date) if template.end_date else through
+    dates: list[date] = []
+    step = template.months_between
+    count = 0
+    # Offset from the start date each time so month-end schedules keep their day.
+    current = template.start_date
+    while current <= last:
+        dates.append(current)
+        count += 1
+        current = add_months(template.start_date, count * step)
+    return dates
+
+
+class RecurringTemplateError(Exception):
+    pass
+
+
+def _check_template_lines(template: RecurringEntryTemplate, chart: ChartOfAccounts) -> None:
+    lines = list(template.lines.all())
+    if not lines:
+        raise RecurringTemplateError("Template has no lines.")
+    for line in lines:
+        account = chart.get(line.account_id)
+        if account is None or not account.is_active:
+            raise RecurringTemplateError(f"Account {line.account_id} is missing or inactive.")
+    debit = sum((line.debit for line in lines), Decimal("0"))
+    credit = sum((line.credit for line in lines), Decimal("0"))
+    if debit != credit:
+        raise RecurringTemplateError("Template lines must balance debits and credits.")
+
+
+@dataclass
+class RecurringRunResult:
+    created: dict[int, int] = field(default_factory=dict)
+    failures: dict[int, str] = field(default_factory=dict)
+    budget_warnings: dict[int, list] = field(default_factory=dict)
+
+    @property
+    def total_created(self) -> int:
+        return sum(self.created.values())
+
+
+def generate_recurring_entries(
+    through: date,
+    templates: models.QuerySet | None = None,
+    approver=None,
+    batch_size: int = 1000,
+) -> RecurringRunResult:
+    """Materialize every template occurrence due on or before `through`.
+
+    Occurrences that already exist are skipped, so re-running is safe and a
+    first run backfills the whole history in bulk. Posted occurrences that would
+    overrun a budget are created as drafts under `BUDGET_CONTROL=block` and listed
+    in `budget_warnings` otherwise.
+    """
+    from apps.budgets.services import BudgetControl, Posting, check_postings, expense_amounts
+
+    from .signals import entries_posted
+
+    if templates is None:
+        templates = RecurringEntryTemplate.objects.filter(is_active=True)
+    templates = list(templates.filter(start_date__lte=through).prefetch_related("lines"))
+    chart = chart_covering(line.account_id for template in templates for line in template.lines.all())
+
+    result = RecurringRunResult()
+    for template in templates:
+        try:
+            _check_template_lines(template, chart)
+        except RecurringTemplateError as exc:
+            result.failures[template.pk] = str(exc)
+            continue
+        with transaction.atomic():
+            # Serializes concurrent runs for the same template.
+            lock_rows(RecurringEntryTemplate.objects.filter(pk=template.pk), "ledger.recurring_template")
+            existing = set(
+                JournalEntry.objects.filter(recurring_template=template).values_list("recurrence_date", flat=True)
+            )
+            due = [value for value in occurrence_dates(template, through) if value not in existing]
+            if due:
+                locked = hold_months(due)
+                skipped = [value for value in due if month_start(value) in locked]
+                if skipped:
+                    result.failures[template.pk] = f"Skipped {len(skipped)} occurrences in locked periods."
+                    due = [value for value in due if month_start(value) not in locked]
+            if not due:
+                continue
+            posted = template.entry_status == JournalEntry.Status.POSTED
+            template_lines = list(template.lines.all())
+            overruns = {}
+            if posted:
+                amounts = expense_amounts(template_lines)
+                overruns = check_postings(Posting(value, value, amounts) for value in due)
+            held = set(overruns) if settings.BUDGET_CONTROL == BudgetControl.BLOCK else set()
+            if held:
+                message = f"Left {len(held)} occurrences over budget as drafts."
+                result.failures[template.pk] = f"{result.failures[template.pk]} {message}" if template.pk in result.failures else message
+            entries = JournalEntry.objects.bulk_create(
+                [
+                    JournalEntry(
+                        date=value,
+                        memo=f"{template.memo or template.name} ({value:%b %Y})",
+                        status=JournalEntry.Status.DRAFT if value in held else template.entry_status,
+                        created_by_id=template.created_by_id,
+                        approved_by=approver if posted and value not in held else None,
+                        recurring_template=template,
+                        recurrence_date=value,
+                    )
+                    for value in due
+                ],
+                batch_size=batch_size,
+            )
+            lines = JournalLine.objects.bulk_create(
+                [
+                    JournalLine(
+                        entry=entry,
+                        account_id=line.account_id,
+                        debit=line.debit,
+                        credit=line.credit,
+                        dimensions={**line.dimensions, "recurring_template": template.pk},
+                    )
+                    for entry in entries
+                    for line in template_lines
+                ],
+                batch_size=batch_size,
+            )
+            record_changes(ChangeEvent.Action.CREATED, entries)
+            record_changes(ChangeEvent.Action.CREATED, lines)
+            posted_ids = [entry.pk for entry in entries if entry.status == JournalEntry.Status.POSTED]
+            if posted_ids:
+                entries_posted.send(sender=JournalEntry, entry_ids=posted_ids)
+                if not held:
+                    result.budget_warnings.update(
+                        (entry.pk, overruns[entry.recurrence_date]) for entry in entries if entry.recurrence_date in overruns
+                    )
+        result.created[template.pk] = len(entries)
+    return result
+
+
+CENT = Decimal("0.01")
+
+
+class AllocationError(Exception):
+    pass
+
+
+def split_amount(total: Decimal, weights: dict[str, Decimal]) -> dict[str, Decimal]:
+    """Split `total` in proportion to `weights`, rounded to cents, summing exactly to `total`.
+
+    Leftover cents go to the keys with the largest rounding remainders.
+    """
+    weight_sum = sum(weights.values(), Decimal("0"))
+    if weight_sum <= 0:
+        raise AllocationError("Driver weights must be positive.")
+    sign = -1 if total < 0 else 1
+    cents = int((abs(total) / CENT).to_integral_value())
+    raw = {key: Decimal(cents) * weight / weight_sum for key, weight in weights.items()}
+    floors = {key: int(value) for key, value in raw.items()}
+    leftover = cents - sum(floors.values())
+    by_remainder = sorted(raw, key=lambda key: (raw[key] - floors[key], key), reverse=True)
+    for key in by_remainder[:leftover]:
+        floors[key] += 1
+    return {key: sign * Decimal(value) * CENT for key, value in floors.items() if value}
+
+
+def _posted_lines(start: date, end: date):
+    return JournalLine.objects.filter(
+        entry__status=JournalEntry.Status.POSTED,
+        entry__date__gte=start,
+        entry__date__lte=end,
+    )
+
+
+def allocation_weights(rule: AllocationRule, start: date, end: date) -> dict[str, Decimal]:
+    if rule.driver_type == AllocationRule.DriverType.FIXED:
+        return {driver.dimension_value: driver.percentage for driver in rule.drivers.all() if driver.percentage > 0}
+    if rule.driver_account_id is None:
+        raise AllocationError("Dimension balance drivers require a driver account.")
+    rows = (
+        _posted_lines(start, end)
+        .filter(account_id=rule.driver_account_id)
+        .annotate(driver=KeyTextTransform(rule.dimension, "dimensions"))
+        .exclude(driver__isnull=True)
+        .values("driver")
+        .annotate(balance=Sum("debit") - Sum("credit"))
+        .order_by()
+    )
+    return {row["driver"]: abs(row["balance"]) for row in rows if row["balance"]}
+
+
+@dataclass
+class AllocationPlan:
+    rule: AllocationRule
+    source_amount: Decimal
+    shares: dict[str, Decimal]
+
+
+def plan_allocation(rule: AllocationRule, start: date, end: date) -> AllocationPlan:
+    source_lines = _posted_lines(start, end).filter(account_id=rule.source_account_id)
+    if rule.source_account_id == rule.target_account_id:
+        # Redistributing within one account: only untagged amounts are still unallocated.
+        source_lines = source_lines.exclude(dimensions__has_key=rule.dimension)
+    totals = source_lines.aggregate(debit=Sum("debit"), credit=Sum("credit"))
+    source_amount = (totals["debit"] or Decimal("0")) - (totals["credit"] or Decimal("0"))
+    if not source_amount:
+        raise AllocationError("Source account has no balance to allocate for the period.")
+    weights = allocation_weights(rule, start, end)
+    if not weights:
+        raise AllocationError("No driver values found for the period.")
+    return AllocationPlan(rule=rule, source_amount=source_amount, shares=split_amount(source_amount, weights))
+
+
+def run_allocation(rule: AllocationRule, start: date, end: date, user, entry_date: date | None = None) -> JournalEntry:
+    """Post one balanced entry moving the source balance onto the target, one line per driver value.
+
+    Budgets the entry would overrun are left on its `budget_warnings`, or raise under
+    `BUDGET_CONTROL=block`.
+    """
+    from apps.budgets.services import BudgetControl, Posting, check_postings, expense_amounts, overrun_messages
+
+    from .signals import entries_posted
+
+    plan = plan_allocation(rule, start, end)
+    entry_date = entry_date or end
+    dimensions = {"allocation_rule": rule.pk, "period": f"{start.isoformat()}/{end.isoformat()}"}
+
+    def line(account_id, amount, extra=None):
+        debit, credit = (amount, Decimal("0")) if amount > 0 else (Decimal("0"), -amount)
+        return JournalLine(account_id=account_id, debit=debit, credit=credit, dimensions={**dimensions, **(extra or {})})
+
+    lines = [line(rule.source_account_id, -plan.source_amount)]
+    lines.extend(
+        line(rule.target_account_id, amount, {rule.dimension: value})
+        for value, amount in sorted(plan.shares.items())
+    )
+    with transaction.atomic():
+        ensure_periods_open(entry_date)
+        entry = JournalEntry.objects.create(
+            date=entry_date,
+            memo=f"Allocation: {rule.name} {start:%Y-%m-%d} to {end:%Y-%m-%d}",
+            status=JournalEntry.Status.POSTED,
+            created_by=user,
+            approved_by=user,
+        )
+        for journal_line in lines:
+            journal_line.entry = entry
+        created = JournalLine.objects.bulk_create(lines)
+        record_changes(ChangeEvent.Action.CREATED, [entry])
+        record_changes(ChangeEvent.Action.CREATED, created)
+        overruns = check_postings([Posting(entry.pk, entry_date, expense_amounts(lines))]).get(entry.pk)
+        if overruns and settings.BUDGET_CONTROL == BudgetControl.BLOCK:
+            raise AllocationError(" ".join(overrun_messages(overruns)))
+        entry.budget_warnings = overruns or []
+        entries_posted.send(sender=JournalEntry, entry_ids=[entry.pk])
+    return entry
+
+
+class FiscalYearCloseError(Exception):
+    pass
+
+
+def close_fiscal_year(year: int, user, retained_earnings_code: str | None = None) -> FiscalYearClose:
+    """Zero every revenue and expense account for `year` into retained earnings.
+
+    Balances come from one grouped aggregate and the closing entry's lines are
+    written with one bulk insert. Once closed, the year takes no more postings
+    until it is reopened.
+    """
+    from .signals import entries_posted
+
+    code = retained_earnings_code or settings.RETAINED_EARNINGS_ACCOUNT_CODE
+    chart = chart_of_accounts()
+    retained = chart.get_by_code(code)
+    if retained is None or retained.type != Account.Type.EQUITY:
+        raise FiscalYearCloseError(f"Retained earnings account {code} must exist and be an equity account.")
+    pnl_ids = [account.id for account in chart.of_type(Account.Type.REVENUE, Account.Type.EXPENSE)]
+    year_end = date(year, 12, 31)
+    if year_end >= timezone.localdate():
+        raise FiscalYearCloseError(f"Fiscal year {year} has not ended yet.")
+
+    with transaction.atomic():
+        periods = _hold_fiscal_year(year)
+        if FiscalYearClose.objects.filter(year=year).exists():
+            raise FiscalYearCloseError(f"Fiscal year {year} is already closed.")
+        if periods[month_start(year_end)].status == FiscalPeriod.Status.LOCKED:
+            raise PeriodLockedError(f"Period {year_end:%Y-%m} is locked.")
+        balances = (
+            _posted_lines(date(year, 1, 1), year_end)
+            .filter(account_id__in=pnl_ids, entry__is_closing=False)
+            .values("account_id")
+            .annotate(total_debit=Sum("debit"), total_credit=Sum("credit"))
+            .order_by()
+        )
+        lines: list[JournalLine] = []
+        net_debit = Decimal("0")
+        for row in balances:
+            balance = (row["total_debit"] or Decimal("0")) - (row["total_credit"] or Decimal("0"))
+            if not balance:
+                continue
+            net_debit += balance
+            lines.append(
+                JournalLine(
+                    account_id=row["account_id"],
+                    debit=-balance if balance < 0 else Decimal("0"),
+                    credit=balance if balance > 0 else Decimal("0"),
+                    dimensions={"fiscal_year_close": year},
+                )
+            )
+        if not lines:
+            raise FiscalYearCloseError(f"No revenue or expense activity to close for {year}.")
+        if net_debit:
+            lines.append(
+                JournalLine(
+                    account_id=retained.id,
+                    debit=net_debit if net_debit > 0 else Decimal("0"),
+                    credit=-net_debit if net_debit < 0 else Decimal("0"),
+                    dimensions={"fiscal_year_close": year},
+                )
+            )
+        entry = JournalEntry.objects.create(
+            date=year_end,
+            memo=f"Year-end close {year}",
+            status=JournalEntry.Status.POSTED,
+            created_by=user,
+            approved_by=user,
+            is_closing=True,
+        )
+        for line in lines:
+            line.entry = entry
+        created = JournalLine.objects.bulk_create(lines)
+        closing = FiscalYearClose.objects.create(
+            year=year,
+            closing_entry=entry,
+            retained_earnings_account_id=retained.id,
+            net_income=-net_debit,
+            closed_by=user,
+        )
+        record_changes(ChangeEvent.Action.CREATED, [entry])
+        record_changes(ChangeEvent.Action.CREATED, created)
+        entries_posted.send(sender=JournalEntry, entry_ids=[entry.pk])
+    return closing
+
+
+def reopen_fiscal_year(closing: FiscalYearClose) -> None:
+    from .signals import entries_unposting
+
+    with transaction.atomic():
+        entry = closing.closing_entry
+        periods = _hold_fiscal_year(closing.year)
+        if periods[month_start(entry.date)].status == FiscalPeriod.Status.LOCKED:
+            raise PeriodLockedError(f"Period {entry.date:%Y-%m} is locked.")
+        entries_unposting.send(sender=JournalEntry, entry_ids=[entry.pk])
+        record_changes(ChangeEvent.Action.DELETED, entry.lines.all())
+        record_changes(ChangeEvent.Action.DELETED, [entry])
+        entry_id = entry.pk
+        closing.delete()
+        entry.delete()
+        seal_entries([entry_id])
+
+
+GENESIS_DIGEST = "0" * 64
+
+
+def entry_content_hash(entry_id: int, entry_date: date, memo: str, lines) -> str:
+    """Hash of a posted entry's header and its lines in id order.
+
+    Lines are `(account_id, debit, credit, dimensions, currency, amount_currency)`; the currency
+    part only counts for foreign-currency lines.
+    """
+    digest = hashlib.sha256(f"{entry_id}|{entry_date.isoformat()}|{memo}".encode("utf-8"))
+    for account_id, debit, credit, dimensions, currency, amount_currency in lines:
+        line = f"\n{account_id}|{debit:.2f}|{credit:.2f}|{json.dumps(dimensions, sort_keys=True)}"
+        if amount_currency is not None:
+            line += f"|{currency}|{amount_currency:.2f}"
+        digest.update(line.encode("utf-8"))
+    return digest.hexdigest()
+
+
+def void_content_hash(entry_id: int) -> str:
+    return hashlib.sha256(f"{entry_id}|void".encode("utf-8")).hexdigest()
+
+
+def chain_digest(previous: str, entry_id: int, content_hash: str, total_debit: Decimal, total_credit: Decimal, line_count: int) -> str:
+    payload = f"{previous}|{entry_id}|{content_hash}|{total_debit:.2f}|{total_credit:.2f}|{line_count}"
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _entry_lines(entry_ids):
+    return (
+        JournalLine.objects.filter(entry_id__in=entry_ids)
+        .order_by("entry_id", "id")
+        .values_list("entry_id", "account_id", "debit", "credit", "dimensions", "currency", "amount_currency")
+    )
+
+
+def seal_entries(entry_ids: Iterable[int]) -> None:
+    """Queue `entry_ids` to have seals appended once the current transaction commits.
+
+    Call inside the transaction that posted, edited, unposted or deleted them. Queuing takes
+    no locks, so postings do not wait on each other for the chain.
+    """
+    ids = sorted({int(entry_id) for entry_id in entry_ids})
+    if not ids:
+        return
+    PendingSeal.objects.bulk_create([PendingSeal(entry_id=entry_id) for entry_id in ids])
+    # The entries are committed by then; a failure only leaves them queued for the next append.
+    transaction.on_commit(seal_pending_entries, robust=True)
+
+
+def _append_seals(ids: list[int], head: str) -> list[EntrySeal]:
+    """Unsaved seals recording `ids` as they now stand, chained from `head`.
+
+    Entries that are no longer posted (or no longer exist) get a void seal; entries unchanged
+    since their last seal get none.
+    """
+    entries = {
+        row[0]: row
+        for row in JournalEntry.objects.filter(id__in=ids, status=JournalEntry.Status.POSTED).values_list("id", "date", "memo")
+    }
+    lines = defaultdict(list)
+    for entry_id, *line in _entry_lines(list(entries)):
+        lines[entry_id].append(line)
+
+    latest = {}
+    for entry_id, content_hash in EntrySeal.objects.filter(entry_id__in=ids).order_by("id").values_list("entry_id", "content_hash"):
+        latest[entry_id] = content_hash
+
+    previous = head
+    seals = []
+    for entry_id in ids:
+        if entry_id in entries:
+            _, entry_date, memo = entries[entry_id]
+            entry_lines = lines[entry_id]
+            seal = EntrySeal(
+                entry_id=entry_id,
+                line_count=len(entry_lines),
+                total_debit=sum((line[1] for line in entry_lines), Decimal("0")),
+                total_credit=sum((line[2] for line in entry_lines), Decimal("0")),
+                content_hash=entry_content_hash(entry_id, entry_date, memo, entry_lines),
+            )
+        else:
+            seal = EntrySeal(entry_id=entry_id, is_void=True, content_hash=void_content_hash(entry_id))
+        if latest.get(entry_id) == seal.content_hash:
+            continue  # unchanged since its last seal
+        seal.previous_digest = previous
+        seal.digest = chain_digest(previous, entry_id, seal.content_hash, seal.total_debit, seal.total_credit, seal.line_count)
+        previous = seal.digest
+        seals.append(seal)
+    return seals
+
+
+def seal_pending_entries(batch_size: int = 1000) -> int:
+    """Append seals for queued entries, oldest first; returns how many entries were processed.
+
+    Appends take turns on the chain head row and read everything after getting it, so each
+    batch links to the seal the previous one wrote.
+    """
+    total = 0
+    while True:
+        with transaction.atomic():
+            heads = lock_rows(SealChainHead.objects.filter(pk=1), "ledger.seal_chain")
+            head = heads[0] if heads else SealChainHead.objects.create(pk=1, digest=GENESIS_DIGEST)
+            pending = list(PendingSeal.objects.order_by("id").values_list("id", "entry_id")[:batch_size])
+            if not pending:
+                return total
+            seals = EntrySeal.objects.bulk_create(_append_seals(sorted({entry_id for _, entry_id in pending}), head.digest))
+            if seals:
+                head.digest = seals[-1].digest
+                head.save(update_fields=["digest"])
+            PendingSeal.objects.filter(id__in=[pk for pk, _ in pending]).delete()
+        total += len(pending)
+
+
+def seal_unsealed_entries(batch_size: int = 1000) -> int:
+    """Seal posted entries that have never been sealed, e.g. ones that predate the chain."""
+    seal_pending_entries(batch_size)
+    unsealed = (
+        JournalEntry.objects.filter(status=JournalEntry.Status.POSTED)
+        .exclude(id__in=EntrySeal.objects.values("entry_id"))
+        .order_by("id")
+        .values_list("id", flat=True)
+    )
+    total = 0
+    while True:
+        batch = list(unsealed[:batch_size])
+        if not batch:
+            return total
+        PendingSeal.objects.bulk_create([PendingSeal(entry_id=entry_id) for entry_id in batch])
+        seal_pending_entries(batch_size)
+        total += len(batch)
+
+
+@dataclass(frozen=True)
+class IntegrityIssue:
+    kind: str
+    ref: str
+    detail: str
+
+
+@dataclass
+class IntegrityReport:
+    issues: list[IntegrityIssue] = field(default_factory=list)
+    entries_checked: int = 0
+    seals_checked: int = 0
+    head_digest: str = GENESIS_DIGEST
+
+    @property
+    def ok(self) -> bool:
+        return not self.issues
+
+
+def _id_ranges(low: int | None, high: int | None, size: int) -> list[tuple[int, int]]:
+    if low is None or high is None:
+        return []
+    return [(start, min(start + size - 1, high)) for start in range(low, high + 1, size)]
+
+
+def _verify_seal_range(bounds: tuple[int, int]):
+    """Check links and digests for seals with ids in `bounds`.
+
+    Returns `(issues, count, first_previous, last_digest)` so the caller can stitch ranges together.
+    """
+    issues = []
+    count = 0
+    first_previous = last_digest = None
+    rows = (
+        EntrySeal.objects.filter(id__range=bounds)
+        .order_by("id")
+        .values_list("id", "entry_id", "content_hash", "total_debit", "total_credit", "line_count", "previous_digest", "digest")
+        .iterator(chunk_size=2000)
+    )
+    for pk, entry_id, content_hash, total_debit, total_credit, line_count, previous, digest in rows:
+        if first_previous is None:
+            first_previous = previous
+        elif previous != last_digest:
+            issues.append(IntegrityIssue("chain", f"seal:{pk}", "Seal does not follow the previous seal."))
+        if chain_digest(previous, entry_id, content_hash, total_debit, total_credit, line_count) != digest:
+            issues.append(IntegrityIssue("chain", f"seal:{pk}", "Seal digest does not match its contents."))
+        last_digest = digest
+        count += 1
+    return issues, count, first_previous, last_digest
+
+
+def _verify_entry_range(bounds: tuple[int, int]):
+    """Recompute content hashes and totals for entries with ids in `bounds` against their latest seal."""
+    issues = []
+    latest = {}
+    for row in (
+        EntrySeal.objects.filter(entry_id__range=bounds)
+        .order_by("id")
+        .values_list("entry_id", "is_void", "content_hash", "total_debit", "total_credit", "line_count")
+        .iterator(chunk_size=2000)
+    ):
+        latest[row[0]] = row
+
+    entries = (
+        JournalEntry.objects.filter(id__range=bounds, status=JournalEntry.Status.POSTED)
+        .order_by("id")
+        .values_list("id", "date", "memo")
+        .iterator(chunk_size=2000)
+    )
+    lines = itertools.groupby(
+        JournalLine.objects.filter(entry__id__range=bounds, entry__status=JournalEntry.Status.POSTED)
+        .order_by("entry_id", "id")
+        .values_list("entry_id", "account_id", "debit", "credit", "dimensions", "currency", "amount_currency")
+        .iterator(chunk_size=2000),
+        key=lambda line: line[0],
+    )
+    pending = next(lines, None)
+    count = 0
+    for entry_id, entry_date, memo in entries:
+        count += 1
+        entry_lines = []
+        # Both streams are ordered by entry id; skip groups of entries that vanished mid-scan.
+        while pending is not None and pending[0] < entry_id:
+            pending = next(lines, None)
+        if pending is not None and pending[0] == entry_id:
+            entry_lines = [line[1:] for line in pending[1]]
+            pending = next(lines, None)
+
+        seal = latest.pop(entry_id, None)
+        ref = f"entry:{entry_id}"
+        if seal is None or seal[1]:
+            issues.append(IntegrityIssue("unsealed", ref, "Posted entry has no seal."))
+            continue
+        _, _, content_hash, total_debit, total_credit, line_count = seal
+        debit = sum((line[1] for line in entry_lines), Decimal("0"))
+        credit = sum((line[2] for line in entry_lines), Decimal("0"))
+        if (debit, credit, len(entry_lines)) != (total_debit, total_credit, line_count):
+            issues.append(
+                IntegrityIssue(
+                    "totals",
+                    ref,
+                    f"Lines total Dr {debit} / Cr {credit} over {len(entry_lines)} lines; "
+                    f"sealed Dr {total_debit} / Cr {total_credit} over {line_count}.",
+                )
+            )
+        if entry_content_hash(entry_id, entry_date, memo, entry_lines) != content_hash:
+            issues.append(IntegrityIssue("altered", ref, "Entry content does not match its seal."))
+
+    for entry_id, is_void, *_ in latest.values():
+        if not is_void:
+            issues.append(IntegrityIssue("missing", f"entry:{entry_id}", "Sealed entry is no longer posted."))
+    return issues, count
+
+
+def _verify_balances() -> list[IntegrityIssue]:
+    issues = []
+    unbalanced = (
+        JournalLine.objects.filter(entry__status=JournalEntry.Status.POSTED)
+        .values("entry_id")
+        .annotate(total_debit=Sum("debit"), total_credit=Sum("credit"))
+        .exclude(total_debit=F("total_credit"))
+        .order_by("entry_id")
+    )
+    for row in unbalanced:
+        issues.append(
+            IntegrityIssue(
+                "unbalanced",
+                f"entry:{row['entry_id']}",
+                f"Debits {row['total_debit']:.2f} do not equal credits {row['total_credit']:.2f}.",
+            )
+        )
+    return issues
+
+
+def _verify_period_balances() -> list[IntegrityIssue]:
+    periods = {period.start: period for period in FiscalPeriod.objects.filter(status=FiscalPeriod.Status.LOCKED)}
+    if not periods:
+        return []
+    frozen = {
+        (row["period__start"], row["account_id"]): (row["debit"], row["credit"])
+        for row in AccountPeriodBalance.objects.filter(period__in=periods.values()).values(
+            "period__start", "account_id", "debit", "credit"
+        )
+    }
+    actual = {}
+    for row in (
+        _posted_lines(min(periods), max(period.end for period in periods.values()))
+        .annotate(month=TruncMonth("entry__date"))
+        .values("month", "account_id")
+        .annotate(total_debit=Sum("debit"), total_credit=Sum("credit"))
+        .order_by()
+    ):
+        if row["month"] in periods:
+            actual[(row["month"], row["account_id"])] = (row["total_debit"], row["total_credit"])
+
+    issues = []
+    zero = (Decimal("0"), Decimal("0"))
+    for key in sorted(set(frozen) | set(actual)):
+        if frozen.get(key, zero) != actual.get(key, zero):
+            month, account_id = key
+            frozen_debit, frozen_credit = frozen.get(key, zero)
+            debit, credit = actual.get(key, zero)
+            issues.append(
+                IntegrityIssue(
+                    "period_balance",
+                    f"period:{month:%Y-%m}:account:{account_id}",
+                    f"Frozen Dr {frozen_debit:.2f} / Cr {frozen_credit:.2f}; posted lines Dr {debit:.2f} / Cr {credit:.2f}.",
+                )
+            )
+    return issues
+
+
+def verify_ledger(workers: int = 1, chunk_size: int = 5000) -> IntegrityReport:
+    """Check posted entries, their seals and the locked-period balance caches against raw lines.
+
+    Entries still queued for sealing are sealed first, so committed changes are not reported.
+    """
+    seal_pending_entries()
+    report = IntegrityReport()
+    report.issues.extend(_verify_balances())
+    report.issues.extend(_verify_period_balances())
+
+    seal_bounds = EntrySeal.objects.aggregate(low=Min("id"), high=Max("id"))
+    previous = GENESIS_DIGEST
+    for issues, count, first_previous, last_digest in map_in_processes(
+        _verify_seal_range, _id_ranges(seal_bounds["low"], seal_bounds["high"], chunk_size), workers
+    ):
+        report.issues.extend(issues)
+        report.seals_checked += count
+        if not count:
+            continue
+        if first_previous != previous:
+            report.issues.append(IntegrityIssue("chain", "chain", "Chain is broken between seal ranges."))
+        previous = last_digest
+    report.head_digest = previous
+
+    entry_bounds = JournalEntry.objects.filter(status=JournalEntry.Status.POSTED).aggregate(low=Min("id"), high=Max("id"))
+    sealed_bounds = EntrySeal.objects.aggregate(low=Min("entry_id"), high=Max("entry_id"))
+    lows = [value for value in (entry_bounds["low"], sealed_bounds["low"]) if value is not None]
+    highs = [value for value in (entry_bounds["high"], sealed_bounds["high"]) if value is not None]
+    ranges = _id_ranges(min(lows, default=None), max(highs, default=None), chunk_size)
+    for issues, count in map_in_processes(_verify_entry_range, ranges, workers):
+        report.issues.extend(issues)
+        report.entries_checked += count
+    return report
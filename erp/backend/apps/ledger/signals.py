@@ -0,0 +1,39 @@
+from __future__ import annotations
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import Signal, receiver
+
+from .models import Account, ExchangeRate
+from .services import invalidate_chart_of_accounts, invalidate_fx_rates, seal_entries
+
+# Sent inside the posting transaction with `entry_ids`, once per batch of entries
+# that just moved to posted, so per-period balance maintenance can update in bulk.
+entries_posted = Signal()
+
+# Sent inside the transaction with `entry_ids` just before posted entries are edited,
+# unposted or deleted, while their lines still stand, so that maintenance can be undone.
+entries_unposting = Signal()
+
+# Sent with `period` when a locked fiscal period is reopened, so frozen outputs can be dropped.
+period_unlocked = Signal()
+
+
+@receiver(post_save, sender=Account)
+@receiver(post_delete, sender=Account)
+def refresh_chart_of_accounts(sender, **kwargs):
+    invalidate_chart_of_accounts()
+    # Drop anything another thread loaded before this transaction committed.
+    transaction.on_commit(invalidate_chart_of_accounts)
+
+
+@receiver(post_save, sender=ExchangeRate)
+@receiver(post_delete, sender=ExchangeRate)
+def refresh_fx_rates(sender, **kwargs):
+    invalidate_fx_rates()
+    transaction.on_commit(invalidate_fx_rates)
+
+
+@receiver(entries_posted)
+def seal_posted_entries(sender, entry_ids, **kwargs):
+    seal_entries(entry_ids)
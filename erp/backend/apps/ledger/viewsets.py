@@ -1,35 +1,108 @@
 from __future__ import annotations
 
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.db import transaction
-from django.db.models import Prefetch
 from rest_framework import status, viewsets
 from rest_framework.decorators import action
-from rest_framework.exceptions import PermissionDenied
+from rest_framework.exceptions import PermissionDenied, ValidationError
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 
 from apps.accounts.models import Role, user_has_role
-from apps.accounts.permissions import IsAdminOrAccountant
+from apps.accounts.permissions import IsAdmin, IsAdminOrAccountant
+from apps.core.models import ChangeEvent
+from apps.core.services import lock_rows, record_change, record_changes, run_with_retry
+from apps.core.viewsets import IdempotentCreateMixin
 
 from .filters import AccountFilterSet, JournalEntryFilterSet
-from .models import Account, JournalEntry, JournalLine
-from .serializers import AccountSerializer, JournalEntrySerializer
+from .models import (
+    Account,
+    AllocationRule,
+    ExchangeRate,
+    FiscalPeriod,
+    FiscalYearClose,
+    JournalEntry,
+    RecurringEntryTemplate,
+)
+from .serializers import (
+    AccountAutocompleteQuerySerializer,
+    AccountSerializer,
+    AllocationRuleSerializer,
+    AllocationRunSerializer,
+    BatchPostSerializer,
+    ExchangeRateLoadSerializer,
+    ExchangeRateSerializer,
+    FiscalPeriodSerializer,
+    FiscalYearCloseRequestSerializer,
+    FiscalYearCloseSerializer,
+    JournalEntrySerializer,
+    PeriodLockSerializer,
+    RateLookupSerializer,
+    RecurringEntryTemplateSerializer,
+    RecurringRunSerializer,
+)
+from .services import (
+    AllocationError,
+    FiscalYearCloseError,
+    PeriodLockedError,
+    chart_of_accounts,
+    close_fiscal_year,
+    ensure_periods_open,
+    fx_rates,
+    generate_recurring_entries,
+    invalidate_fx_rates,
+    lock_period,
+    plan_allocation,
+    post_entries,
+    reopen_fiscal_year,
+    run_allocation,
+    seal_entries,
+    unlock_period,
+)
+from .signals import entries_unposting
 
 User = get_user_model()
 
 
 class AccountViewSet(viewsets.ModelViewSet):
-    queryset = Account.objects.select_related("parent").all()
+    queryset = Account.objects.all()
     serializer_class = AccountSerializer
     permission_classes = [IsAuthenticated, IsAdminOrAccountant]
     filterset_class = AccountFilterSet
     search_fields = ["code", "name"]
     ordering_fields = ["code", "name", "type"]
 
+    @action(detail=False, methods=["get"])
+    def autocomplete(self, request):
+        """Prefix-match `q` against account codes and name words from the in-memory chart.
 
-class JournalEntryViewSet(viewsets.ModelViewSet):
+        The ETag is the chart's content digest, so unchanged charts answer 304 to If-None-Match.
+        """
+        chart = chart_of_accounts()
+        etag = f'"{chart.digest}"'
+        if etag in [tag.strip().removeprefix("W/") for tag in request.headers.get("If-None-Match", "").split(",")]:
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            params = {key: value for key, value in request.query_params.items() if key != "type"}
+            types = request.query_params.getlist("type")
+            if types:
+                params["type"] = types
+            query = AccountAutocompleteQuerySerializer(data=params)
+            query.is_valid(raise_exception=True)
+            data = query.validated_data
+            records = chart.complete(data["q"], data["limit"], data.get("type"), data["include_inactive"])
+            response = Response(
+                [{"id": record.id, "code": record.code, "name": record.name, "type": record.type} for record in records]
+            )
+        response["ETag"] = etag
+        response["Cache-Control"] = "private, no-cache"
+        return response
+
+
+class JournalEntryViewSet(IdempotentCreateMixin, viewsets.ModelViewSet):
     serializer_class = JournalEntrySerializer
+    retry_label = "ledger.journal_entry"
     permission_classes = [IsAuthenticated, IsAdminOrAccountant]
     filterset_class = JournalEntryFilterSet
     search_fields = ["memo"]
@@ -38,12 +111,7 @@ class JournalEntryViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         return (
             JournalEntry.objects.select_related("created_by", "approved_by")
-            .prefetch_related(
-                Prefetch(
-                    "lines",
-                    queryset=JournalLine.objects.select_related("account"),
-                )
-            )
+            .prefetch_related("lines")
             .all()
         )
 
@@ -56,15 +124,37 @@ class JournalEntryViewSet(viewsets.ModelViewSet):
         serializer.save(created_by=self.request.user)
 
     def perform_update(self, serializer):
-        prev_status = serializer.instance.status
-        entry = serializer.save()
-        if prev_status != JournalEntry.Status.POSTED and entry.status == JournalEntry.Status.POSTED:
-            if not user_has_role(self.request.user, Role.Code.ADMIN, Role.Code.ACCOUNTANT):
-                raise PermissionDenied("Only Admin or Accountant roles can post entries.")
-            if entry.approved_by is None:
-                entry.approved_by = self.request.user
-                entry.save(update_fields=["approved_by", "updated_at"])
-        return entry
+        def update():
+            # Re-read the status under a row lock so two concurrent posts cannot both see a draft.
+            (locked,) = lock_rows(JournalEntry.objects.filter(pk=serializer.instance.pk).only("status"), "ledger.journal_entry")
+            serializer.instance.status = prev_status = locked.status
+            entry = serializer.save()
+            if prev_status != JournalEntry.Status.POSTED and entry.status == JournalEntry.Status.POSTED:
+                if not user_has_role(self.request.user, Role.Code.ADMIN, Role.Code.ACCOUNTANT):
+                    raise PermissionDenied("Only Admin or Accountant roles can post entries.")
+                if entry.approved_by is None:
+                    entry.approved_by = self.request.user
+                    entry.save(update_fields=["approved_by", "updated_at"])
+            return entry
+
+        return run_with_retry(update, "ledger.journal_entry")
+
+    def perform_destroy(self, instance):
+        if instance.is_closing:
+            raise ValidationError("Closing entries are managed by the year-end close.")
+        with transaction.atomic():
+            try:
+                ensure_periods_open(instance.date)
+            except PeriodLockedError as exc:
+                raise ValidationError(str(exc))
+            record_changes(ChangeEvent.Action.DELETED, instance.lines.all())
+            record_change(ChangeEvent.Action.DELETED, instance)
+            entry_id, was_posted = instance.pk, instance.status == JournalEntry.Status.POSTED
+            if was_posted:
+                entries_unposting.send(sender=JournalEntry, entry_ids=[entry_id])
+            instance.delete()
+            if was_posted:
+                seal_entries([entry_id])
 
     @action(detail=True, methods=["post"], permission_classes=[IsAuthenticated, IsAdminOrAccountant])
     def post_entry(self, request, pk=None):
@@ -73,3 +163,179 @@ class JournalEntryViewSet(viewsets.ModelViewSet):
         serializer.is_valid(raise_exception=True)
         self.perform_update(serializer)
         return Response(serializer.data, status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=["post"], url_path="batch-post", permission_classes=[IsAuthenticated, IsAdminOrAccountant])
+    def batch_post(self, request):
+        serializer = BatchPostSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        if "ids" in serializer.validated_data:
+            entries = serializer.validated_data["ids"]
+        else:
+            filterset = JournalEntryFilterSet(serializer.validated_data["filter"], queryset=JournalEntry.objects.all())
+            if not filterset.is_valid():
+                raise ValidationError({"filter": filterset.errors})
+            entries = filterset.qs
+        result = run_with_retry(lambda: post_entries(entries, request.user), "ledger.batch_post")
+        return Response(
+            {
+                "posted": result.posted,
+                "failed": [{"id": entry_id, "detail": detail} for entry_id, detail in sorted(result.failures.items())],
+                "budget_warnings": [
+                    {"id": entry_id, "overruns": [overrun.as_dict() for overrun in overruns]}
+                    for entry_id, overruns in sorted(result.budget_warnings.items())
+                ],
+            },
+            status=status.HTTP_200_OK,
+        )
+
+
+class RecurringEntryTemplateViewSet(viewsets.ModelViewSet):
+    serializer_class = RecurringEntryTemplateSerializer
+    queryset = RecurringEntryTemplate.objects.select_related("created_by").prefetch_related("lines")
+    permission_classes = [IsAuthenticated, IsAdminOrAccountant]
+    filterset_fields = ["frequency", "is_active"]
+    search_fields = ["name", "memo"]
+    ordering_fields = ["name", "start_date"]
+
+    def perform_create(self, serializer):
+        serializer.save(created_by=self.request.user)
+
+    @action(detail=False, methods=["post"], permission_classes=[IsAuthenticated, IsAdminOrAccountant])
+    def generate(self, request):
+        serializer = RecurringRunSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        templates = RecurringEntryTemplate.objects.filter(is_active=True)
+        if "templates" in serializer.validated_data:
+            templates = templates.filter(id__in=serializer.validated_data["templates"])
+        result = generate_recurring_entries(serializer.validated_data["through"], templates, approver=request.user)
+        return Response(
+            {
+                "created": [{"template": pk, "entries": count} for pk, count in result.created.items()],
+                "failed": [{"template": pk, "detail": detail} for pk, detail in result.failures.items()],
+                "budget_warnings": [
+                    {"id": entry_id, "overruns": [overrun.as_dict() for overrun in overruns]}
+                    for entry_id, overruns in sorted(result.budget_warnings.items())
+                ],
+            },
+            status=status.HTTP_200_OK,
+        )
+
+
+class AllocationRuleViewSet(viewsets.ModelViewSet):
+    serializer_class = AllocationRuleSerializer
+    queryset = AllocationRule.objects.select_related("created_by").prefetch_related("drivers")
+    permission_classes = [IsAuthenticated, IsAdminOrAccountant]
+    filterset_fields = ["driver_type", "is_active", "source_account", "target_account"]
+    search_fields = ["name"]
+    ordering_fields = ["name", "created_at"]
+
+    def perform_create(self, serializer):
+        serializer.save(created_by=self.request.user)
+
+    @action(detail=True, methods=["post"], permission_classes=[IsAuthenticated, IsAdminOrAccountant])
+    def run(self, request, pk=None):
+        rule = self.get_object()
+        serializer = AllocationRunSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        params = serializer.validated_data
+        try:
+            if params["preview"]:
+                plan = plan_allocation(rule, params["start_date"], params["end_date"])
+                return Response(
+                    {
+                        "source_amount": str(plan.source_amount),
+                        "shares": {value: str(amount) for value, amount in sorted(plan.shares.items())},
+                    }
+                )
+            entry = run_allocation(rule, params["start_date"], params["end_date"], request.user, params.get("entry_date"))
+        except (AllocationError, PeriodLockedError) as exc:
+            raise ValidationError({"detail": str(exc)})
+        serializer = JournalEntrySerializer(entry, context=self.get_serializer_context())
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+
+class FiscalYearCloseViewSet(viewsets.ReadOnlyModelViewSet):
+    serializer_class = FiscalYearCloseSerializer
+    queryset = FiscalYearClose.objects.select_related("closed_by")
+    permission_classes = [IsAuthenticated]
+    ordering_fields = ["year"]
+
+    @action(detail=False, methods=["post"], permission_classes=[IsAuthenticated, IsAdmin])
+    def close(self, request):
+        serializer = FiscalYearCloseRequestSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            closing = close_fiscal_year(
+                serializer.validated_data["year"],
+                request.user,
+                serializer.validated_data.get("retained_earnings_code"),
+            )
+        except (FiscalYearCloseError, PeriodLockedError) as exc:
+            raise ValidationError({"detail": str(exc)})
+        return Response(self.get_serializer(closing).data, status=status.HTTP_201_CREATED)
+
+    @action(detail=True, methods=["post"], permission_classes=[IsAuthenticated, IsAdmin])
+    def reopen(self, request, pk=None):
+        try:
+            reopen_fiscal_year(self.get_object())
+        except PeriodLockedError as exc:
+            raise ValidationError({"detail": str(exc)})
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class FiscalPeriodViewSet(viewsets.ReadOnlyModelViewSet):
+    serializer_class = FiscalPeriodSerializer
+    queryset = FiscalPeriod.objects.select_related("locked_by")
+    permission_classes = [IsAuthenticated]
+    filterset_fields = ["status"]
+    ordering_fields = ["start"]
+
+    @action(detail=False, methods=["post"], permission_classes=[IsAuthenticated, IsAdmin])
+    def lock(self, request):
+        serializer = PeriodLockSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        period = lock_period(serializer.validated_data["period"], request.user)
+        return Response(self.get_serializer(period).data, status=status.HTTP_200_OK)
+
+    @action(detail=True, methods=["post"], permission_classes=[IsAuthenticated, IsAdmin])
+    def unlock(self, request, pk=None):
+        period = unlock_period(self.get_object())
+        return Response(self.get_serializer(period).data, status=status.HTTP_200_OK)
+
+
+class ExchangeRateViewSet(viewsets.ModelViewSet):
+    serializer_class = ExchangeRateSerializer
+    queryset = ExchangeRate.objects.all()
+    permission_classes = [IsAuthenticated, IsAdminOrAccountant]
+    filterset_fields = ["from_currency", "to_currency", "date"]
+    ordering_fields = ["date", "from_currency", "to_currency"]
+
+    def create(self, request, *args, **kwargs):
+        if not isinstance(request.data, list):
+            return super().create(request, *args, **kwargs)
+        # A list body loads a rate feed in one statement; existing (pair, date) rows get the new rate.
+        serializer = ExchangeRateLoadSerializer(data=request.data, many=True)
+        serializer.is_valid(raise_exception=True)
+        # The last row wins when a feed repeats a (pair, date).
+        rows = {(data["from_currency"], data["to_currency"], data["date"]): data for data in serializer.validated_data}
+        rates = ExchangeRate.objects.bulk_create(
+            [ExchangeRate(**data) for data in rows.values()],
+            update_conflicts=True,
+            unique_fields=["from_currency", "to_currency", "date"],
+            update_fields=["rate"],
+        )
+        invalidate_fx_rates()
+        transaction.on_commit(invalidate_fx_rates)
+        return Response({"count": len(rates)}, status=status.HTTP_201_CREATED)
+
+    @action(detail=False, methods=["get"])
+    def lookup(self, request):
+        serializer = RateLookupSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        from_currency = data["from_currency"].upper()
+        to_currency = data.get("to_currency", settings.BASE_CURRENCY).upper()
+        rate = fx_rates().rate(from_currency, to_currency, data["date"])
+        if rate is None:
+            raise ValidationError(f"No {from_currency}/{to_currency} rate on or before {data['date']}.")
+        return Response({"from_currency": from_currency, "to_currency": to_currency, "date": data["date"], "rate": str(rate)})
@@ -0,0 +1,28 @@
+from __future__ import annotations
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from apps.ledger.services import add_months
+from apps.reports.services import backfill_ar_aging
+
+
+class Command(BaseCommand):
+    help = "Rebuild daily AR aging snapshots from invoice and payment dates."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--months", type=int, default=24, help="Months of history to rebuild when --start is omitted.")
+        parser.add_argument("--start", help="First day to rebuild (YYYY-MM-DD).")
+        parser.add_argument("--end", help="Last day to rebuild (YYYY-MM-DD); defaults to today.")
+        parser.add_argument("--workers", type=int, default=1, help="Worker processes, one month of days each.")
+
+    def handle(self, *args, **options):
+        end = parse_date(options["end"]) if options["end"] else timezone.localdate()
+        start = parse_date(options["start"]) if options["start"] else (end and add_months(end, -options["months"]))
+        if start is None or end is None:
+            raise CommandError("--start and --end must be dates in YYYY-MM-DD format.")
+        if start > end:
+            raise CommandError("--start must not be after --end.")
+        written = backfill_ar_aging(start, end, workers=options["workers"])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt AR aging from {start} to {end}: {written} snapshot rows."))
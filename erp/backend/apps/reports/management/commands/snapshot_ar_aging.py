@@ -0,0 +1,21 @@
+from __future__ import annotations
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from apps.reports.services import snapshot_ar_aging
+
+
+class Command(BaseCommand):
+    help = "Store per-customer AR aging bucket totals for one day; run nightly."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--date", help="Day to snapshot (YYYY-MM-DD); defaults to today.")
+
+    def handle(self, *args, **options):
+        as_of = parse_date(options["date"]) if options["date"] else timezone.localdate()
+        if as_of is None:
+            raise CommandError("--date must be a date in YYYY-MM-DD format.")
+        written = snapshot_ar_aging(as_of)
+        self.stdout.write(self.style.SUCCESS(f"Stored AR aging for {written} customers as of {as_of}."))
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-19 18:30
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoicing', '0007_ledger_posting'),
+        ('reports', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AgingSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('current', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('days_0_30', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('days_31_60', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('days_61_90', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('days_over_90', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('open_invoices', models.PositiveIntegerField(default=0)),
+                ('invoiced', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('customer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='invoicing.customer')),
+            ],
+            options={
+                'ordering': ['date', 'customer'],
+                'constraints': [models.UniqueConstraint(fields=('date', 'customer'), name='unique_aging_snapshot')],
+            },
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-19 18:45
+
+import django.core.serializers.json
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reports', '0002_aging_snapshots'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ForecastVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=128)),
+                ('start', models.DateField()),
+                ('end', models.DateField()),
+                ('actuals_through', models.DateField()),
+                ('cadence', models.CharField(default='monthly', max_length=16)),
+                ('method', models.CharField(max_length=32)),
+                ('window', models.PositiveSmallIntegerField(default=3)),
+                ('account_methods', models.JSONField(blank=True, default=dict)),
+                ('payload', models.JSONField(encoder=django.core.serializers.json.DjangoJSONEncoder)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('created_by', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='forecast_versions_created', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,73 @@
+from __future__ import annotations
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models
+
+
+class ReportSnapshot(models.Model):
+    report = models.CharField(max_length=64)
+    params_key = models.CharField(max_length=64)
+    params = models.JSONField(default=dict, encoder=DjangoJSONEncoder)
+    period_start = models.DateField()
+    period_end = models.DateField()
+    payload = models.JSONField(encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["report", "period_end"]
+        unique_together = ("report", "params_key")
+
+    def __str__(self) -> str:
+        return f"{self.report} {self.period_start} - {self.period_end}"
+
+
+class AgingSnapshot(models.Model):
+    """Open receivables of one customer at the end of one day, in base currency at booking rates."""
+
+    date = models.DateField()
+    customer = models.ForeignKey("invoicing.Customer", related_name="+", on_delete=models.CASCADE)
+    current = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    days_0_30 = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    days_31_60 = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    days_61_90 = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    days_over_90 = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    open_invoices = models.PositiveIntegerField(default=0)
+    # Invoices issued to the customer that day; the sales side of DSO.
+    invoiced = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        ordering = ["date", "customer"]
+        constraints = [
+            models.UniqueConstraint(fields=["date", "customer"], name="unique_aging_snapshot"),
+        ]
+
+    def __str__(self) -> str:
+        return f"AR aging {self.date} customer {self.customer_id}"
+
+
+class ForecastVersion(models.Model):
+    """A stored rolling forecast, kept so later versions can be compared with it."""
+
+    name = models.CharField(max_length=128)
+    start = models.DateField()
+    end = models.DateField()
+    actuals_through = models.DateField()
+    cadence = models.CharField(max_length=16, default="monthly")
+    method = models.CharField(max_length=32)
+    window = models.PositiveSmallIntegerField(default=3)
+    # Account id -> projection method, overriding `method` for those accounts.
+    account_methods = models.JSONField(default=dict, blank=True)
+    payload = models.JSONField(encoder=DjangoJSONEncoder)
+    created_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        related_name="forecast_versions_created",
+        on_delete=models.PROTECT,
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["-created_at"]
+
+    def __str__(self) -> str:
+        return f"Forecast {self.name} ({self.start} - {self.end})"
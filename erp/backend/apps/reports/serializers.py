@@ -2,6 +2,12 @@ from __future__ import annotations
 
 from rest_framework import serializers
 
+from apps.ledger.models import Account
+from apps.ledger.services import chart_of_accounts
+
+from .models import ForecastVersion
+from .services import ForecastMethod
+
 
 class DateRangeSerializer(serializers.Serializer):
     start_date = serializers.DateField(required=False)
@@ -35,3 +41,68 @@ class CashFlowQuerySerializer(DateRangeSerializer):
         if not attrs.get("start_date") or not attrs.get("end_date"):
             raise serializers.ValidationError("start_date and end_date are required")
         return attrs
+
+
+class AgingTrendQuerySerializer(DateRangeSerializer):
+    interval = serializers.ChoiceField(choices=[("day", "Daily"), ("week", "Weekly"), ("month", "Monthly")], default="month")
+    customer = serializers.IntegerField(required=False)
+
+
+class DSOQuerySerializer(AgingTrendQuerySerializer):
+    window = serializers.IntegerField(min_value=1, max_value=366, default=90)
+
+
+class ForecastQuerySerializer(IncomeStatementQuerySerializer):
+    actuals_through = serializers.DateField(required=False)
+    method = serializers.ChoiceField(choices=ForecastMethod.choices, default=ForecastMethod.RUN_RATE)
+    window = serializers.IntegerField(min_value=1, max_value=24, default=3)
+    account_methods = serializers.DictField(child=serializers.ChoiceField(choices=ForecastMethod.choices), required=False)
+
+    def validate_start_date(self, value):
+        if value.day != 1:
+            raise serializers.ValidationError("The forecast must start on the first day of a month.")
+        return value
+
+    def validate_account_methods(self, value):
+        chart = chart_of_accounts()
+        methods = {}
+        for key, method in value.items():
+            record = chart.get(int(key)) if str(key).isdigit() else None
+            if record is None or record.type not in (Account.Type.REVENUE, Account.Type.EXPENSE):
+                raise serializers.ValidationError(f"{key} is not a revenue or expense account.")
+            methods[record.id] = method
+        return methods
+
+
+class ForecastVersionCreateSerializer(ForecastQuerySerializer):
+    name = serializers.CharField(max_length=128)
+
+
+class ForecastVersionSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ForecastVersion
+        fields = [
+            "id",
+            "name",
+            "start",
+            "end",
+            "actuals_through",
+            "cadence",
+            "method",
+            "window",
+            "account_methods",
+            "created_by",
+            "created_at",
+        ]
+        read_only_fields = fields
+
+
+class ForecastVersionDetailSerializer(ForecastVersionSerializer):
+    class Meta(ForecastVersionSerializer.Meta):
+        fields = [*ForecastVersionSerializer.Meta.fields, "payload"]
+        read_only_fields = fields
+
+
+class ForecastCompareSerializer(serializers.Serializer):
+    base = serializers.PrimaryKeyRelatedField(queryset=ForecastVersion.objects.all())
+    other = serializers.PrimaryKeyRelatedField(queryset=ForecastVersion.objects.all())
@@ -1,16 +1,39 @@
 from __future__ import annotations
 
+import hashlib
+import json
 from collections import defaultdict
 from dataclasses import dataclass
 from datetime import date, timedelta
 from decimal import Decimal
-from typing import Any, Dict, Iterable, List, Tuple
-
-from django.db.models import Sum
-
-from apps.ledger.models import Account, JournalEntry, JournalLine
-from apps.invoicing.models import Invoice
-
+from typing import Any, Callable, Dict, Iterable, List, Tuple
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models, transaction
+from django.db.models import Case, Count, DecimalField, ExpressionWrapper, F, Min, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce, TruncMonth
+from django.utils import timezone
+
+from apps.ledger.models import Account, ExchangeRate, JournalEntry, JournalLine
+from apps.ledger.services import (
+    AccountRecord,
+    chart_covering,
+    chart_of_accounts,
+    is_range_locked,
+    locked_account_totals,
+    locked_months,
+    month_end,
+    month_start,
+)
+from apps.budgets.models import Budget
+from apps.budgets.services import spread_amount
+from apps.core.services import map_in_processes
+from apps.invoicing.models import Invoice, InvoiceLine, Payment
+
+from .models import AgingSnapshot, ReportSnapshot
+
+CENT = Decimal("0.01")
 
 
 @dataclass(frozen=True)
@@ -62,26 +85,70 @@ def _to_decimal(value: Any) -> Decimal:
     return value if isinstance(value, Decimal) else Decimal(str(value))
 
 
-def trial_balance(start: date | None, end: date | None, account_ids: Iterable[int] | None = None) -> Dict[str, Any]:
-    lines = JournalLine.objects.filter(entry__status=JournalEntry.Status.POSTED)
-    if start:
-        lines = lines.filter(entry__date__gte=start)
-    if end:
-        lines = lines.filter(entry__date__lte=end)
-    if account_ids:
-        lines = lines.filter(account_id__in=account_ids)
-
-    aggregates = (
-        lines
-        .values("account_id", "account__code", "account__name")
-        .annotate(total_debit=Sum("debit"), total_credit=Sum("credit"))
-        .order_by("account__code")
+def _ledger_start() -> date | None:
+    return JournalEntry.objects.filter(status=JournalEntry.Status.POSTED).aggregate(first=Min("date"))["first"]
+
+
+def frozen_report(report: str, params: Dict[str, Any], start: date | None, end: date, compute: Callable[[], Dict[str, Any]]) -> Dict[str, Any]:
+    """Serve `compute()` from a stored snapshot once every month it covers is locked.
+
+    `start=None` means the report reads from the first posted entry.
+    """
+    if start is None:
+        start = _ledger_start()
+        if start is None:
+            return compute()
+    if not is_range_locked(start, end):
+        return compute()
+    encoded = json.dumps(params, sort_keys=True, cls=DjangoJSONEncoder)
+    params_key = hashlib.sha256(f"{report}:{encoded}".encode("utf-8")).hexdigest()
+    snapshot = ReportSnapshot.objects.filter(report=report, params_key=params_key).first()
+    # A backdated posting moves the ledger start, which invalidates inception-based snapshots.
+    if snapshot is not None and snapshot.period_start == start:
+        return snapshot.payload
+    payload = compute()
+    ReportSnapshot.objects.update_or_create(
+        report=report,
+        params_key=params_key,
+        defaults={
+            "params": params,
+            "period_start": start,
+            "period_end": end,
+            "payload": json.loads(json.dumps(payload, cls=DjangoJSONEncoder)),
+        },
     )
+    return payload
+
+
+def trial_balance(start: date | None, end: date | None, account_ids: Iterable[int] | None = None) -> Dict[str, Any]:
+    aggregates = locked_account_totals(start, end) if start and end else None
+    if aggregates is not None:
+        if account_ids:
+            wanted = set(account_ids)
+            aggregates = [row for row in aggregates if row["account_id"] in wanted]
+    else:
+        lines = JournalLine.objects.filter(entry__status=JournalEntry.Status.POSTED)
+        if start:
+            lines = lines.filter(entry__date__gte=start)
+        if end:
+            lines = lines.filter(entry__date__lte=end)
+        if account_ids:
+            lines = lines.filter(account_id__in=account_ids)
+
+        aggregates = list(
+            lines
+            .values("account_id")
+            .annotate(total_debit=Sum("debit"), total_credit=Sum("credit"))
+            .order_by()
+        )
+    chart = chart_covering(item["account_id"] for item in aggregates)
+    aggregates.sort(key=lambda item: chart.by_id[item["account_id"]].code)
 
     rows: List[Dict[str, Any]] = []
     total_debits = Decimal("0")
     total_credits = Decimal("0")
     for item in aggregates:
+        account = chart.by_id[item["account_id"]]
         debit = _to_decimal(item["total_debit"])
         credit = _to_decimal(item["total_credit"])
         total_debits += debit
@@ -89,8 +156,8 @@ def trial_balance(start: date | None, end: date | None, account_ids: Iterable[in
         rows.append(
             {
                 "account_id": item["account_id"],
-                "code": item["account__code"],
-                "name": item["account__name"],
+                "code": account.code,
+                "name": account.name,
                 "debit": str(debit),
                 "credit": str(credit),
             }
@@ -104,11 +171,16 @@ def trial_balance(start: date | None, end: date | None, account_ids: Iterable[in
 
 def income_statement(start: date, end: date, cadence: str = "monthly") -> Dict[str, Any]:
     periods = build_periods(start, end, cadence)
-    account_queryset = Account.objects.filter(type__in=[Account.Type.REVENUE, Account.Type.EXPENSE]).select_related("parent")
-    accounts = list(account_queryset)
+    chart = chart_of_accounts()
+    accounts = chart.of_type(Account.Type.REVENUE, Account.Type.EXPENSE)
     lines = (
-        JournalLine.objects.filter(entry__status=JournalEntry.Status.POSTED, entry__date__gte=start, entry__date__lte=end)
-        .select_related("entry", "account", "account__parent")
+        JournalLine.objects.filter(
+            entry__status=JournalEntry.Status.POSTED,
+            entry__date__gte=start,
+            entry__date__lte=end,
+            entry__is_closing=False,
+        )
+        .values_list("entry__date", "account_id", "debit", "credit")
         .order_by("entry__date")
     )
 
@@ -116,20 +188,27 @@ def income_statement(start: date, end: date, cadence: str = "monthly") -> Dict[s
     for account in accounts:
         amounts[account.id] = [Decimal("0") for _ in periods]
 
-    for line in lines:
-        idx = _period_index(line.entry.date, periods)
+    for entry_date, account_id, debit, credit in lines:
+        idx = _period_index(entry_date, periods)
         if idx is None:
             continue
-        account = line.account
-        if account.id not in amounts:
+        if account_id not in amounts:
             # Ignore non P&L accounts that may appear on journal entries
             continue
-        value = _to_decimal(line.debit) - _to_decimal(line.credit)
-        if account.type == Account.Type.REVENUE:
-            value = _to_decimal(line.credit) - _to_decimal(line.debit)
-        amounts[account.id][idx] += value
+        value = _to_decimal(debit) - _to_decimal(credit)
+        if chart.by_id[account_id].type == Account.Type.REVENUE:
+            value = _to_decimal(credit) - _to_decimal(debit)
+        amounts[account_id][idx] += value
+
+    return _income_statement_payload(periods, accounts, amounts)
+
 
-    def classify_account(account: Account) -> str:
+def _income_statement_payload(
+    periods: List[Period], accounts: List[AccountRecord], amounts: Dict[int, List[Decimal]]
+) -> Dict[str, Any]:
+    """Group signed per-account period amounts into the income statement `rows`/`flat` layout."""
+
+    def classify_account(account: AccountRecord) -> str:
         if account.type == Account.Type.REVENUE:
             return "revenue"
         if account.code.startswith("5"):
@@ -150,7 +229,7 @@ def income_statement(start: date, end: date, cadence: str = "monthly") -> Dict[s
             continue
         group["accounts"].append(account)
 
-    def serialize_account(account: Account) -> Dict[str, Any]:
+    def serialize_account(account: AccountRecord) -> Dict[str, Any]:
         values = amounts[account.id]
         return {
             "key": f"account-{account.id}",
@@ -247,31 +326,45 @@ def income_statement(start: date, end: date, cadence: str = "monthly") -> Dict[s
 
 
 def balance_sheet(as_of: date) -> Dict[str, Any]:
-    lines = JournalLine.objects.filter(entry__status=JournalEntry.Status.POSTED, entry__date__lte=as_of)
-    aggregates = (
-        lines
-        .values("account_id", "account__code", "account__name", "account__type")
-        .annotate(total_debit=Sum("debit"), total_credit=Sum("credit"))
-    )
+    first = _ledger_start()
+    aggregates = locked_account_totals(month_start(first), as_of) if first and first <= as_of else None
+    if aggregates is None:
+        lines = JournalLine.objects.filter(entry__status=JournalEntry.Status.POSTED, entry__date__lte=as_of)
+        aggregates = list(
+            lines
+            .values("account_id")
+            .annotate(total_debit=Sum("debit"), total_credit=Sum("credit"))
+            .order_by()
+        )
+    chart = chart_covering(item["account_id"] for item in aggregates)
     sections = defaultdict(list)
     totals = defaultdict(lambda: Decimal("0"))
+    unclosed_earnings = Decimal("0")
     for item in aggregates:
+        account = chart.by_id[item["account_id"]]
         debit = _to_decimal(item["total_debit"])
         credit = _to_decimal(item["total_credit"])
         balance = debit - credit
-        account_type = item["account__type"]
+        account_type = account.type
         if account_type in (Account.Type.REVENUE, Account.Type.EXPENSE):
+            # Closed years are already in retained earnings; what remains is unclosed.
+            unclosed_earnings += credit - debit
             continue
         if account_type in (Account.Type.LIABILITY, Account.Type.EQUITY):
             balance = credit - debit
         sections[account_type].append(
             {
-                "code": item["account__code"],
-                "name": item["account__name"],
+                "code": account.code,
+                "name": account.name,
                 "balance": str(balance),
             }
         )
         totals[account_type] += balance
+    if unclosed_earnings:
+        sections[Account.Type.EQUITY].append(
+            {"code": "", "name": "Current Earnings (unclosed)", "balance": str(unclosed_earnings)}
+        )
+        totals[Account.Type.EQUITY] += unclosed_earnings
     equity = totals[Account.Type.EQUITY]
     liabilities = totals[Account.Type.LIABILITY]
     assets = totals[Account.Type.ASSET]
@@ -308,53 +401,93 @@ def cash_flow(start: date, end: date) -> Dict[str, Any]:
     }
 
 
+# Report bucket label -> AgingSnapshot field, with the days-past-due range each covers.
+AGING_BUCKETS = [
+    ("Current", "current", None, -1),
+    ("0-30", "days_0_30", 0, 30),
+    ("31-60", "days_31_60", 31, 60),
+    ("61-90", "days_61_90", 61, 90),
+    ("90+", "days_over_90", 91, None),
+]
+_AMOUNT = DecimalField(max_digits=14, decimal_places=2)
+
+
+def _receivables():
+    return Invoice.objects.exclude(status__in=[Invoice.Status.DRAFT, Invoice.Status.VOID])
+
+
+_RATE = DecimalField(max_digits=18, decimal_places=8)
+
+
+def _booking_rate():
+    """The rate an invoice is booked at when posted: its stored rate, else the rate on its issue date.
+
+    Matches `RateTable.rate`, falling back to the inverse pair; invoices with no rate at all are
+    left unconverted.
+    """
+    base = settings.BASE_CURRENCY
+    direct = (
+        ExchangeRate.objects.filter(from_currency=OuterRef("currency"), to_currency=base, date__lte=OuterRef("issue_date"))
+        .order_by("-date")
+        .values("rate")[:1]
+    )
+    inverse = (
+        ExchangeRate.objects.filter(
+            from_currency=base, to_currency=OuterRef("currency"), date__lte=OuterRef("issue_date"), rate__gt=0
+        )
+        .order_by("-date")
+        .annotate(inverted=ExpressionWrapper(Value(Decimal("1")) / F("rate"), output_field=_RATE))
+        .values("inverted")[:1]
+    )
+    return Case(
+        When(currency=base, then=Value(Decimal("1"))),
+        default=Coalesce(F("fx_rate"), Subquery(direct), Subquery(inverse), Value(Decimal("1"))),
+        output_field=_RATE,
+    )
+
+
+def _base_amount(expression):
+    return ExpressionWrapper(expression * _booking_rate(), output_field=_AMOUNT)
+
+
+def _aging_bucket(days_past_due: int) -> str:
+    for label, _, low, high in AGING_BUCKETS:
+        if (low is None or days_past_due >= low) and (high is None or days_past_due <= high):
+            return label
+    return AGING_BUCKETS[-1][0]
+
+
 def accounts_receivable_aging(reference_date: date | None = None) -> Dict[str, Any]:
+    """Open receivables by days past due, in the base currency.
+
+    Counts the same invoices as the aging snapshots: issued by `reference_date` and neither
+    draft nor void.
+    """
     if reference_date is None:
         reference_date = date.today()
 
-    buckets_config = [
-        (0, 30, "0-30"),
-        (31, 60, "31-60"),
-        (61, 90, "61-90"),
-        (91, 10_000, "90+"),
-    ]
-
-    summary: Dict[str, Dict[str, Any]] = {
-        label: {"count": 0, "balance": Decimal("0")}
-        for _, _, label in buckets_config
-    }
-    summary["Current"] = {"count": 0, "balance": Decimal("0")}
-
+    summary: Dict[str, Dict[str, Any]] = {label: {"count": 0, "balance": Decimal("0")} for label, _, _, _ in AGING_BUCKETS}
     rows: List[Dict[str, Any]] = []
-
     invoices = (
-        Invoice.objects.select_related("customer")
-        .order_by("due_date")
+        _receivables()
+        .with_balances()
+        .filter(issue_date__lte=reference_date, open_balance__gt=0)
+        .annotate(open_base=_base_amount(F("open_balance")))
+        .select_related("customer")
+        .order_by("due_date", "pk")
     )
-
     for invoice in invoices:
-        balance = invoice.balance_due
-        if balance <= 0:
-            continue
+        balance = _to_decimal(invoice.open_base).quantize(CENT)
         days_past_due = (reference_date - invoice.due_date).days
-        if days_past_due < 0:
-            bucket = "Current"
-        else:
-            bucket = "90+"
-            for lower, upper, label in buckets_config:
-                if lower <= days_past_due <= upper:
-                    bucket = label
-                    break
-
-        summary.setdefault(bucket, {"count": 0, "balance": Decimal("0")})
+        bucket = _aging_bucket(days_past_due)
         summary[bucket]["count"] += 1
         summary[bucket]["balance"] += balance
-
         rows.append(
             {
                 "id": invoice.id,
                 "number": invoice.number,
                 "customer": invoice.customer.name,
+                "currency": invoice.currency,
                 "balance": str(balance),
                 "due_date": invoice.due_date.isoformat(),
                 "days_past_due": max(days_past_due, 0),
@@ -362,13 +495,370 @@ def accounts_receivable_aging(reference_date: date | None = None) -> Dict[str, A
             }
         )
 
-    formatted_summary = {
-        label: {"count": data["count"], "balance": str(data["balance"])}
-        for label, data in summary.items()
-    }
-
     return {
         "reference_date": reference_date.isoformat(),
-        "summary": formatted_summary,
+        "summary": {label: {"count": data["count"], "balance": str(data["balance"])} for label, data in summary.items()},
         "rows": rows,
     }
+
+
+def _aging_rows(as_of: date) -> list[AgingSnapshot]:
+    """Bucket every customer's open receivables as they stood at the end of `as_of` in one grouped query.
+
+    Balances are reconstructed from issue and payment dates, so any past day can be recomputed.
+    """
+    zero = Value(Decimal("0"), output_field=_AMOUNT)
+    line_totals = (
+        InvoiceLine.objects.filter(invoice=OuterRef("pk")).order_by().values("invoice").annotate(total=Sum("amount")).values("total")
+    )
+    paid_by_then = (
+        Payment.objects.filter(invoice=OuterRef("pk"), date__lte=as_of)
+        .order_by()
+        .values("invoice")
+        .annotate(total=Sum("amount"))
+        .values("total")
+    )
+    invoices = (
+        _receivables()
+        .filter(issue_date__lte=as_of)
+        .annotate(open_then=Coalesce(Subquery(line_totals), zero) - Coalesce(Subquery(paid_by_then), zero))
+        .filter(open_then__gt=0)
+        .annotate(open_base=_base_amount(F("open_then")))
+    )
+    buckets = {}
+    for _, field_name, low, high in AGING_BUCKETS:
+        window = Q()
+        if low is not None:
+            window &= Q(due_date__lte=as_of - timedelta(days=low))
+        if high is not None:
+            window &= Q(due_date__gte=as_of - timedelta(days=high))
+        buckets[field_name] = Coalesce(Sum(Case(When(window, then=F("open_base")), default=zero)), zero)
+    rows = invoices.order_by().values("customer_id").annotate(open_invoices=Count("pk"), **buckets)
+    return [AgingSnapshot(date=as_of, **row) for row in rows]
+
+
+def _invoiced_by_day(start: date, end: date) -> dict[tuple[date, int], Decimal]:
+    zero = Value(Decimal("0"), output_field=_AMOUNT)
+    totals = (
+        _receivables()
+        .filter(issue_date__range=(start, end))
+        .annotate(total=_base_amount(Coalesce(Sum("line_items__amount"), zero)))
+        .values_list("issue_date", "customer_id", "total")
+    )
+    invoiced: defaultdict[tuple[date, int], Decimal] = defaultdict(Decimal)
+    for issued, customer_id, total in totals:
+        invoiced[(issued, customer_id)] += _to_decimal(total).quantize(CENT)
+    return invoiced
+
+
+def _snapshot_days(bounds: tuple[date, date]) -> int:
+    """Replace the aging snapshots of every day in `bounds`; returns the rows written."""
+    start, end = bounds
+    invoiced = _invoiced_by_day(start, end)
+    written = 0
+    day = start
+    while day <= end:
+        rows = {row.customer_id: row for row in _aging_rows(day)}
+        for (issued, customer_id), amount in invoiced.items():
+            if issued == day:
+                rows.setdefault(customer_id, AgingSnapshot(date=day, customer_id=customer_id)).invoiced = amount
+        for row in rows.values():
+            for _, field_name, _, _ in AGING_BUCKETS:
+                setattr(row, field_name, _to_decimal(getattr(row, field_name)).quantize(CENT))
+        with transaction.atomic():
+            AgingSnapshot.objects.filter(date=day).delete()
+            AgingSnapshot.objects.bulk_create(rows.values(), batch_size=1000)
+        written += len(rows)
+        day += timedelta(days=1)
+    return written
+
+
+def snapshot_ar_aging(as_of: date) -> int:
+    return _snapshot_days((as_of, as_of))
+
+
+def backfill_ar_aging(start: date, end: date, workers: int = 1, chunk_days: int = 31) -> int:
+    """Rebuild the aging snapshots of every day from `start` to `end`, in day ranges spread over `workers` processes."""
+    ranges = []
+    cursor = start
+    while cursor <= end:
+        last = min(cursor + timedelta(days=chunk_days - 1), end)
+        ranges.append((cursor, last))
+        cursor = last + timedelta(days=1)
+    return sum(map_in_processes(_snapshot_days, ranges, workers))
+
+
+def _sample_dates(start: date, end: date, interval: str) -> list[date]:
+    """Snapshot days to report: every day, every seventh day ending at `end`, or month ends (and `end`)."""
+    if interval == "day":
+        days = (end - start).days
+        return [start + timedelta(days=offset) for offset in range(days + 1)]
+    if interval == "week":
+        dates = []
+        cursor = end
+        while cursor >= start:
+            dates.append(cursor)
+            cursor -= timedelta(days=7)
+        return dates[::-1]
+    dates = []
+    cursor = month_start(start)
+    while cursor <= end:
+        month_end = _add_months(cursor, 1) - timedelta(days=1)
+        if month_end >= start:
+            dates.append(min(month_end, end))
+        cursor = _add_months(cursor, 1)
+    return dates
+
+
+def _snapshots(customer_id: int | None):
+    queryset = AgingSnapshot.objects.all()
+    if customer_id is not None:
+        queryset = queryset.filter(customer_id=customer_id)
+    return queryset
+
+
+def aging_trend(start: date, end: date, interval: str = "month", customer_id: int | None = None) -> Dict[str, Any]:
+    dates = _sample_dates(start, end, interval)
+    sums = {field_name: Sum(field_name) for _, field_name, _, _ in AGING_BUCKETS}
+    rows = {
+        row["date"]: row
+        for row in _snapshots(customer_id)
+        .filter(date__in=dates)
+        .order_by()
+        .values("date")
+        .annotate(open_invoices=Sum("open_invoices"), **sums)
+    }
+    points = []
+    for day in dates:
+        row = rows.get(day, {})
+        amounts = {label: _to_decimal(row.get(field_name)).quantize(CENT) for label, field_name, _, _ in AGING_BUCKETS}
+        buckets = {label: str(amount) for label, amount in amounts.items()}
+        total = sum(amounts.values(), Decimal("0"))
+        points.append(
+            {
+                "date": day.isoformat(),
+                "buckets": buckets,
+                "total": str(total),
+                "open_invoices": row.get("open_invoices") or 0,
+                "has_snapshot": day in rows,
+            }
+        )
+    return {"start": start.isoformat(), "end": end.isoformat(), "interval": interval, "points": points}
+
+
+def days_sales_outstanding(
+    start: date, end: date, window: int = 90, interval: str = "month", customer_id: int | None = None
+) -> Dict[str, Any]:
+    """DSO per sample date: receivables on the day / sales invoiced in the preceding `window` days x `window`."""
+    dates = _sample_dates(start, end, interval)
+    fields = [field_name for _, field_name, _, _ in AGING_BUCKETS]
+    receivables = {
+        row["date"]: sum((_to_decimal(row[name]) for name in fields), Decimal("0")).quantize(CENT)
+        for row in _snapshots(customer_id)
+        .filter(date__in=dates)
+        .order_by()
+        .values("date")
+        .annotate(**{name: Sum(name) for name in fields})
+    }
+    daily_sales = dict(
+        _snapshots(customer_id)
+        .filter(date__range=(start - timedelta(days=window), end), invoiced__gt=0)
+        .order_by()
+        .values("date")
+        .annotate(total=Sum("invoiced"))
+        .values_list("date", "total")
+    )
+    # Running sales totals so each sample's window is one subtraction.
+    cumulative: dict[date, Decimal] = {}
+    running = Decimal("0")
+    day = start - timedelta(days=window)
+    while day <= end:
+        running += _to_decimal(daily_sales.get(day)).quantize(CENT)
+        cumulative[day] = running
+        day += timedelta(days=1)
+    points = []
+    for day in dates:
+        sales = cumulative[day] - cumulative[day - timedelta(days=window)]
+        outstanding = receivables.get(day)
+        dso = None
+        if outstanding is not None and sales > 0:
+            dso = (outstanding / sales * window).quantize(Decimal("0.1"))
+        points.append(
+            {
+                "date": day.isoformat(),
+                "receivables": str(outstanding) if outstanding is not None else None,
+                "sales": str(sales),
+                "dso": str(dso) if dso is not None else None,
+            }
+        )
+    return {"start": start.isoformat(), "end": end.isoformat(), "window": window, "interval": interval, "points": points}
+
+
+class ForecastError(Exception):
+    pass
+
+
+class ForecastMethod(models.TextChoices):
+    RUN_RATE = "run_rate", "Last closed month"
+    TRAILING_AVERAGE = "trailing_average", "Average of the trailing closed months"
+    BUDGET = "budget", "Budget"
+
+
+def default_actuals_through(start: date, end: date) -> date:
+    """End of the last locked month in the range, else the end of last month."""
+    locked = locked_months(start, end)
+    if locked:
+        return month_end(max(locked))
+    return min(month_start(timezone.localdate()) - timedelta(days=1), end)
+
+
+def _month_columns(months: List[date], rows: Iterable[Tuple[int, date, Decimal]], index: Dict[int, int]) -> List[List[Decimal]]:
+    """Account x month matrix from (account_id, month, amount) rows."""
+    column = {month: position for position, month in enumerate(months)}
+    matrix = [[Decimal("0")] * len(months) for _ in index]
+    for account_id, month, amount in rows:
+        if account_id in index and month in column:
+            matrix[index[account_id]][column[month]] += amount
+    return matrix
+
+
+def rolling_forecast(
+    start: date,
+    end: date,
+    actuals_through: date | None = None,
+    method: str = ForecastMethod.RUN_RATE,
+    window: int = 3,
+    account_methods: Dict[int, str] | None = None,
+    cadence: str = "monthly",
+) -> Dict[str, Any]:
+    """Income statement for `start`..`end` with actuals up to `actuals_through` and projections after it.
+
+    Each account is projected by its entry in `account_methods`, else by `method`: the last
+    closed month, the mean of the trailing `window` closed months, or its monthly budget.
+    Actuals come from one grouped aggregate and budgets from one query; projections are
+    computed a whole account column at a time.
+    """
+    if start.day != 1:
+        raise ForecastError("The forecast must start on the first day of a month.")
+    if actuals_through is None:
+        actuals_through = default_actuals_through(start, end)
+    # Only whole months count as actuals.
+    first_open = month_start(actuals_through + timedelta(days=1))
+    actuals_through = first_open - timedelta(days=1)
+    account_methods = account_methods or {}
+    chart = chart_of_accounts()
+    accounts = chart.of_type(Account.Type.REVENUE, Account.Type.EXPENSE)
+    index = {account.id: position for position, account in enumerate(accounts)}
+
+    months = [period.start for period in build_periods(start, end, "monthly")]
+    closed = [month for month in months if month_end(month) <= actuals_through]
+    trailing_months = [_add_months(first_open, -offset) for offset in range(window, 0, -1)]
+    history_months = sorted(set(trailing_months) | set(closed))
+
+    actual_rows = []
+    lines = (
+        JournalLine.objects.filter(
+            entry__status=JournalEntry.Status.POSTED,
+            entry__is_closing=False,
+            entry__date__gte=history_months[0],
+            entry__date__lte=actuals_through,
+            account_id__in=list(index),
+        )
+        .annotate(month=TruncMonth("entry__date"))
+        .values("account_id", "month")
+        .annotate(total_debit=Sum("debit"), total_credit=Sum("credit"))
+        .order_by()
+    )
+    for row in lines:
+        net = _to_decimal(row["total_debit"]) - _to_decimal(row["total_credit"])
+        if chart.by_id[row["account_id"]].type == Account.Type.REVENUE:
+            net = -net
+        actual_rows.append((row["account_id"], row["month"], net.quantize(CENT)))
+    actuals = _month_columns(history_months, actual_rows, index)
+
+    open_months = months[len(closed):]
+    budget_rows = []
+    if open_months:
+        budgets = Budget.objects.filter(
+            account_id__in=list(index), period_start__lte=month_end(open_months[-1]), period_end__gte=open_months[0]
+        ).values_list("account_id", "period_start", "period_end", "amount")
+        for account_id, period_start, period_end, amount in budgets:
+            spanned = [month_start(period_start)]
+            while month_end(spanned[-1]) < period_end:
+                spanned.append(_add_months(spanned[-1], 1))
+            budget_rows.extend(
+                (account_id, month, share)
+                for month, share in zip(spanned, spread_amount(amount, [Decimal("1")] * len(spanned)))
+            )
+    budget = _month_columns(open_months, budget_rows, index)
+
+    # Projection vectors, one value per account.
+    history_column = {month: position for position, month in enumerate(history_months)}
+    trailing = [history_column[month] for month in trailing_months]
+    run_rate = [row[trailing[-1]] for row in actuals]
+    average = [(sum((row[position] for position in trailing), Decimal("0")) / window).quantize(CENT) for row in actuals]
+    chosen = [account_methods.get(account.id, method) for account in accounts]
+
+    amounts: Dict[int, List[Decimal]] = {}
+    for position, account in enumerate(accounts):
+        row = [actuals[position][history_column[month]] for month in closed]
+        if chosen[position] == ForecastMethod.BUDGET:
+            row.extend(budget[position])
+        elif chosen[position] == ForecastMethod.TRAILING_AVERAGE:
+            row.extend([average[position]] * len(open_months))
+        else:
+            row.extend([run_rate[position]] * len(open_months))
+        amounts[account.id] = row
+
+    periods = build_periods(start, end, cadence)
+    if cadence != "monthly":
+        month_period = [_period_index(month, periods) for month in months]
+        amounts = {
+            account_id: [
+                sum((value for value, period in zip(row, month_period) if period == position), Decimal("0"))
+                for position in range(len(periods))
+            ]
+            for account_id, row in amounts.items()
+        }
+
+    payload = _income_statement_payload(periods, accounts, amounts)
+    for meta, period in zip(payload["period_meta"], periods):
+        if period.end <= actuals_through:
+            meta["kind"] = "actual"
+        elif period.start > actuals_through:
+            meta["kind"] = "forecast"
+        else:
+            meta["kind"] = "mixed"
+    payload["forecast"] = {
+        "actuals_through": actuals_through.isoformat(),
+        "method": method,
+        "window": window,
+        "account_methods": {str(account_id): value for account_id, value in sorted(account_methods.items())},
+    }
+    return payload
+
+
+def compare_forecasts(base: Dict[str, Any], other: Dict[str, Any]) -> Dict[str, Any]:
+    """Line-by-line differences (`other` minus `base`) between two forecast payloads over the same periods."""
+    if base["periods"] != other["periods"]:
+        raise ForecastError("Only forecasts over the same periods can be compared.")
+    width = len(base["periods"])
+    zeroes = ["0"] * width
+    base_rows = {row["path"]: row["amounts"] for row in base["flat"]}
+    other_rows = {row["path"]: row["amounts"] for row in other["flat"]}
+    paths = [row["path"] for row in base["flat"]] + [row["path"] for row in other["flat"] if row["path"] not in base_rows]
+    rows = []
+    for path in paths:
+        before = [Decimal(value) for value in base_rows.get(path, zeroes)]
+        after = [Decimal(value) for value in other_rows.get(path, zeroes)]
+        difference = [new - old for old, new in zip(before, after)]
+        rows.append(
+            {
+                "path": path,
+                "base": [str(value) for value in before],
+                "other": [str(value) for value in after],
+                "difference": [str(value) for value in difference],
+                "total_difference": str(sum(difference, Decimal("0"))),
+            }
+        )
+    return {"periods": base["periods"], "rows": rows}
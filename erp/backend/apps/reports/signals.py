@@ -0,0 +1,12 @@
+from __future__ import annotations
+
+from django.dispatch import receiver
+
+from apps.ledger.signals import period_unlocked
+
+from .models import ReportSnapshot
+
+
+@receiver(period_unlocked)
+def drop_unfrozen_snapshots(sender, period, **kwargs):
+    ReportSnapshot.objects.filter(period_start__lte=period.end, period_end__gte=period.start).delete()
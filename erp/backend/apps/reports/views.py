@@ -1,16 +1,34 @@
 from __future__ import annotations
 
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
+from apps.ledger.services import add_months
+
 from .serializers import (
+    AgingTrendQuerySerializer,
     BalanceSheetQuerySerializer,
     CashFlowQuerySerializer,
     DateRangeSerializer,
+    DSOQuerySerializer,
+    ForecastQuerySerializer,
     IncomeStatementQuerySerializer,
 )
-from .services import balance_sheet, cash_flow, income_statement, trial_balance, accounts_receivable_aging
+from .services import (
+    ForecastError,
+    accounts_receivable_aging,
+    aging_trend,
+    balance_sheet,
+    cash_flow,
+    days_sales_outstanding,
+    frozen_report,
+    income_statement,
+    rolling_forecast,
+    trial_balance,
+)
 
 
 class TrialBalanceView(APIView):
@@ -23,7 +41,16 @@ class TrialBalanceView(APIView):
         end = serializer.validated_data.get("end_date")
         account_ids = request.query_params.getlist("account")
         account_ids = [int(value) for value in account_ids if value.isdigit()]
-        data = trial_balance(start, end, account_ids or None)
+        if end:
+            data = frozen_report(
+                "trial_balance",
+                {"start": start, "end": end, "accounts": sorted(account_ids)},
+                start,
+                end,
+                lambda: trial_balance(start, end, account_ids or None),
+            )
+        else:
+            data = trial_balance(start, end, account_ids or None)
         return Response(data)
 
 
@@ -33,10 +60,15 @@ class IncomeStatementView(APIView):
     def get(self, request):
         serializer = IncomeStatementQuerySerializer(data=request.query_params)
         serializer.is_valid(raise_exception=True)
-        data = income_statement(
-            serializer.validated_data["start_date"],
-            serializer.validated_data["end_date"],
-            serializer.validated_data["cadence"],
+        start = serializer.validated_data["start_date"]
+        end = serializer.validated_data["end_date"]
+        cadence = serializer.validated_data["cadence"]
+        data = frozen_report(
+            "income_statement",
+            {"start": start, "end": end, "cadence": cadence},
+            start,
+            end,
+            lambda: income_statement(start, end, cadence),
         )
         return Response(data)
 
@@ -47,7 +79,8 @@ class BalanceSheetView(APIView):
     def get(self, request):
         serializer = BalanceSheetQuerySerializer(data=request.query_params)
         serializer.is_valid(raise_exception=True)
-        data = balance_sheet(serializer.validated_data["as_of"])
+        as_of = serializer.validated_data["as_of"]
+        data = frozen_report("balance_sheet", {"as_of": as_of}, None, as_of, lambda: balance_sheet(as_of))
         return Response(data)
 
 
@@ -57,10 +90,9 @@ class CashFlowView(APIView):
     def get(self, request):
         serializer = CashFlowQuerySerializer(data=request.query_params)
         serializer.is_valid(raise_exception=True)
-        data = cash_flow(
-            serializer.validated_data["start_date"],
-            serializer.validated_data["end_date"],
-        )
+        start = serializer.validated_data["start_date"]
+        end = serializer.validated_data["end_date"]
+        data = frozen_report("cash_flow", {"start": start, "end": end}, start, end, lambda: cash_flow(start, end))
         return Response(data)
 
 
@@ -70,3 +102,64 @@ class AccountsReceivableAgingView(APIView):
     def get(self, request):
         data = accounts_receivable_aging()
         return Response(data)
+
+
+def _trend_range(data) -> tuple:
+    end = data.get("end_date") or timezone.localdate()
+    start = data.get("start_date") or add_months(end, -24)
+    return start, end
+
+
+class AccountsReceivableAgingTrendView(APIView):
+    """Aging bucket totals over time, read from the nightly snapshots."""
+
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        serializer = AgingTrendQuerySerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        start, end = _trend_range(data)
+        return Response(aging_trend(start, end, data["interval"], data.get("customer")))
+
+
+class DaysSalesOutstandingView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        serializer = DSOQuerySerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        start, end = _trend_range(data)
+        return Response(days_sales_outstanding(start, end, data["window"], data["interval"], data.get("customer")))
+
+
+def forecast_params(query_params) -> dict:
+    """Query parameters with repeated `account_method=<account id>:<method>` folded into `account_methods`."""
+    params = {key: value for key, value in query_params.items() if key != "account_method"}
+    overrides = [value.split(":", 1) for value in query_params.getlist("account_method")]
+    if overrides:
+        params["account_methods"] = {parts[0]: parts[-1] for parts in overrides}
+    return params
+
+
+class ForecastView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        serializer = ForecastQuerySerializer(data=forecast_params(request.query_params))
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        try:
+            payload = rolling_forecast(
+                data["start_date"],
+                data["end_date"],
+                data.get("actuals_through"),
+                data["method"],
+                data["window"],
+                data.get("account_methods"),
+                data["cadence"],
+            )
+        except ForecastError as exc:
+            raise ValidationError(str(exc))
+        return Response(payload)
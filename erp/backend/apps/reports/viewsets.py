@@ -0,0 +1,85 @@
+from __future__ import annotations
+
+from rest_framework import mixins, status, viewsets
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+
+from apps.accounts.permissions import IsAdminOrAccountant
+
+from .models import ForecastVersion
+from .serializers import (
+    ForecastCompareSerializer,
+    ForecastVersionCreateSerializer,
+    ForecastVersionDetailSerializer,
+    ForecastVersionSerializer,
+)
+from .services import ForecastError, compare_forecasts, rolling_forecast
+
+
+class ForecastVersionViewSet(
+    mixins.ListModelMixin,
+    mixins.RetrieveModelMixin,
+    mixins.DestroyModelMixin,
+    viewsets.GenericViewSet,
+):
+    queryset = ForecastVersion.objects.all()
+    permission_classes = [IsAuthenticated, IsAdminOrAccountant]
+    filterset_fields = ["start", "end", "method"]
+    ordering_fields = ["created_at", "name"]
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action == "list":
+            queryset = queryset.defer("payload")
+        return queryset
+
+    def get_serializer_class(self):
+        if self.action == "retrieve":
+            return ForecastVersionDetailSerializer
+        return ForecastVersionSerializer
+
+    def create(self, request):
+        """Compute a forecast with the `reports/forecast` parameters and store it under `name`."""
+        serializer = ForecastVersionCreateSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        try:
+            payload = rolling_forecast(
+                data["start_date"],
+                data["end_date"],
+                data.get("actuals_through"),
+                data["method"],
+                data["window"],
+                data.get("account_methods"),
+                data["cadence"],
+            )
+        except ForecastError as exc:
+            raise ValidationError(str(exc))
+        version = ForecastVersion.objects.create(
+            name=data["name"],
+            start=data["start_date"],
+            end=data["end_date"],
+            actuals_through=payload["forecast"]["actuals_through"],
+            cadence=data["cadence"],
+            method=data["method"],
+            window=data["window"],
+            account_methods=payload["forecast"]["account_methods"],
+            payload=payload,
+            created_by=request.user,
+        )
+        return Response(ForecastVersionDetailSerializer(version).data, status=status.HTTP_201_CREATED)
+
+    @action(detail=False, methods=["get"])
+    def compare(self, request):
+        """Differences per income statement line between versions `base` and `other`."""
+        serializer = ForecastCompareSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        base = serializer.validated_data["base"]
+        other = serializer.validated_data["other"]
+        try:
+            comparison = compare_forecasts(base.payload, other.payload)
+        except ForecastError as exc:
+            raise ValidationError(str(exc))
+        return Response({"base": base.pk, "other": other.pk, **comparison})
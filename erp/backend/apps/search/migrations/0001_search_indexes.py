@@ -0,0 +1,100 @@
+from django.db import migrations
+
+# PostgreSQL: trigram indexes on UPPER(column) serve both the search endpoint and the
+# `icontains` lookups of the list endpoints' `search` parameter; memos also get a full-text index.
+POSTGRES_FORWARDS = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS search_customer_name_trgm ON invoicing_customer USING gin (UPPER(name) gin_trgm_ops)",
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS search_customer_email_trgm ON invoicing_customer USING gin (UPPER(email) gin_trgm_ops)",
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS search_invoice_number_trgm ON invoicing_invoice USING gin (UPPER(number) gin_trgm_ops)",
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS search_journalentry_memo_trgm ON ledger_journalentry USING gin (UPPER(memo) gin_trgm_ops)",
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS search_journalentry_memo_fts ON ledger_journalentry USING gin (to_tsvector('simple', memo))",
+]
+POSTGRES_BACKWARDS = [
+    "DROP INDEX CONCURRENTLY IF EXISTS search_customer_name_trgm",
+    "DROP INDEX CONCURRENTLY IF EXISTS search_customer_email_trgm",
+    "DROP INDEX CONCURRENTLY IF EXISTS search_invoice_number_trgm",
+    "DROP INDEX CONCURRENTLY IF EXISTS search_journalentry_memo_trgm",
+    "DROP INDEX CONCURRENTLY IF EXISTS search_journalentry_memo_fts",
+]
+
+# SQLite: one FTS5 trigram table kept in step by triggers. The rowid encodes the source row as
+# id * 4 + kind (1 customer, 2 invoice, 3 journal entry) so triggers update it by key.
+SQLITE_FORWARDS = [
+    "CREATE VIRTUAL TABLE search_document USING fts5(title, subtitle, keywords, tokenize='trigram')",
+    """CREATE TRIGGER search_customer_ai AFTER INSERT ON invoicing_customer BEGIN
+        INSERT INTO search_document(rowid, title, subtitle, keywords) VALUES (new.id * 4 + 1, new.name, new.email, '');
+    END""",
+    """CREATE TRIGGER search_customer_au AFTER UPDATE OF name, email ON invoicing_customer BEGIN
+        UPDATE search_document SET title = new.name, subtitle = new.email WHERE rowid = new.id * 4 + 1;
+        UPDATE search_document SET subtitle = new.name, keywords = new.email
+            WHERE rowid IN (SELECT id * 4 + 2 FROM invoicing_invoice WHERE customer_id = new.id);
+    END""",
+    """CREATE TRIGGER search_customer_ad AFTER DELETE ON invoicing_customer BEGIN
+        DELETE FROM search_document WHERE rowid = old.id * 4 + 1;
+    END""",
+    """CREATE TRIGGER search_invoice_ai AFTER INSERT ON invoicing_invoice BEGIN
+        INSERT INTO search_document(rowid, title, subtitle, keywords)
+            SELECT new.id * 4 + 2, new.number, name, email FROM invoicing_customer WHERE id = new.customer_id;
+    END""",
+    """CREATE TRIGGER search_invoice_au AFTER UPDATE OF number, customer_id ON invoicing_invoice BEGIN
+        UPDATE search_document SET title = new.number,
+            subtitle = (SELECT name FROM invoicing_customer WHERE id = new.customer_id),
+            keywords = (SELECT email FROM invoicing_customer WHERE id = new.customer_id)
+            WHERE rowid = new.id * 4 + 2;
+    END""",
+    """CREATE TRIGGER search_invoice_ad AFTER DELETE ON invoicing_invoice BEGIN
+        DELETE FROM search_document WHERE rowid = old.id * 4 + 2;
+    END""",
+    """CREATE TRIGGER search_journalentry_ai AFTER INSERT ON ledger_journalentry BEGIN
+        INSERT INTO search_document(rowid, title, subtitle, keywords) VALUES (new.id * 4 + 3, new.memo, new.date, '');
+    END""",
+    """CREATE TRIGGER search_journalentry_au AFTER UPDATE OF memo, date ON ledger_journalentry BEGIN
+        UPDATE search_document SET title = new.memo, subtitle = new.date WHERE rowid = new.id * 4 + 3;
+    END""",
+    """CREATE TRIGGER search_journalentry_ad AFTER DELETE ON ledger_journalentry BEGIN
+        DELETE FROM search_document WHERE rowid = old.id * 4 + 3;
+    END""",
+    "INSERT INTO search_document(rowid, title, subtitle, keywords) SELECT id * 4 + 1, name, email, '' FROM invoicing_customer",
+    """INSERT INTO search_document(rowid, title, subtitle, keywords)
+        SELECT i.id * 4 + 2, i.number, c.name, c.email FROM invoicing_invoice i JOIN invoicing_customer c ON c.id = i.customer_id""",
+    "INSERT INTO search_document(rowid, title, subtitle, keywords) SELECT id * 4 + 3, memo, date, '' FROM ledger_journalentry",
+]
+SQLITE_BACKWARDS = [
+    *[
+        f"DROP TRIGGER IF EXISTS search_{table}_{event}"
+        for table in ("customer", "invoice", "journalentry")
+        for event in ("ai", "au", "ad")
+    ],
+    "DROP TABLE IF EXISTS search_document",
+]
+
+STATEMENTS = {
+    "postgresql": (POSTGRES_FORWARDS, POSTGRES_BACKWARDS),
+    "sqlite": (SQLITE_FORWARDS, SQLITE_BACKWARDS),
+}
+
+
+def _run(direction: int):
+    def run(apps, schema_editor):
+        statements = STATEMENTS.get(schema_editor.connection.vendor)
+        if statements is None:
+            return  # other databases fall back to unindexed lookups
+        for sql in statements[direction]:
+            schema_editor.execute(sql)
+
+    return run
+
+
+class Migration(migrations.Migration):
+    # Index builds run CONCURRENTLY on PostgreSQL so large tables stay writable meanwhile.
+    atomic = False
+
+    dependencies = [
+        ("invoicing", "0008_dunning"),
+        ("ledger", "0008_multi_currency"),
+    ]
+
+    operations = [
+        migrations.RunPython(_run(0), _run(1)),
+    ]
@@ -0,0 +1,20 @@
+from __future__ import annotations
+
+from rest_framework import serializers
+
+from .services import MIN_QUERY_LENGTH, SEARCH_TYPES
+
+
+class SearchQuerySerializer(serializers.Serializer):
+    q = serializers.CharField(min_length=MIN_QUERY_LENGTH, max_length=100)
+    types = serializers.MultipleChoiceField(choices=SEARCH_TYPES, required=False)
+    page = serializers.IntegerField(min_value=1, default=1)
+    page_size = serializers.IntegerField(min_value=1, max_value=100, default=20)
+
+
+class SearchHitSerializer(serializers.Serializer):
+    type = serializers.CharField()
+    id = serializers.IntegerField()
+    title = serializers.CharField()
+    subtitle = serializers.CharField()
+    rank = serializers.FloatField()
@@ -0,0 +1,141 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+
+from django.db import connection
+from django.db.models import Q
+
+from apps.invoicing.models import Customer, Invoice
+from apps.ledger.models import JournalEntry
+
+SEARCH_TYPES = ("customer", "invoice", "journal_entry")
+
+# Row id offsets of the SQLite `search_document` table; see the 0001 migration.
+_SQLITE_KINDS = {"customer": 1, "invoice": 2, "journal_entry": 3}
+_SQLITE_TYPES = {code: kind for kind, code in _SQLITE_KINDS.items()}
+# Trigram indexes cannot narrow down shorter queries.
+MIN_QUERY_LENGTH = 3
+
+
+@dataclass
+class SearchHit:
+    type: str
+    id: int
+    title: str
+    subtitle: str
+    rank: float
+
+
+def _like_pattern(query: str) -> str:
+    escaped = query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+
+_POSTGRES_PARTS = {
+    "customer": (
+        """SELECT 'customer' AS type, c.id, c.name AS title, c.email AS subtitle,
+                  GREATEST(similarity(c.name, %(q)s), similarity(c.email, %(q)s)) AS rank
+           FROM invoicing_customer c
+           WHERE UPPER(c.name) LIKE UPPER(%(like)s) OR UPPER(c.email) LIKE UPPER(%(like)s)"""
+    ),
+    # Invoices match on their number or their customer; customer matches rank lower. The two
+    # arms are separate so each can use its trigram index: number matches directly, customer
+    # matches by finding the customers first and then their invoices through the foreign key.
+    "invoice": (
+        """SELECT 'invoice' AS type, i.id, i.number AS title, c.name AS subtitle,
+                  GREATEST(similarity(i.number, %(q)s), similarity(c.name, %(q)s) / 2) AS rank
+           FROM invoicing_invoice i JOIN invoicing_customer c ON c.id = i.customer_id
+           WHERE UPPER(i.number) LIKE UPPER(%(like)s)
+           UNION ALL
+           SELECT 'invoice' AS type, i.id, i.number AS title, c.name AS subtitle,
+                  GREATEST(similarity(i.number, %(q)s), similarity(c.name, %(q)s) / 2) AS rank
+           FROM invoicing_customer c JOIN invoicing_invoice i ON i.customer_id = c.id
+           WHERE (UPPER(c.name) LIKE UPPER(%(like)s) OR UPPER(c.email) LIKE UPPER(%(like)s))
+             AND UPPER(i.number) NOT LIKE UPPER(%(like)s)"""
+    ),
+    "journal_entry": (
+        """SELECT 'journal_entry' AS type, e.id, e.memo AS title, e.date::text AS subtitle,
+                  GREATEST(
+                      ts_rank(to_tsvector('simple', e.memo), websearch_to_tsquery('simple', %(q)s)),
+                      word_similarity(%(q)s, e.memo)
+                  ) AS rank
+           FROM ledger_journalentry e
+           WHERE to_tsvector('simple', e.memo) @@ websearch_to_tsquery('simple', %(q)s)
+              OR UPPER(e.memo) LIKE UPPER(%(like)s)"""
+    ),
+}
+
+
+def _search_postgres(query: str, types: list[str], limit: int, offset: int) -> list[tuple]:
+    sql = " UNION ALL ".join(f"({_POSTGRES_PARTS[kind]})" for kind in types)
+    params = {"q": query, "like": _like_pattern(query), "limit": limit, "offset": offset}
+    with connection.cursor() as cursor:
+        cursor.execute(f"{sql} ORDER BY rank DESC, type, id LIMIT %(limit)s OFFSET %(offset)s", params)
+        return cursor.fetchall()
+
+
+def _search_sqlite(query: str, types: list[str], limit: int, offset: int) -> list[tuple]:
+    codes = ", ".join(str(_SQLITE_KINDS[kind]) for kind in types)
+    phrase = '"' + query.replace('"', '""') + '"'
+    sql = (
+        # bm25 is lower for better matches; title hits weigh most.
+        "SELECT rowid %% 4, rowid / 4, title, subtitle, -bm25(search_document, 10.0, 2.0, 1.0) AS rank "
+        f"FROM search_document WHERE search_document MATCH %s AND rowid %% 4 IN ({codes}) "
+        "ORDER BY rank DESC, rowid LIMIT %s OFFSET %s"
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [phrase, limit, offset])
+        return [(_SQLITE_TYPES[code], pk, title, subtitle, rank) for code, pk, title, subtitle, rank in cursor.fetchall()]
+
+
+def _search_generic(query: str, types: list[str], limit: int, offset: int) -> list[tuple]:
+    # Unindexed fallback for databases without a search migration: exact matches rank first.
+    sources = {
+        "customer": (
+            Customer.objects.filter(Q(name__icontains=query) | Q(email__icontains=query)).order_by("name", "pk"),
+            lambda row: (row.name, row.email, row.name.lower() == query.lower() or row.email.lower() == query.lower()),
+        ),
+        "invoice": (
+            Invoice.objects.filter(
+                Q(number__icontains=query) | Q(customer__name__icontains=query) | Q(customer__email__icontains=query)
+            )
+            .select_related("customer")
+            .order_by("number", "pk"),
+            lambda row: (row.number, row.customer.name, row.number.lower() == query.lower()),
+        ),
+        "journal_entry": (
+            JournalEntry.objects.filter(memo__icontains=query).order_by("-date", "pk"),
+            lambda row: (row.memo, row.date.isoformat(), row.memo.lower() == query.lower()),
+        ),
+    }
+    hits = []
+    for kind in types:
+        queryset, describe = sources[kind]
+        for row in queryset[: offset + limit]:
+            title, subtitle, exact = describe(row)
+            hits.append((kind, row.pk, title, subtitle, 1.0 if exact else 0.5))
+    hits.sort(key=lambda hit: (-hit[4], hit[0], hit[1]))
+    return hits[offset : offset + limit]
+
+
+_BACKENDS = {
+    "postgresql": _search_postgres,
+    "sqlite": _search_sqlite,
+}
+
+
+def search(query: str, types: list[str] | None = None, limit: int = 20, offset: int = 0) -> list[SearchHit]:
+    """Rank customers, invoices and journal entries matching `query`, best match first.
+
+    PostgreSQL and SQLite use the indexes created by this app's migration; other databases
+    fall back to unindexed `icontains` lookups.
+    """
+    types = [kind for kind in SEARCH_TYPES if kind in (types or SEARCH_TYPES)]
+    query = query.strip()
+    if len(query) < MIN_QUERY_LENGTH or not types:
+        return []
+    backend = _BACKENDS.get(connection.vendor, _search_generic)
+    return [
+        SearchHit(kind, pk, title, subtitle or "", round(float(rank), 4))
+        for kind, pk, title, subtitle, rank in backend(query, types, limit, offset)
+    ]
@@ -0,0 +1,32 @@
+from __future__ import annotations
+
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from apps.accounts.permissions import IsAdminOrAccountant
+
+from .serializers import SearchHitSerializer, SearchQuerySerializer
+from .services import search
+
+
+class SearchView(APIView):
+    permission_classes = [IsAuthenticated, IsAdminOrAccountant]
+
+    def get(self, request):
+        params = {key: value for key, value in request.query_params.items() if key != "types"}
+        types = [kind for value in request.query_params.getlist("types") for kind in value.split(",") if kind]
+        if types:
+            params["types"] = types
+        serializer = SearchQuerySerializer(data=params)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        page, page_size = data["page"], data["page_size"]
+        hits = search(data["q"], sorted(data.get("types") or []), limit=page_size + 1, offset=(page - 1) * page_size)
+        return Response(
+            {
+                "results": SearchHitSerializer(hits[:page_size], many=True).data,
+                "page": page,
+                "has_more": len(hits) > page_size,
+            }
+        )
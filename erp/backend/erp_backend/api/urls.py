@@ -2,16 +2,43 @@ from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
 from apps.accounts.viewsets import AuthViewSet, RoleViewSet, UserViewSet
-from apps.ledger.viewsets import AccountViewSet, JournalEntryViewSet
+from apps.ledger.viewsets import (
+    AccountViewSet,
+    AllocationRuleViewSet,
+    ExchangeRateViewSet,
+    FiscalPeriodViewSet,
+    FiscalYearCloseViewSet,
+    JournalEntryViewSet,
+    RecurringEntryTemplateViewSet,
+)
 from apps.budgets.viewsets import BudgetViewSet
 from apps.approvals.viewsets import ApprovalViewSet, CloseChecklistItemViewSet
-from apps.invoicing.viewsets import CustomerViewSet, InvoiceViewSet, PaymentViewSet
+from apps.core.views import ChangeFeedView, LockMetricsView
+from apps.invoicing.viewsets import (
+    BankStatementLineViewSet,
+    BankStatementViewSet,
+    BillingRunViewSet,
+    CustomerViewSet,
+    DunningLevelViewSet,
+    DunningNoticeViewSet,
+    DunningRunViewSet,
+    FxRevaluationViewSet,
+    InvoiceViewSet,
+    PaymentViewSet,
+    PostingBatchViewSet,
+    PostingRuleViewSet,
+)
+from apps.reports.viewsets import ForecastVersionViewSet
+from apps.search.views import SearchView
 from apps.reports.views import (
     BalanceSheetView,
     CashFlowView,
     IncomeStatementView,
     TrialBalanceView,
     AccountsReceivableAgingView,
+    AccountsReceivableAgingTrendView,
+    DaysSalesOutstandingView,
+    ForecastView,
 )
 
 router = DefaultRouter()
@@ -19,21 +46,42 @@ router.register(r"roles", RoleViewSet, basename="role")
 router.register(r"users", UserViewSet, basename="user")
 router.register(r"accounts", AccountViewSet, basename="account")
 router.register(r"journal-entries", JournalEntryViewSet, basename="journalentry")
+router.register(r"recurring-entries", RecurringEntryTemplateViewSet, basename="recurringentry")
+router.register(r"allocation-rules", AllocationRuleViewSet, basename="allocationrule")
+router.register(r"fiscal-years", FiscalYearCloseViewSet, basename="fiscalyear")
+router.register(r"fiscal-periods", FiscalPeriodViewSet, basename="fiscalperiod")
+router.register(r"exchange-rates", ExchangeRateViewSet, basename="exchangerate")
 router.register(r"budgets", BudgetViewSet, basename="budget")
 router.register(r"approvals", ApprovalViewSet, basename="approval")
 router.register(r"close-checklist", CloseChecklistItemViewSet, basename="closechecklist")
 router.register(r"customers", CustomerViewSet, basename="customer")
 router.register(r"invoices", InvoiceViewSet, basename="invoice")
 router.register(r"payments", PaymentViewSet, basename="payment")
+router.register(r"fx-revaluations", FxRevaluationViewSet, basename="fxrevaluation")
+router.register(r"billing-runs", BillingRunViewSet, basename="billingrun")
+router.register(r"bank-statements", BankStatementViewSet, basename="bankstatement")
+router.register(r"bank-statement-lines", BankStatementLineViewSet, basename="bankstatementline")
+router.register(r"posting-rules", PostingRuleViewSet, basename="postingrule")
+router.register(r"posting-batches", PostingBatchViewSet, basename="postingbatch")
+router.register(r"dunning-levels", DunningLevelViewSet, basename="dunninglevel")
+router.register(r"dunning-runs", DunningRunViewSet, basename="dunningrun")
+router.register(r"dunning-notices", DunningNoticeViewSet, basename="dunningnotice")
+router.register(r"forecast-versions", ForecastVersionViewSet, basename="forecastversion")
 
 urlpatterns = [
     path("", include(router.urls)),
     path("auth/login/", AuthViewSet.as_view({"post": "login"}), name="auth-login"),
     path("auth/logout/", AuthViewSet.as_view({"post": "logout"}), name="auth-logout"),
     path("me/", AuthViewSet.as_view({"get": "current_user"}), name="auth-me"),
+    path("changes/", ChangeFeedView.as_view(), name="changes"),
+    path("metrics/locks/", LockMetricsView.as_view(), name="metrics-locks"),
+    path("search/", SearchView.as_view(), name="search"),
     path("reports/trial-balance/", TrialBalanceView.as_view(), name="reports-trial-balance"),
     path("reports/income-statement/", IncomeStatementView.as_view(), name="reports-income-statement"),
     path("reports/balance-sheet/", BalanceSheetView.as_view(), name="reports-balance-sheet"),
     path("reports/cash-flow/", CashFlowView.as_view(), name="reports-cash-flow"),
     path("reports/ar-aging/", AccountsReceivableAgingView.as_view(), name="reports-ar-aging"),
+    path("reports/ar-aging/trend/", AccountsReceivableAgingTrendView.as_view(), name="reports-ar-aging-trend"),
+    path("reports/dso/", DaysSalesOutstandingView.as_view(), name="reports-dso"),
+    path("reports/forecast/", ForecastView.as_view(), name="reports-forecast"),
 ]
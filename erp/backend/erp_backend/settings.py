@@ -3,6 +3,7 @@ from __future__ import annotations
 
 import os
 from datetime import timedelta
+from decimal import Decimal
 from pathlib import Path
 
 import dj_database_url
@@ -32,12 +33,14 @@ INSTALLED_APPS = [
     "rest_framework.authtoken",
     "corsheaders",
     "django_filters",
+    "apps.core",
     "apps.accounts",
     "apps.ledger",
     "apps.reports",
     "apps.budgets",
     "apps.approvals",
     "apps.invoicing",
+    "apps.search",
 ]
 
 MIDDLEWARE = [
@@ -79,6 +82,11 @@ DATABASES = {
         env="DATABASE_URL",
     )
 }
+# Invoice number blocks are reserved on a connection of their own, so a reservation commits at
+# once instead of holding the sequence row locked until the requesting transaction ends.
+# SQLite allows one writer at a time, so there it shares the request's connection.
+if DATABASES["default"]["ENGINE"] != "django.db.backends.sqlite3":
+    DATABASES["sequences"] = {**DATABASES["default"], "TEST": {"MIRROR": "default"}}
 
 AUTH_PASSWORD_VALIDATORS = [
     {"NAME": "django.contrib.auth.password_validation.UserAttributeSimilarityValidator"},
@@ -101,7 +109,7 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": [
-        "rest_framework.authentication.TokenAuthentication",
+        "apps.accounts.authentication.CachedTokenAuthentication",
     ],
     "DEFAULT_PERMISSION_CLASSES": [
         "rest_framework.permissions.IsAuthenticated",
@@ -124,3 +132,59 @@ CSRF_TRUSTED_ORIGINS = _split_env("CSRF_TRUSTED_ORIGINS")
 CORS_ALLOW_CREDENTIALS = True
 
 SESSION_COOKIE_AGE = int(timedelta(days=7).total_seconds())
+
+CACHES = {
+    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+}
+if os.getenv("AUTH_TOKEN_CACHE_LOCATION"):
+    # Shared by every worker process on the host.
+    CACHES["auth_tokens"] = {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": os.getenv("AUTH_TOKEN_CACHE_LOCATION"),
+    }
+
+# Tokens older than this are rejected and replaced on the next login; 0 disables expiry.
+AUTH_TOKEN_TTL = timedelta(hours=int(os.getenv("AUTH_TOKEN_TTL_HOURS", 24 * 7))) or None
+AUTH_TOKEN_CACHE_SIZE = int(os.getenv("AUTH_TOKEN_CACHE_SIZE", 10_000))
+# Bounds how long another process may keep serving a token revoked elsewhere.
+AUTH_TOKEN_CACHE_TIMEOUT = int(os.getenv("AUTH_TOKEN_CACHE_TIMEOUT", 60))
+AUTH_TOKEN_SHARED_CACHE = "auth_tokens" if "auth_tokens" in CACHES else None
+
+# How long a create request's Idempotency-Key can be replayed before it is pruned.
+IDEMPOTENCY_KEY_TTL = timedelta(hours=int(os.getenv("IDEMPOTENCY_KEY_TTL_HOURS", 24)))
+
+# Equity account that year-end closes roll revenue and expense balances into.
+RETAINED_EARNINGS_ACCOUNT_CODE = os.getenv("RETAINED_EARNINGS_ACCOUNT_CODE", "3000")
+
+# Maximum age in seconds of the in-process chart of accounts; saves and deletes refresh it immediately.
+LEDGER_CHART_CACHE_TIMEOUT = int(os.getenv("LEDGER_CHART_CACHE_TIMEOUT", 300))
+# An unknown account id reloads the chart only if it is older than this many seconds.
+LEDGER_CHART_MISS_RELOAD_INTERVAL = float(os.getenv("LEDGER_CHART_MISS_RELOAD_SECONDS", 1))
+
+# Transactions that hit a deadlock or serialization failure are retried this many times in total.
+LOCK_RETRY_ATTEMPTS = int(os.getenv("LOCK_RETRY_ATTEMPTS", 3))
+LOCK_RETRY_BACKOFF = float(os.getenv("LOCK_RETRY_BACKOFF_SECONDS", 0.05))
+# Row-lock acquisitions slower than this are logged as warnings.
+LOCK_WAIT_WARNING_MS = int(os.getenv("LOCK_WAIT_WARNING_MS", 250))
+
+# Ledger amounts (journal line debits/credits) are kept in this currency.
+BASE_CURRENCY = os.getenv("BASE_CURRENCY", "USD")
+# Maximum age in seconds of the in-process exchange rate table; rate saves refresh it immediately.
+FX_RATE_CACHE_TIMEOUT = int(os.getenv("FX_RATE_CACHE_TIMEOUT", 300))
+RECEIVABLES_ACCOUNT_CODE = os.getenv("RECEIVABLES_ACCOUNT_CODE", "1100")
+# Account that unrealized gains and losses from receivable revaluation are posted to.
+FX_GAIN_LOSS_ACCOUNT_CODE = os.getenv("FX_GAIN_LOSS_ACCOUNT_CODE", "4900")
+
+# Server-assigned invoice numbers look like INV-2026-000042, counted per prefix and issue year.
+INVOICE_NUMBER_PREFIX = os.getenv("INVOICE_NUMBER_PREFIX", "INV")
+# Numbers each process reserves from the sequence row at a time; unused numbers leave gaps on restart.
+INVOICE_NUMBER_BLOCK_SIZE = int(os.getenv("INVOICE_NUMBER_BLOCK_SIZE", 50))
+
+# Bank statement matches at or above this confidence become payments when an import asks for auto-confirmation.
+BANK_MATCH_AUTO_CONFIRM = Decimal(os.getenv("BANK_MATCH_AUTO_CONFIRM", "0.90"))
+# Similarity (0-1) a statement reference or payer name needs to fuzzily match an invoice number or customer.
+BANK_MATCH_FUZZY_CUTOFF = float(os.getenv("BANK_MATCH_FUZZY_CUTOFF", 0.85))
+
+# What posting a manual journal entry that takes an expense account over its budget does:
+# "off" skips the check, "warn" posts and lists the overruns in the response, "block" rejects it.
+BUDGET_CONTROL = os.getenv("BUDGET_CONTROL", "warn").lower()